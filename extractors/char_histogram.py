@@ -0,0 +1,171 @@
+import argparse
+import json
+import logging
+import unicodedata
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from normalize import valid_chars, replacement_dict
+
+logger = logging.getLogger(__name__)
+
+MAX_CODE_POINT = 0x110000
+CHUNK_SIZE = 1 << 22
+
+valid_mask = np.zeros(MAX_CODE_POINT, dtype=bool)
+valid_mask[[ord(c) for c in valid_chars]] = True
+
+
+class CharHistogram:
+    """
+    Code point counts of a corpus, with a bounded uniform sample of the contexts of every invalid character.
+
+    Args:
+        reservoir_size (int): The maximum number of examples kept per character.
+        context (int): The number of characters kept on each side of an example.
+        seed (int): The seed of the reservoir sampling.
+    """
+
+    def __init__(self, reservoir_size=10, context=10, seed=0):
+        self.reservoir_size = reservoir_size
+        self.context = context
+        self.rng = np.random.default_rng(seed)
+        self.counts = Counter()
+        self.examples = {}
+
+    def add_text(self, text, source):
+        """Counts the characters of `text` and samples the contexts of its invalid characters."""
+        codes = np.frombuffer(text.encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+        if len(codes) == 0:
+            return
+        bincount = np.bincount(codes)
+        present = np.flatnonzero(bincount)
+
+        positions = np.flatnonzero(~valid_mask[codes])
+        order = np.argsort(codes[positions], kind='stable')
+        positions = positions[order]
+        boundaries = np.flatnonzero(np.diff(codes[positions])) + 1
+        for char_positions in np.split(positions, boundaries) if len(positions) else []:
+            self.sample(chr(codes[char_positions[0]]), char_positions, text, source)
+
+        self.counts.update({chr(code): int(bincount[code]) for code in present})
+
+    def sample(self, char, char_positions, text, source):
+        """Reservoir sampling over the occurrences of `char`, vectorized per chunk."""
+        seen = self.counts[char]
+        reservoir = self.examples.setdefault(char, [])
+        example = lambda i: (text[max(0, i - self.context):i + self.context], source)
+
+        fill = min(max(self.reservoir_size - len(reservoir), 0), len(char_positions))
+        reservoir.extend(example(i) for i in char_positions[:fill])
+        rest = char_positions[fill:]
+        if len(rest) == 0:
+            return
+        # The t-th occurrence replaces a random example with probability reservoir_size / t
+        t = np.arange(seen + fill + 1, seen + len(char_positions) + 1)
+        accepted = rest[self.rng.random(len(rest)) < self.reservoir_size / t]
+        for i, slot in zip(accepted, self.rng.integers(self.reservoir_size, size=len(accepted))):
+            reservoir[slot] = example(i)
+
+    def merge(self, other):
+        """Adds the counts of another histogram, keeping examples in proportion to the occurrences each side saw."""
+        for char, examples in other.examples.items():
+            mine = self.examples.get(char, [])
+            seen, other_seen = self.counts[char], other.counts[char]
+            share = round(self.reservoir_size * seen / (seen + other_seen)) if seen + other_seen else 0
+            share = min(max(share, self.reservoir_size - len(examples)), len(mine))
+            self.examples[char] = mine[:share] + examples[:self.reservoir_size - share]
+        self.counts.update(other.counts)
+
+    def invalid_counts(self):
+        """Returns the (character, count) pairs of the characters outside `valid_chars`, most frequent first."""
+        return [(char, count) for char, count in self.counts.most_common() if not valid_mask[ord(char)]]
+
+
+def histogram_files(files, chunk_size=CHUNK_SIZE, reservoir_size=10, context=10, seed=0):
+    """Builds the histogram of a list of files, reading each one in chunks of `chunk_size` characters."""
+    histogram = CharHistogram(reservoir_size, context, seed)
+    for file in files:
+        with open(file, encoding='utf-8', errors='replace') as f:
+            for chunk in iter(lambda: f.read(chunk_size), ''):
+                histogram.add_text(chunk, str(file))
+    return histogram
+
+
+def histogram_files_parallel(files, num_workers=4, batch_size=64, chunk_size=CHUNK_SIZE, reservoir_size=10, context=10):
+    """Builds the histogram of a list of files with a pool of processes, merging the per-batch histograms."""
+    batches = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    histogram = CharHistogram(reservoir_size, context)
+    with Pool(num_workers) as pool:
+        results = pool.starmap(histogram_files, [(batch, chunk_size, reservoir_size, context, seed) for seed, batch in enumerate(batches)])
+    for result in results:
+        histogram.merge(result)
+    return histogram
+
+
+def suggest_replacement(char):
+    """Suggests a replacement made of valid characters from the Unicode compatibility decomposition, or None."""
+    decomposed = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+    composed = unicodedata.normalize('NFC', decomposed)
+    return composed if composed and composed != char and all(c in valid_chars for c in composed) else None
+
+
+def ranked_report(histogram, min_count=1):
+    """
+    Lists the invalid characters by frequency, with their Unicode names, current replacements and examples.
+
+    Returns:
+        pd.DataFrame: One row per invalid character.
+    """
+    with open(Path(__file__).parent / 'weird_chars.json', encoding='utf-8') as f:
+        weird_chars = json.load(f)
+    total = sum(histogram.counts.values())
+    rows = []
+    for char, count in histogram.invalid_counts():
+        if count < min_count:
+            break
+        rows.append({
+            'char': char,
+            'code_point': f'U+{ord(char):04X}',
+            'name': unicodedata.name(char, ''),
+            'category': unicodedata.category(char),
+            'count': count,
+            'per_million': 1e6 * count / total,
+            'replacement': replacement_dict.get(char, weird_chars.get(char)),
+            'suggestion': suggest_replacement(char),
+            'examples': ' | '.join(repr(context) for context, _ in histogram.examples.get(char, [])),
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    arg_parser = argparse.ArgumentParser(description='Counts the characters of a text corpus and reports the ones outside normalize.valid_chars.')
+    arg_parser.add_argument('-p', '--path', type=str, help='The folder of .txt files.', required=True)
+    arg_parser.add_argument('-o', '--output', type=str, help='The ranked report as a TSV file.', default='char_report.tsv')
+    arg_parser.add_argument('-s', '--suggestions', type=str, help='Write the suggested replacements of characters without one to this JSON file.')
+    arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of processes to use.', default=4)
+    arg_parser.add_argument('-e', '--examples', type=int, help='The number of example contexts kept per character.', default=10)
+    arg_parser.add_argument('-m', '--min_count', type=int, help='Leave out characters seen fewer times.', default=1)
+    args = arg_parser.parse_args()
+
+    files = sorted(Path(args.path).rglob('*.txt'))
+    logger.info(f'Counting characters of {len(files)} files')
+    histogram = histogram_files_parallel(files, args.num_threads, reservoir_size=args.examples)
+    report = ranked_report(histogram, args.min_count)
+    report.to_csv(args.output, sep='\t', index=False)
+    logger.info(f'{len(report)} invalid characters written to {args.output}')
+
+    if args.suggestions:
+        suggestions = {row.char: row.suggestion for row in report.itertuples() if pd.isna(row.replacement) and not pd.isna(row.suggestion)}
+        with open(args.suggestions, 'w', encoding='utf-8') as f:
+            json.dump(suggestions, f, ensure_ascii=False, indent=4)
+        logger.info(f'{len(suggestions)} suggested replacements written to {args.suggestions}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import random
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+from citations import LETTERS, has_citation, strip_citations
+
+# The patterns the citation scanner replaces, for checking that the results are unchanged
+old_inline_citation_pattern = re.compile('[\(\[](([A-Za-zöÖçÇşŞıİğĞüÜ&–§¶\s\d\',:;\.-]+[\s,])?[\d\.]*)((: ?|, ?s.) ?\d+(-\d+)?)?[\)\]]', re.MULTILINE)
+old_reference_pattern = re.compile('[A-Za-zöÖçÇşŞıİğĞüÜ&–§¶\s\d\',:\.\(\)]+(19|20)\d{2}', re.MULTILINE)
+old_pp_pattern = re.compile('[\(\s]pp\.?\s?\d+', re.MULTILINE)
+old_citation_after_word_pattern = re.compile('([a-zA-ZöÖçÇşŞıİğĞüÜ]+[\."\']*?)\d+', re.MULTILINE)
+
+FUZZ_ALPHABET = 'aAşİ19 20,:;.-()[]s"\'\np&é'
+
+# Inputs that make backtracking patterns retry long runs: (name, text)
+ADVERSARIAL_INPUTS = [
+    ('letters', 'a' * 100000),
+    ('letters and dots', 'ş' * 50000 + '.' * 50000),
+    ('words', 'kelime ' * 15000),
+    ('reference run', '(1 ' * 30000),
+    ('reference run without year', 'Yılmaz, A. (' * 8000),
+    ('open brackets', '(' * 100000),
+    ('open brackets and text', '(a, ' * 25000),
+    ('unclosed citation', '(' + 'Yılmaz, 2010: 12-' * 5000),
+    ('digits and dots', '(' + ' 1.1' * 25000 + ':'),
+    ('wildcard run', '(a, s' * 20000),
+    ('nested brackets', '[(' * 25000 + ')]' * 25000),
+    ('page references', ' pp' * 30000),
+]
+
+
+def old_has_citation(text):
+    return bool(old_inline_citation_pattern.search(text)) or bool(old_reference_pattern.search(text)) or bool(old_pp_pattern.search(text))
+
+
+def old_strip_citations(text):
+    text = re.sub(old_inline_citation_pattern, '', text)
+    return re.sub(old_citation_after_word_pattern, '\\1', text)
+
+
+def check_time_bounds(time_limit):
+    failures = 0
+    for name, text in ADVERSARIAL_INPUTS:
+        start = time.perf_counter()
+        has_citation(text)
+        strip_citations(text)
+        elapsed = time.perf_counter() - start
+        ok = elapsed <= time_limit
+        failures += not ok
+        print(f'{"ok" if ok else "SLOW":<5} {name:<28} {len(text):>7} chars {elapsed:.3f}s')
+    return failures
+
+
+def check_same_results(texts):
+    failures = 0
+    for text in texts:
+        if has_citation(text) != old_has_citation(text) or strip_citations(text) != old_strip_citations(text):
+            failures += 1
+            if failures <= 5:
+                print(f'Mismatch: {text!r}')
+    return failures
+
+
+def fuzz_texts(count, seed=0):
+    rng = random.Random(seed)
+    return [''.join(rng.choice(FUZZ_ALPHABET) for _ in range(rng.randint(1, 40))) for _ in range(count)]
+
+
+def corpus_texts(corpus_dir, max_line_length):
+    """Yields the lines and the whole text of every .txt file in `corpus_dir`."""
+    for path in sorted(Path(corpus_dir).glob('*.txt')):
+        text = path.read_text(encoding='utf-8')
+        # The old patterns are quadratic, so very long lines would take too long to compare
+        yield from (line for line in text.split('\n') if len(line) <= max_line_length)
+        if max(map(len, re.findall(f'[{LETTERS}]+', text)), default=0) <= max_line_length:
+            yield text
+
+
+def main():
+    arg_parser = ArgumentParser(description='Checks that the citation scanner matches the old patterns and runs in bounded time on adversarial inputs.')
+    arg_parser.add_argument('-c', '--corpus', type=str, help='A folder of .txt files to compare the old and new results on.')
+    arg_parser.add_argument('-f', '--fuzz', type=int, help='The number of random strings to compare the old and new results on.', default=20000)
+    arg_parser.add_argument('-l', '--time_limit', type=float, help='The time limit in seconds for each adversarial input.', default=1.0)
+    arg_parser.add_argument('-m', '--max_line_length', type=int, help='Skip longer corpus lines when comparing.', default=2000)
+    args = arg_parser.parse_args()
+
+    slow = check_time_bounds(args.time_limit)
+    mismatches = check_same_results(fuzz_texts(args.fuzz))
+    print(f'{mismatches} mismatches on {args.fuzz} random strings')
+    if args.corpus:
+        texts = list(corpus_texts(args.corpus, args.max_line_length))
+        corpus_mismatches = check_same_results(texts)
+        print(f'{corpus_mismatches} mismatches on {len(texts)} corpus lines and documents')
+        mismatches += corpus_mismatches
+    sys.exit(1 if slow or mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
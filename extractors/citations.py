@@ -0,0 +1,41 @@
+import re
+
+# Turkish and ASCII letters
+LETTERS = 'A-Za-zöÖçÇşŞıİğĞüÜ'
+
+# Characters that may appear inside an inline citation such as "(Yılmaz, 2010: 12-15)"
+CITATION_CHARS = LETTERS + '&–§¶\\s\\d\',:;\\.-'
+
+# Characters that may precede the year of a reference such as "Yılmaz, A. (2010)"
+REFERENCE_CHARS = LETTERS + '&–§¶\\s\\d\',:\\.\\(\\)'
+
+# An opening bracket, citation text and a closing bracket. Brackets are not citation characters, so the
+# attempt started at an opening bracket only scans up to the next bracket, and the text is scanned in
+# linear time overall.
+inline_citation_pattern = re.compile(f'[\\(\\[](([{CITATION_CHARS}]+[\\s,])?[\\d\\.]*)((: ?|, ?s.) ?\\d+(-\\d+)?)?[\\)\\]]', re.MULTILINE)
+
+# A year preceded by a reference character. `[...]+(19|20)\d{2}` matches exactly the same lines, but
+# retries the whole preceding run from every start position, which is quadratic in the line length.
+reference_pattern = re.compile(f'[{REFERENCE_CHARS}](?:19|20)\\d{{2}}', re.MULTILINE)
+
+pp_pattern = re.compile('[\\(\\s]pp\\.?\\s?\\d+', re.MULTILINE)
+
+# A footnote number glued to a word, e.g. "kavramı.12". A match can only start at the beginning of a
+# run of letters, and the lookbehind stops the quadratic retries from inside long runs of letters.
+citation_after_word_pattern = re.compile(f'(?<![{LETTERS}])([{LETTERS}]+[\\."\']*?)\\d+', re.MULTILINE)
+
+
+def has_citation(text):
+    """
+    Checks if a text contains an inline citation, a reference year or a page reference.
+
+    Returns:
+        bool: True if citations are found, False otherwise.
+    """
+    return bool(inline_citation_pattern.search(text)) or bool(reference_pattern.search(text)) or bool(pp_pattern.search(text))
+
+
+def strip_citations(text):
+    """Removes inline citations and the footnote numbers glued to words."""
+    text = inline_citation_pattern.sub('', text)
+    return citation_after_word_pattern.sub('\\1', text)
@@ -0,0 +1,85 @@
+import logging
+import re
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+from parallel_parser import BACKENDS, extract_text
+
+logger = logging.getLogger(__name__)
+
+token_pattern = re.compile(r'\w+')
+
+
+def token_agreement(text, reference):
+    """Returns the F1 score of the word tokens of `text` against those of `reference`, ignoring order and case."""
+    tokens = Counter(token_pattern.findall(text.lower()))
+    reference_tokens = Counter(token_pattern.findall(reference.lower()))
+    overlap = sum((tokens & reference_tokens).values())
+    if not tokens or not reference_tokens:
+        return float(tokens == reference_tokens)
+    precision = overlap / sum(tokens.values())
+    recall = overlap / sum(reference_tokens.values())
+    return 2 * precision * recall / (precision + recall) if overlap else 0.0
+
+
+def run_backend(file_path, tool):
+    """Extracts a file with one backend and returns the text and the elapsed seconds, or None and the error."""
+    start = time.perf_counter()
+    try:
+        text = extract_text(file_path, tool)
+    except Exception as e:
+        logger.error(f'{tool} failed on {file_path}: {e}')
+        return None, time.perf_counter() - start
+    return text, time.perf_counter() - start
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    arg_parser = ArgumentParser(description='Compares the speed and the extracted text of PDF extraction backends on sample files.')
+    arg_parser.add_argument('-i', '--input', type=str, help='The folder of sample PDF files.', required=True)
+    arg_parser.add_argument('-t', '--tools', nargs='+', choices=list(BACKENDS), help='The backends to compare.', default=list(BACKENDS))
+    arg_parser.add_argument('-r', '--reference', choices=list(BACKENDS), help='The backend the others are compared with.', default='tika')
+    arg_parser.add_argument('-n', '--num_files', type=int, help='The maximum number of files to use.', default=100)
+    arg_parser.add_argument('-o', '--output', type=str, help='Write the per-file results to this CSV file.')
+    args = arg_parser.parse_args()
+
+    files = sorted(Path(args.input).glob('*.pdf'))[:args.num_files]
+    tools = list(dict.fromkeys([args.reference] + args.tools))
+
+    # Start the Tika server and load the libraries before timing
+    if files:
+        for tool in tools:
+            run_backend(files[0], tool)
+
+    rows = []
+    for file_path in files:
+        texts = {}
+        for tool in tools:
+            texts[tool], seconds = run_backend(file_path, tool)
+            rows.append({'file': file_path.name, 'tool': tool, 'seconds': seconds, 'ok': texts[tool] is not None,
+                         'characters': len(texts[tool] or '')})
+        reference = texts[args.reference]
+        for row in rows[-len(tools):]:
+            text = texts[row['tool']]
+            row['agreement'] = token_agreement(text, reference) if text is not None and reference is not None else None
+
+    df = pd.DataFrame(rows)
+    if args.output:
+        df.to_csv(args.output, index=False)
+    if df.empty:
+        logger.info('No PDF files found.')
+        return
+
+    summary = df.groupby('tool').agg(files=('ok', 'sum'), failures=('ok', lambda ok: (~ok).sum()),
+                                     total_seconds=('seconds', 'sum'), mean_seconds=('seconds', 'mean'),
+                                     characters=('characters', 'sum'), agreement=('agreement', 'mean'))
+    print(f'Agreement is the token F1 score against {args.reference}.')
+    print(summary.to_string(float_format=lambda x: f'{x:.3f}'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import logging
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import pandas as pd
+
+from sentence_splitter import get_sentence_splitter
+
+logger = logging.getLogger(__name__)
+
+
+def boundaries(sentences):
+    """Returns the sentence ends as offsets in the text without whitespace, so that splitters can be compared."""
+    ends = set()
+    offset = 0
+    for sentence in sentences:
+        offset += len(''.join(sentence.split()))
+        ends.add(offset)
+    return ends
+
+
+def boundary_agreement(sentences, reference):
+    """Returns the precision, recall and F1 score of the sentence ends of `sentences` against those of `reference`."""
+    ends, reference_ends = boundaries(sentences), boundaries(reference)
+    overlap = len(ends & reference_ends)
+    precision = overlap / len(ends) if ends else float(not reference_ends)
+    recall = overlap / len(reference_ends) if reference_ends else float(not ends)
+    return precision, recall, 2 * precision * recall / (precision + recall) if overlap else 0.0
+
+
+def disagreements(sentences, reference, count=3):
+    """Returns up to `count` sentences of `sentences` whose end the reference does not have."""
+    reference_ends = boundaries(reference)
+    offset = 0
+    examples = []
+    for sentence in sentences:
+        offset += len(''.join(sentence.split()))
+        if offset not in reference_ends and len(examples) < count:
+            examples.append(sentence[-80:])
+    return examples
+
+
+def run_splitter(text, splitter):
+    start = time.perf_counter()
+    sentences = get_sentence_splitter(splitter).split_sentences(text)
+    return sentences, time.perf_counter() - start
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    arg_parser = ArgumentParser(description='Compares the speed and the sentence boundaries of the rule-based splitter with vnlp on extracted texts.')
+    arg_parser.add_argument('-i', '--input', type=str, help='The folder of extracted .txt files.', required=True)
+    arg_parser.add_argument('-n', '--num_files', type=int, help='The maximum number of files to use.', default=100)
+    arg_parser.add_argument('-e', '--examples', type=int, help='Print this many sentences the splitters disagree on.', default=10)
+    arg_parser.add_argument('-o', '--output', type=str, help='Write the per-file results to this CSV file.')
+    args = arg_parser.parse_args()
+
+    files = sorted(Path(args.input).glob('*.txt'))[:args.num_files]
+
+    # Load the vnlp model before timing
+    start = time.perf_counter()
+    get_sentence_splitter('vnlp')
+    logger.info(f'Loading vnlp took {time.perf_counter() - start:.1f}s')
+
+    rows = []
+    examples = []
+    for file_path in files:
+        text = file_path.read_text(encoding='utf-8')
+        reference, reference_seconds = run_splitter(text, 'vnlp')
+        sentences, seconds = run_splitter(text, 'rule')
+        precision, recall, f1 = boundary_agreement(sentences, reference)
+        rows.append({'file': file_path.name, 'characters': len(text), 'vnlp_sentences': len(reference), 'rule_sentences': len(sentences),
+                     'vnlp_seconds': reference_seconds, 'rule_seconds': seconds, 'precision': precision, 'recall': recall, 'f1': f1})
+        if len(examples) < args.examples:
+            examples += [(file_path.name, 'rule only', s) for s in disagreements(sentences, reference)]
+            examples += [(file_path.name, 'vnlp only', s) for s in disagreements(reference, sentences)]
+
+    df = pd.DataFrame(rows)
+    if args.output:
+        df.to_csv(args.output, index=False)
+    if df.empty:
+        logger.info('No text files found.')
+        return
+
+    print(df[['characters', 'vnlp_sentences', 'rule_sentences', 'vnlp_seconds', 'rule_seconds']].sum().to_string(float_format=lambda x: f'{x:.3f}'))
+    print(f'Speedup: {df["vnlp_seconds"].sum() / max(df["rule_seconds"].sum(), 1e-9):.1f}x')
+    print('Boundary agreement against vnlp, mean over files:')
+    print(df[['precision', 'recall', 'f1']].mean().to_string(float_format=lambda x: f'{x:.3f}'))
+    print('Sentence ends found by only one splitter:')
+    for name, side, sentence in examples[:args.examples]:
+        print(f'  {name} [{side}] ...{sentence}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,30 @@
 import re
+import numpy as np
 import pandas as pd
-from tika import parser
+from parallel_parser import BACKENDS, PAGE_SEPARATOR, extract_text, page_ranges
 from pathlib import Path
-from multiprocessing import Pool, context
+from multiprocessing import Pool, Queue
 from collections import Counter
-from thesis_preprocessor import process_thesis_text
+from thesis_preprocessor import process_thesis_text, replace_page_numbers_with_placeholder, replace_roman_numbers_with_placeholder
 from pyinstrument import Profiler
 # from langdetect import detect
-from normalize import preprocess_text
+from normalize import preprocess_text, replace_characters
+from citations import has_citation, strip_citations
+from shards import MetadataJoiner, ShardReader, ShardWriter
+from html_text import HTML_SUFFIXES, gazette_pages, html_lines, is_gazette_directory
+from scheduling import CostModel, DurationLog, input_kind
+from memory import add_memory_arguments, memory_budget, worker_limit
 import langid
 import argparse
+import hashlib
+import io
 import math
 import os
 import logging
+import queue
+import signal
+import tempfile
+import time
 
 import warnings
 warnings.simplefilter(action='ignore', category=UserWarning)
@@ -224,10 +236,6 @@ def compute_affiliation_ratio(line):
 
     return affiliation_ratio
 
-inline_citation_pattern = re.compile('[\(\[](([A-Za-zöÖçÇşŞıİğĞüÜ&–§¶\s\d\',:;\.-]+[\s,])?[\d\.]*)((: ?|, ?s.) ?\d+(-\d+)?)?[\)\]]', re.MULTILINE)
-reference_pattern = re.compile('[A-Za-zöÖçÇşŞıİğĞüÜ&–§¶\s\d\',:\.\(\)]+(19|20)\d{2}', re.MULTILINE)
-pp_pattern = re.compile('[\(\s]pp\.?\s?\d+', re.MULTILINE)
-
 def capture_citations(text):
     """
     Checks if a text contains any citations using a regular expression pattern.
@@ -235,7 +243,7 @@ def capture_citations(text):
     Returns:
         bool: True if citations are found, False otherwise.
     """
-    return bool(inline_citation_pattern.search(text)) or bool(reference_pattern.search(text)) or bool(pp_pattern.search(text))
+    return has_citation(text)
 
 def discard_flags(text):
     """
@@ -264,18 +272,19 @@ def check_volume_number_format(text):
     tr_match = volume_tr_pattern.search(text)
     return bool(match) or bool(tr_match)
 
-def parse_pdf(path):
+def parse_pdf(path, tool='tika'):
     """
     Parses a PDF file and extracts the content as a list of stripped lines.
 
     Args:
         path (str): The path to the PDF file.
+        tool (str): The text extraction backend, see `parallel_parser.BACKENDS`.
 
     Returns:
         list: A list of stripped lines from the PDF content.
     """
-    parsed = parser.from_file(path)
-    return [l.strip() for l in parsed["content"].split('\n') if l.strip() != '']
+    content = extract_text(path, tool)
+    return [l.strip() for l in content.split('\n') if l.strip() != '']
 
 index_str_l = ['tablo', 'şekil', 'grafik', 'çizelge', 'table', 'figure', 'graph', 'chart', 'plan', 'resim', 'figür', 'levha', 'simge', 'harita', 'fotoğraf',
                'tablolar', 'şekiller', 'grafikler', 'çizelgeler', 'resimler', 'figürler', 'levhalar', 'planlar', 'simgeler', 'haritalar', 'fotoğraflar',
@@ -304,16 +313,21 @@ def check_index(lines):
         return True
     return False
 
-def compute_line_statistics(lines):
+def compute_line_statistics(lines, occurrences=None):
     """
     Computes various statistics for each line in a list of lines.
 
+    Args:
+        lines (list): The lines.
+        occurrences (callable): Returns the occurrence count of a line, when `lines` is only a part of the document.
+
     Returns:
         list: A list of dictionaries containing the line statistics.
     """
 
     # create a list consisting of `lines` with numbers removed
-    lines_without_numbers = [re.sub(r'(^(\d+)|(\d+)$)', '', line.strip()) for line in lines]
+    if occurrences is None:
+        lines_without_numbers = [re.sub(r'(^(\d+)|(\d+)$)', '', line.strip()) for line in lines]
 
     statistics = []
     for i, line in enumerate(lines):
@@ -331,7 +345,7 @@ def compute_line_statistics(lines):
         stats['dates'] = capture_dates(line)
         stats['has_email'] = check_email(line)
         stats['has_name'] = check_name(line)
-        stats['occurrence'] = count_occurrence(lines_without_numbers, line)
+        stats['occurrence'] = occurrences(line) if occurrences else count_occurrence(lines_without_numbers, line)
         stats['caption_type'] = find_caption_type(line)
         stats['affiliation_count'] = compute_affiliation_ratio(line)
         stats['citation_format'] = check_volume_number_format(line)
@@ -418,8 +432,6 @@ def mark_items(df, window_size=5, threshold_token_count=2, threshold_drop_ratio=
                     current_index += 1
     return df
 
-citation_after_word_pattern = re.compile('([a-zA-ZöÖçÇşŞıİğĞüÜ]+[\."\']*?)\d+', re.MULTILINE)
-
 def merge_lines(df, min_page_length=50, page_end_context=250):
     # Create a new column to mark page breaks
     df['page_break'] = df['line'].apply(lambda s: '[PAGE_BREAK]' in s)
@@ -519,19 +531,20 @@ def mark_footnotes(df):
 
     return df
 
-def replace_most_frequent_empty_lines(text):
-    # Find all sequences of consecutive empty lines
-    matches = re.findall(r"(?:\n\s*){2,}", text)
+def replace_most_frequent_empty_lines(text, most_common=None):
+    if most_common is None:
+        # Find all sequences of consecutive empty lines
+        matches = re.findall(r"(?:\n\s*){2,}", text)
 
-    # If no matches, return the original text
-    if not matches:
-        return text
+        # If no matches, return the original text
+        if not matches:
+            return text
 
-    # Get the counts of consecutive empty lines
-    counts = [len(match.split('\n')) for match in matches]
-    
-    # Find the most common count
-    most_common, _ = Counter(counts).most_common(1)[0]
+        # Get the counts of consecutive empty lines
+        counts = [len(match.split('\n')) for match in matches]
+
+        # Find the most common count
+        most_common, _ = Counter(counts).most_common(1)[0]
     if most_common < 5:
         return text
     # Replace the most common count of consecutive empty lines with the placeholder
@@ -551,44 +564,30 @@ def remove_text_before_abstract(text):
             text = text[start_index:]
     return text
 
-def convert_pdf_to_text(file, is_thesis, output_dir, detect_language=True):
-    """
-    Converts a PDF file to text, performs text analysis, and saves the results to a CSV file.
+# Thresholds of the line filters, see `first_pass_rules` and `second_pass_rules`.
+# refilter.py applies other values to the line features cached by `save_features`.
+DEFAULT_RULES = {
+    'max_affiliation_count': 0.09,
+    'max_occurrence': 2,
+    'min_table_digit_ratio': 0.2,
+    'max_table_token_length': 4,
+    'max_number_ratio': 1,
+}
 
-    The function reads the PDF file, computes line statistics, and identifies various line types
-    such as footnotes, bibliography, etc. The processed results are then saved to a CSV file.
+# Line features that are not needed for filtering and are left out of the feature cache
+UNCACHED_FEATURES = ['tokens', 'numbers', 'dates']
 
-    Args:
-        file (str): The path to the PDF file.
+def compute_features(content, is_thesis):
     """
-    logger.info(f'Processing {file}')
-    file_path = Path(file)
-    no_inline_folder = Path(output_dir)
-    no_inline_folder.mkdir(parents=True, exist_ok=True)
+    Normalizes extracted text, splits it into lines and computes the features the line filters use.
 
-    no_inline_filename = no_inline_folder / file_path.name
-    
-    if file.endswith('pdf'):
-        no_inline_filename = str(no_inline_filename).replace('.pdf','_no_inline_citations.txt')
-    elif file.endswith('txt'):
-        no_inline_filename = str(no_inline_filename).replace('.txt','_no_inline_citations.txt')
-
-    if file.endswith('.pdf'):
-        try:
-            content = parser.from_file(file)['content']
-        except:
-            logger.info('Error during OCR {file}')
-            return
-        
-    elif file.endswith('.txt'):
-        with open(file, encoding='utf-8') as f:
-            content = f.read()
-
-    if content.strip() == '': 
-        logger.info('Empty file')
-        return 
+    Args:
+        content (str): The extracted text of a document.
+        is_thesis (bool): Apply thesis preprocessing.
 
-        
+    Returns:
+        pd.DataFrame: One row of line statistics per line, including the bibliography flag.
+    """
     logger.info(f'Preprocessing and removing text before abstract')
     content = preprocess_text(content)
     content = remove_text_before_abstract(content)
@@ -609,14 +608,64 @@ def convert_pdf_to_text(file, is_thesis, output_dir, detect_language=True):
         df = find_bibliography(df)
     except:
         df['is_bibliography'] = False
+    return df
+
+def save_features(df, path):
+    """Writes the line features of a document to a Parquet file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.drop(columns=UNCACHED_FEATURES).to_parquet(path, index=False)
+
+def first_pass_rules(df, rules):
+    """Returns the masks of the lines dropped before language detection, by rule name."""
+    return {
+        'bibliography': df['is_bibliography'] == True,
+        'email': df['has_email'],
+        'name': df['has_name'],
+        'citation_format': df['citation_format'],
+        'discard_flag': df['discard_flag'],
+        'affiliation': df['affiliation_count'] > rules['max_affiliation_count'],
+        'occurrence': df['occurrence'] > rules['max_occurrence'],
+    }
+
+def second_pass_rules(df, rules):
+    """Returns the masks of the lines dropped after footnotes and table items are marked, by rule name."""
+    return {
+        'table_values': (df['digit_ratio'] >= rules['min_table_digit_ratio']) & (df['average_token_length'] < rules['max_table_token_length']),
+        'page_numbers': df['digit_ratio'] == 1,
+        'numbers': df['number_ratio'] > rules['max_number_ratio'],
+        'item': df['item'] == True,
+        'email': df['has_email'],
+        'caption': df['caption_type'] != 'Yok',
+        'footnote': df['is_footnote'],
+        'citation_format': df['citation_format'],
+        'discard_flag': df['discard_flag'],
+        'affiliation': df['affiliation_count'] > rules['max_affiliation_count'],
+        'occurrence': df['occurrence'] > rules['max_occurrence'],
+        'bibliography': df['is_bibliography'],
+        'index': df['part_of_index'],
+    }
+
+def count_rules(masks, counts, prefix):
+    for name, mask in masks.items():
+        counts[f'{prefix}{name}'] = counts.get(f'{prefix}{name}', 0) + int(mask.sum())
+
+def filter_lines(df, rules=DEFAULT_RULES, detect_language=True, counts=None):
+    """
+    Drops bibliography, front matter, non-Turkish lines, footnotes, table items and other noise.
+
+    Args:
+        df (pd.DataFrame): The line features from `compute_features`, optionally with an `is_turkish` column.
+        rules (dict): The filter thresholds, see `DEFAULT_RULES`.
+        detect_language (bool): Drop lines that are not Turkish.
+        counts (dict): If given, the number of lines matched by each rule is added to it.
 
-    df.drop(df.loc[(df['is_bibliography'] == True)
-                   | df['has_email']
-                   | df['has_name']
-                   | df['citation_format']
-                   | df['discard_flag']
-                   | (df['affiliation_count'] > 0.09)
-                   | (df['occurrence'] > 2)].index, inplace=True)
+    Returns:
+        pd.DataFrame: The remaining lines, or None if no content is left.
+    """
+    masks = first_pass_rules(df, rules)
+    if counts is not None:
+        count_rules(masks, counts, 'first_pass.')
+    df.drop(df.loc[pd.concat(masks, axis=1).any(axis=1)].index, inplace=True)
     logger.info(f'Number of lines after dropping bibliography and some other items {df.shape[0]}')
 
     if df.shape[0] == 0:
@@ -627,9 +676,12 @@ def convert_pdf_to_text(file, is_thesis, output_dir, detect_language=True):
 
     if detect_language:
         logger.info(f'Detecting language and correcting values')
-        df['is_turkish'] = df['line'].apply(is_turkish_content)
+        if 'is_turkish' not in df:
+            df['is_turkish'] = df['line'].apply(is_turkish_content)
         df['is_turkish_corrected'] = df['is_turkish']
         df = correct_false_values(df, 'is_turkish')
+        if counts is not None:
+            counts['language'] = counts.get('language', 0) + int((df['is_turkish_corrected'] == False).sum())
         df.drop(df.loc[df['is_turkish_corrected'] == False].index, inplace=True)
 
     logger.info(f'Number of lines after dropping non-Turkish content {df.shape[0]}')
@@ -645,19 +697,10 @@ def convert_pdf_to_text(file, is_thesis, output_dir, detect_language=True):
     logger.info(f'Marking table items for {len(df)} lines')
     df = mark_items(df)
 
-    index = df[((df['digit_ratio'] >= 0.2) & (df['average_token_length'] < 4)) # usually table values
-                | (df['digit_ratio'] == 1)                                        # page numbers
-                | (df['number_ratio'] > 1)                                        # numbers
-                | (df['item'] == True)
-                | (df['has_email'])
-                | (df['caption_type'] != 'Yok')
-                | (df['is_footnote'])
-                | (df['citation_format'])
-                | (df['discard_flag'])
-                | (df['affiliation_count'] > 0.09)
-                | (df['occurrence'] > 2)
-                | (df['is_bibliography'])
-                | (df['part_of_index'])].index
+    masks = second_pass_rules(df, rules)
+    if counts is not None:
+        count_rules(masks, counts, 'second_pass.')
+    index = df[pd.concat(masks, axis=1).any(axis=1)].index
 
     df.loc[index, 'drop'] = True
 
@@ -670,58 +713,580 @@ def convert_pdf_to_text(file, is_thesis, output_dir, detect_language=True):
     filtered_df = df.drop(index)
 
     logger.info(f'Final number of lines {filtered_df.shape[0]}')
+    if counts is not None:
+        counts['kept'] = counts.get('kept', 0) + filtered_df.shape[0]
+    return filtered_df
 
+def filtered_text(filtered_df):
+    """Merges the remaining lines into paragraphs and strips citations."""
     logger.info(f'Merging lines {filtered_df.shape[0]}')
 
     filtered_content = merge_lines(filtered_df)
-    no_inline_content = re.sub(inline_citation_pattern, '', filtered_content)
-    no_citation_after_word_content = re.sub(citation_after_word_pattern, '\\1', no_inline_content)
-    with open(no_inline_filename, 'w', encoding='utf-8') as f:
-        f.write(no_citation_after_word_content)
+    return strip_citations(filtered_content)
+
+def write_filtered_text(filtered_df, filename):
+    """Merges the remaining lines into paragraphs, strips citations and writes the text."""
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(filtered_text(filtered_df))
+
+# The chunked mode reads documents too large to hold in memory a few times over in page-aligned windows.
+# A first pass collects the signals that depend on the whole document, the second filters one window at a time.
+WINDOW_CHARS = 1_000_000
+
+empty_run_pattern = re.compile(r"(?:\n\s*){2,}")
+abstract_pattern = re.compile(r'\b(?:ÖZET|ÖZ|Öz|Özet)\s*?\n')
+
+def line_key(line):
+    """Hashes a line without its leading and trailing numbers, as `count_occurrence` compares lines."""
+    number_removed = re.sub(r'(^(\d+)|(\d+)$)', '', line.strip())
+    return int.from_bytes(hashlib.blake2b(number_removed.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def text_windows(lines, window_chars=WINDOW_CHARS):
+    """
+    Joins lines into windows of at least `window_chars` characters. A window ends at a run of empty lines,
+    so that the next one starts at a page and no run is split; without such a run it ends at a line once
+    it is four times as large.
+    """
+    window = []
+    size = 0
+    after_empty = False
+    for line in lines:
+        empty = not line.strip()
+        if not empty and size >= window_chars and (after_empty or size >= 4 * window_chars):
+            yield ''.join(window)
+            window = []
+            size = 0
+        window.append(line)
+        size += len(line)
+        after_empty = empty
+    if window:
+        yield ''.join(window)
+
+class DocumentSignals:
+    """
+    The document-global signals of the chunked mode, collected over the normalized windows of a document:
+    the position of the abstract and the bibliography, the empty line runs that become page breaks and
+    the occurrence counts of the lines. Offsets are in characters of the normalized text.
+
+    The occurrences are kept as an 8-byte hash per line, the only part that grows with the document.
+    """
+
+    def __init__(self, is_thesis):
+        self.is_thesis = is_thesis
+        self.length = 0
+        self.abstract = None
+        self.bibliography = None
+        # Indexed by whether they come after the start of the abstract
+        self.runs = [Counter(), Counter()]
+        self.keys = [[], []]
+        # The lines followed by empty lines, whose page break placeholder depends on the most common run
+        self.page_ends = []
+
+    def add(self, window):
+        start = self.length
+        self.length += len(window)
+        if self.abstract is None:
+            match = abstract_pattern.search(window)
+            if match:
+                self.abstract = start + match.start()
+
+        run_newlines = {}
+        for match in empty_run_pattern.finditer(window):
+            self.runs[self.is_after(start + match.start())][len(match.group().split('\n'))] += 1
+            run_newlines[match.start()] = match.group().count('\n')
+
+        keys = ([], [])
+        position = 0
+        for line in window.split('\n'):
+            end = position + len(line)
+            if line.strip():
+                if bibliography_pattern.match(line.strip()):
+                    self.bibliography = start + position
+                if self.is_thesis:
+                    line = line.replace('ROMAN_PAGE_NUMBER', 'PAGE_BREAK').replace('PAGE_NUMBER', 'PAGE_BREAK')
+                is_after = self.is_after(start + end)
+                if end in run_newlines:
+                    self.page_ends.append((line_key(line), line_key(line + ' [PAGE_BREAK]'), run_newlines[end], is_after))
+                else:
+                    keys[is_after].append(line_key(line))
+            position = end + 1
+        for is_after in (0, 1):
+            self.keys[is_after].append(np.array(keys[is_after], dtype=np.uint64))
+
+    def is_after(self, offset):
+        return int(self.abstract is not None and offset > self.abstract)
+
+    def finish(self):
+        """Decides the text cuts and page breaks as `compute_features` does on the whole text, and counts the lines."""
+        # The text before the abstract is removed if the abstract starts in the first half
+        self.cut = self.abstract if self.abstract is not None and self.abstract < self.length / 2 else 0
+        parts = [1] if self.cut else [0, 1]
+        if self.bibliography is not None and self.bibliography < self.cut:
+            self.bibliography = None
+        runs = sum((self.runs[part] for part in parts), Counter())
+        self.most_common = runs.most_common(1)[0][0] if runs else 0
+        # The replacement pattern matches the runs with at least `most_common` newlines, see `replace_most_frequent_empty_lines`
+        breaks = self.most_common if self.is_thesis or self.most_common >= 5 else 0
+
+        page_end_keys = []
+        for plain_key, page_break_key, newlines, is_after in self.page_ends:
+            if is_after in parts:
+                replaced = breaks and newlines >= breaks
+                page_end_keys.append(page_break_key if replaced and not self.is_thesis else plain_key)
+                if replaced and self.is_thesis:
+                    # Thesis page breaks are lines of their own
+                    page_end_keys.append(line_key('[PAGE_BREAK]'))
+        keys = np.concatenate([keys for part in parts for keys in self.keys[part]] + [np.array(page_end_keys, dtype=np.uint64)])
+        self.line_keys, self.counts = np.unique(keys, return_counts=True)
+        self.keys = self.page_ends = None
+
+    def occurrence(self, line):
+        key = np.uint64(line_key(line))
+        i = np.searchsorted(self.line_keys, key)
+        # A line counts itself, even if the two passes normalized it differently
+        return max(1, int(self.counts[i])) if i < len(self.line_keys) and self.line_keys[i] == key else 1
+
+def filter_window(core, before=None, after=None, detect_language=True):
+    """Filters the lines of a window with the lines around it as context, and returns the remaining lines of the window."""
+    df = pd.concat([part for part in (before, core, after) if part is not None], ignore_index=True)
+    filtered_df = filter_lines(df, DEFAULT_RULES, detect_language)
+    if filtered_df is None:
+        return
+    filtered_df = filtered_df[filtered_df['position'].between(core['position'].iloc[0], core['position'].iloc[-1])]
+    return filtered_df if filtered_df.shape[0] else None
+
+def filter_windows(windows, signals, detect_language=True, context_lines=20):
+    """
+    The second pass of the chunked mode: yields the remaining lines of every window of the normalized text.
+
+    A window is filtered with `context_lines` lines of its neighbours, so that the footnote, table item
+    and language corrections see across its edges. The windows after the bibliography are not read.
+    """
+    end = 0
+    position = 0
+    before = core = None
+    for window in windows:
+        start, end = end, end + len(window)
+        if end <= signals.cut:
+            continue
+        last = signals.bibliography is not None and signals.bibliography < end
+        window = window[max(0, signals.cut - start):signals.bibliography - start if last else None]
+
+        if signals.is_thesis:
+            window = process_thesis_text('\n' + window, signals.most_common)
+        else:
+            window = replace_most_frequent_empty_lines(window, signals.most_common)
+        lines = [l.strip() for l in window.split('\n') if l.strip()]
+        if lines:
+            df = pd.DataFrame(compute_line_statistics(lines, signals.occurrence))
+            df['final_number'] = df['final_number'].fillna(-1)
+            df['is_bibliography'] = False
+            df['position'] = range(position, position + len(df))
+            position += len(df)
+            if core is not None:
+                yield filter_window(core, before, df.head(context_lines), detect_language)
+                before = core.tail(context_lines)
+            core = df
+        if last:
+            break
+    if core is not None:
+        yield filter_window(core, before, None, detect_language)
+
+def document_lines(file, tool='tika', pages_per_part=50):
+    """
+    Yields the lines of a text file, of a PDF file extracted `pages_per_part` pages at a time, of an HTML page,
+    or of the pages of a Resmi Gazete date directory separated by page breaks.
+    """
+    if is_gazette_directory(file):
+        for page in gazette_pages(file):
+            yield from document_lines(str(page), tool, pages_per_part)
+            if page.suffix != '.pdf':
+                yield from io.StringIO(PAGE_SEPARATOR)
+    elif file.endswith('.pdf'):
+        for pages in page_ranges(file, pages_per_part):
+            # StringIO splits at '\n' only, like `str.split('\n')` in `compute_features`
+            yield from io.StringIO(extract_text(file, tool, pages) + PAGE_SEPARATOR)
+    elif file.lower().endswith(HTML_SUFFIXES):
+        yield from html_lines(file)
+    else:
+        with open(file, encoding='utf-8') as f:
+            yield from f
+
+def convert_in_chunks(file, is_thesis, output_dir, detect_language=True, tool='tika', window_chars=WINDOW_CHARS, pages_per_part=50):
+    """
+    Converts a large PDF or text file like `convert_pdf_to_text` with bounded memory.
+
+    The first pass normalizes the document into a temporary file one window at a time and collects the
+    `DocumentSignals`. The second pass reads the normalized text back in page-aligned windows of about
+    `window_chars` characters, filters each one and appends its text to the output. The results differ from
+    `convert_pdf_to_text` only near the window edges, e.g. for thesis sections discarded across two windows.
+    The line features are not saved in this mode.
+
+    Returns:
+        str: The path of the filtered text, or the text itself if `output_dir` is None; None if nothing is left.
+    """
+    logger.info(f'Processing {file} in chunks')
+    signals = DocumentSignals(is_thesis)
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='\n') as normalized:
+        try:
+            for i, window in enumerate(text_windows(document_lines(file, tool, pages_per_part), window_chars)):
+                window = replace_characters(window.lstrip() if i == 0 else window)
+                if is_thesis:
+                    # The placeholder patterns start with a newline, which belongs to the previous window
+                    window = replace_page_numbers_with_placeholder(replace_roman_numbers_with_placeholder('\n' + window))[1:]
+                signals.add(window)
+                normalized.write(window)
+        except:
+            logger.info(f'Error during OCR {file}')
+            return
+        if signals.length == 0:
+            logger.info('Empty file')
+            return
+        signals.finish()
+        logger.info(f'{signals.length} characters, {len(signals.line_keys)} distinct lines, most common empty line run {signals.most_common}')
+
+        normalized.seek(0)
+        texts = (filtered_text(filtered_df) for filtered_df in filter_windows(text_windows(normalized, window_chars), signals, detect_language)
+                 if filtered_df is not None)
+        if output_dir is None:
+            return ''.join(texts) or None
+        no_inline_filename = no_inline_path(file, output_dir)
+        with open(no_inline_filename, 'w', encoding='utf-8') as f:
+            empty = True
+            for text in texts:
+                f.write(text)
+                empty = False
+    if empty:
+        os.remove(no_inline_filename)
+        return
+    return no_inline_filename
+
+def no_inline_path(file, output_dir):
+    """Returns the output file of an input file or gazette date directory, creating the output directory."""
+    no_inline_folder = Path(output_dir)
+    no_inline_folder.mkdir(parents=True, exist_ok=True)
+
+    no_inline_filename = no_inline_folder / Path(file).name
+
+    if file.endswith('pdf'):
+        no_inline_filename = str(no_inline_filename).replace('.pdf','_no_inline_citations.txt')
+    elif file.endswith('txt'):
+        no_inline_filename = str(no_inline_filename).replace('.txt','_no_inline_citations.txt')
+    else:
+        # HTML pages and gazette date directories
+        no_inline_filename = str(no_inline_folder / f'{Path(file).stem}_no_inline_citations.txt')
+    return no_inline_filename
+
+def convert_pdf_to_text(file, is_thesis, output_dir, detect_language=True, tool='tika', content=None, features_dir=None):
+    """
+    Converts a PDF file to text, performs text analysis, and saves the results to a CSV file.
+
+    The function reads the PDF file, computes line statistics, and identifies various line types
+    such as footnotes, bibliography, etc. The processed results are then saved to a CSV file.
+
+    Args:
+        file (str): The path to the PDF file.
+        output_dir (str): The output directory. If None, the filtered text is returned instead, e.g. for the shards.
+        tool (str): The text extraction backend, see `parallel_parser.BACKENDS`.
+        content (str): The already extracted text of the file, e.g. stitched from page ranges.
+        features_dir (str): If given, the line features are also saved here for refilter.py.
+
+    Returns:
+        str: The path of the filtered text, or the text itself if `output_dir` is None; None if nothing is left.
+    """
+    logger.info(f'Processing {file}')
+    file_path = Path(file)
+    if output_dir is not None:
+        no_inline_filename = no_inline_path(file, output_dir)
+
+    if content is None and file.endswith('.pdf'):
+        try:
+            content = extract_text(file, tool)
+        except:
+            logger.info('Error during OCR {file}')
+            return
+        
+    elif content is None and file.endswith('.txt'):
+        with open(file, encoding='utf-8') as f:
+            content = f.read()
+
+    elif content is None:
+        # HTML pages are converted while they are read, and the pages of a gazette date are joined
+        try:
+            content = ''.join(document_lines(file, tool))
+        except:
+            logger.info(f'Error during the extraction of {file}')
+            return
+
+    if content.strip() == '': 
+        logger.info('Empty file')
+        return 
+
+    df = compute_features(content, is_thesis)
 
-def wrapper_convert(args_tuple):
+    if features_dir:
+        if detect_language:
+            # Cached for every line, so that refiltering does not need langid
+            df['is_turkish'] = df['line'].apply(is_turkish_content)
+        save_features(df, Path(features_dir) / f'{file_path.stem}.parquet')
+
+    filtered_df = filter_lines(df, DEFAULT_RULES, detect_language)
+    if filtered_df is None:
+        return
+
+    if output_dir is None:
+        return filtered_text(filtered_df)
+    write_filtered_text(filtered_df, no_inline_filename)
+    return no_inline_filename
+
+INPUT_SUFFIXES = ('.pdf', '.txt') + HTML_SUFFIXES
+
+def wrapper_convert(args_tuple, content=None):
     try:
-        input_file, thesis_preprocessing, output_dir = args_tuple
-        return convert_pdf_to_text(input_file, thesis_preprocessing, output_dir)
+        input_file, thesis_preprocessing, output_dir, tool, features_dir = args_tuple
+        return convert_pdf_to_text(input_file, thesis_preprocessing, output_dir, tool=tool, content=content, features_dir=features_dir)
     except Exception as e:
         logger.info(f'Error during conversion of {input_file}: {e}')
 
+def wrapper_convert_chunked(args_tuple, window_chars=WINDOW_CHARS, pages_per_part=50):
+    try:
+        input_file, thesis_preprocessing, output_dir, tool, features_dir = args_tuple
+        if features_dir:
+            logger.info(f'The line features of {input_file} are not saved in the chunked mode')
+        return convert_in_chunks(input_file, thesis_preprocessing, output_dir, tool=tool, window_chars=window_chars, pages_per_part=pages_per_part)
+    except Exception as e:
+        logger.info(f'Error during conversion of {input_file}: {e}')
+
+# Set in every pool worker by `set_start_queue`, so that the scheduler knows when a conversion really starts
+start_queue = None
+
+def set_start_queue(starts):
+    global start_queue
+    start_queue = starts
+
+def run_timed(function, input_tuple, *args):
+    """Runs a conversion in a pool worker after announcing its start, and returns its result with its duration."""
+    if start_queue is not None:
+        start_queue.put((input_tuple[0], os.getpid(), time.monotonic()))
+    start = time.perf_counter()
+    return function(input_tuple, *args), time.perf_counter() - start
+
+def extract_range(input_file, tool, pages):
+    """Extracts the text of a range of pages of a PDF file for stitching."""
+    logger.info(f'Extracting pages {pages.start + 1}-{pages.stop} of {input_file}')
+    return extract_text(input_file, tool, pages)
+
+def split_large_files(input_tuples, split_size, pages_per_part):
+    """
+    Finds the PDF files larger than `split_size` megabytes with more than `pages_per_part` pages.
+
+    Returns:
+        dict: The page ranges of every file to split, keyed by its input tuple.
+    """
+    ranges = {}
+    for input_tuple in input_tuples:
+        input_file = input_tuple[0]
+        if not input_file.endswith('.pdf') or os.path.getsize(input_file) < split_size * 2 ** 20:
+            continue
+        try:
+            file_ranges = page_ranges(input_file, pages_per_part)
+        except Exception as e:
+            logger.info(f'Could not count the pages of {input_file}: {e}')
+            continue
+        if len(file_ranges) > 1:
+            ranges[input_tuple] = file_ranges
+    return ranges
+
+def input_size(input_file):
+    """Returns the size of an input file, or of all the pages of a gazette date directory, in bytes."""
+    if is_gazette_directory(input_file):
+        return sum(os.path.getsize(page) for page in gazette_pages(input_file))
+    return os.path.getsize(input_file)
+
+def run_scheduled(pool, starts, tasks, parts, model, durations=None, writer=None, time_limit=30, min_time_limit=5, memory=None, slots=1):
+    """
+    Runs the conversions on the pool and enforces their time budgets.
+
+    A budget counts from the moment a worker starts the file, not from its submission. A worker that runs
+    over its budget is killed and replaced by the pool, so that a stuck file does not hold its slot for the
+    rest of the batch. Every finished or timed out file is recorded in `durations`.
+
+    With a `memory` budget, at most `slots` files are in progress at once, and a file is only submitted
+    while its estimated memory fits next to those of the files in progress. Files that do not fit are held
+    back while smaller ones behind them go ahead.
+
+    Args:
+        starts (Queue): The queue the workers announce their files on, see `set_start_queue`.
+        tasks (list): The (function, input tuple, extra arguments, kind, size, default budget) of every file, in submission order.
+        parts (dict): The page range results of the split files by input tuple; a file is converted once all its ranges are extracted.
+        model (CostModel): Sets the budgets of the calibrated kinds of input.
+        memory (MemoryBudget): The admission control, None submits every file at once.
+        slots (int): The number of files in progress at once under a memory budget, usually the number of workers.
+    """
+    pending = {}
+    backlog = list(tasks)
+    counts = {'ok': 0, 'empty': 0, 'timeout': 0}
+
+    def admit():
+        for task in list(backlog):
+            function, input_tuple, function_args, kind, size, default = task
+            if memory is not None:
+                if len(pending) >= slots:
+                    return
+                # A chunked file only holds a window (its first extra argument) and its context at a time
+                estimate = memory.estimate(min(size, 2 * function_args[0]) if kind.endswith(':chunked') else size, kind)
+                if not memory.fits(estimate):
+                    continue
+                memory.reserve(input_tuple[0], estimate)
+            backlog.remove(task)
+            budget = model.budget(kind, size, default, min_time_limit)
+            pending[input_tuple[0]] = (pool.apply_async(run_timed, (function, input_tuple, *function_args)), kind, size, budget)
+
+    admit()
+    submitted = time.monotonic()
+    running = {}
+    current = {}
+    while pending or parts or backlog:
+        admit()
+        for input_tuple, part_results in list(parts.items()):
+            if all(r.ready() for r in part_results):
+                del parts[input_tuple]
+                try:
+                    content = PAGE_SEPARATOR.join(r.get() for r in part_results)
+                except Exception as e:
+                    logger.info(f'Error during OCR {input_tuple[0]}: {e}')
+                    continue
+                backlog.append((wrapper_convert, input_tuple, (content,), input_kind(input_tuple[0], 'stitched'), input_size(input_tuple[0]), time_limit))
+            elif time.monotonic() - submitted > time_limit * len(part_results):
+                del parts[input_tuple]
+                logger.info(f"Extraction timed out for file: {input_tuple[0]}")
+
+        while True:
+            try:
+                input_file, pid, started = starts.get_nowait()
+            except queue.Empty:
+                break
+            running[input_file] = (pid, started)
+            current[pid] = input_file
+
+        now = time.monotonic()
+        for input_file, (result, kind, size, budget) in list(pending.items()):
+            if result.ready():
+                del pending[input_file]
+                text, seconds = result.get()
+                status = 'ok' if text else 'empty'
+                if writer and text:
+                    writer.add(Path(input_file).stem, text)
+            elif input_file in running and now - running[input_file][1] > budget:
+                del pending[input_file]
+                pid, started = running[input_file]
+                seconds, status = now - started, 'timeout'
+                logger.info(f'Conversion timed out for file: {input_file} after its budget of {budget:.0f}s')
+                # The worker may have moved on if the result arrived in the meantime
+                if current.get(pid) == input_file and not result.ready():
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+            else:
+                continue
+            if memory is not None:
+                memory.release(input_file)
+            counts[status] += 1
+            if durations:
+                durations.add(input_file, kind, size, seconds, budget, status)
+        time.sleep(0.05)
+    logger.info(f'{counts["ok"]} files converted, {counts["empty"]} without text, {counts["timeout"]} timed out')
+
 def profiler_convert(input_tuples, count): 
-    for input_tuple in input_tuples[:count]:
-        convert_pdf_to_text(*input_tuple)
+    for input_file, thesis_preprocessing, output_dir, tool, features_dir in input_tuples[:count]:
+        convert_pdf_to_text(input_file, thesis_preprocessing, output_dir, tool=tool, features_dir=features_dir)
     
 def main():
     arg_parser = argparse.ArgumentParser(description='Extracts text from PDF files.')
-    arg_parser.add_argument('-p', '--path', type=str, help='The path to the PDF folder or file.', required=True)
-    arg_parser.add_argument('-o', '--output', type=str, help='The path to the output directory.', required=True)
+    arg_parser.add_argument('-p', '--path', type=str, help='The path to the PDF folder or file, or to the htm/ folder of resmigazete.py.', required=True)
+    arg_parser.add_argument('-o', '--output', type=str, help='The path to the output directory, unless --shards is given.')
     arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of threads to use.', default=4)
-    arg_parser.add_argument('-l', '--time_limit', type=int, help='The time limit for each conversion in seconds.', default=30)
+    arg_parser.add_argument('-l', '--time_limit', type=int, help='The time limit for each conversion in seconds, until the budgets are calibrated on earlier runs.', default=30)
+    arg_parser.add_argument('--min_time_limit', type=float, help='The smallest calibrated time budget in seconds.', default=5)
+    arg_parser.add_argument('--durations', type=str, help='Record the duration of every file in this SQLite file and calibrate the time budgets on it, empty to disable.', default='durations.sqlite')
     arg_parser.add_argument('-t', '--thesis_preprocessing',  action='store_true', help='Enable thesis preprocessing during conversion.')
     arg_parser.add_argument('-s', '--skip',  action='store_true', help='Skip files that already exist in the output directory.')
     arg_parser.add_argument('-d', '--detect_language',  action='store_true', help='Detect language and correct values.')
     arg_parser.add_argument('-i', '--profiler',  type=int, help='Enable profiler to measure performance of provided no. of files.', default=0)
+    arg_parser.add_argument('--tool', choices=list(BACKENDS), help='The PDF text extraction backend.', default='tika')
+    arg_parser.add_argument('--split_size', type=float, help='PDF files larger than this many megabytes are extracted in page ranges in parallel, 0 disables splitting.', default=2)
+    arg_parser.add_argument('--features', type=str, help='Also save the line features of every document to this directory for refilter.py.')
+    arg_parser.add_argument('--pages_per_part', type=int, help='The number of pages per range when splitting large PDF files.', default=50)
+    arg_parser.add_argument('--chunked_size', type=float, help='Files larger than this many megabytes are processed in windows with bounded memory, 0 disables the chunked mode.', default=32)
+    arg_parser.add_argument('--window_chars', type=int, help='The size of a window in the chunked mode in characters.', default=WINDOW_CHARS)
+    arg_parser.add_argument('--shards', type=str, help='Append the texts to compressed shards in this directory instead of writing a file per document.')
+    arg_parser.add_argument('--shard_size', type=float, help='The size of a shard in megabytes.', default=256)
+    arg_parser.add_argument('--dergipark', type=str, help='The Dergipark output directory holding metadata/, joined into the shard records.')
+    arg_parser.add_argument('--yok', type=str, help='The YÖK md.sqlite store or md.json export, joined into the shard records.')
+    add_memory_arguments(arg_parser)
     args = arg_parser.parse_args()
+    if not args.output and not args.shards:
+        arg_parser.error('one of -o/--output and --shards is required')
 
+    # A Resmi Gazete date directory is one document made of all the pages saved for that date
     input_path = Path(args.path)
-    if input_path.is_file() and (input_path.name.endswith('.pdf') or input_path.name.endswith('.txt')):
+    if (input_path.is_file() and input_path.name.lower().endswith(INPUT_SUFFIXES)) or is_gazette_directory(input_path):
         input_files = [input_path]
     elif input_path.is_dir():
-        input_files = [f for f in input_path.iterdir() if (f.name.endswith('.pdf') or f.name.endswith('.txt'))]
-
-    if args.skip: 
+        input_files = [f for f in input_path.iterdir() if f.name.lower().endswith(INPUT_SUFFIXES) or is_gazette_directory(f)]
+
+    if args.skip and args.shards:
+        if (Path(args.shards) / 'index.sqlite').exists():
+            reader = ShardReader(args.shards)
+            input_files = [input_file for input_file in input_files if reader.get_location(input_file.stem) is None]
+            reader.close()
+    elif args.skip: 
         output_files = [f.name.replace('_no_inline_citations.txt', '') for f in Path(args.output).iterdir()]
         input_files = [input_file for input_file in input_files if input_file.name.replace('.txt', '') not in output_files]
 
-    input_tuples = [(str(input_file), args.thesis_preprocessing, args.output) for input_file in input_files]
+    # With --shards the workers return the texts and this process appends them, so output_dir is None
+    output_dir = None if args.shards else args.output
+    input_tuples = [(str(input_file), args.thesis_preprocessing, output_dir, args.tool, args.features) for input_file in input_files]
 
     if args.profiler == 0:
-        with Pool(args.num_threads) as pool:
-            results = [pool.apply_async(wrapper_convert, (input_tuple,)) for input_tuple in input_tuples]
-            for r, input_file in zip(results, input_files):
-                try:
-                    r.get(timeout=args.time_limit)  
-                except context.TimeoutError:
-                    logger.info(f"Conversion timed out for file: {input_file}")
+        writer = ShardWriter(args.shards, int(args.shard_size * 2 ** 20), MetadataJoiner(args.dergipark, args.yok)) if args.shards else None
+        chunked = [input_tuple for input_tuple in input_tuples if args.chunked_size > 0 and input_size(input_tuple[0]) >= args.chunked_size * 2 ** 20]
+        input_tuples = [input_tuple for input_tuple in input_tuples if input_tuple not in chunked]
+        split = split_large_files(input_tuples, args.split_size, args.pages_per_part) if args.split_size > 0 else {}
+
+        durations = DurationLog(args.durations) if args.durations else None
+        model = CostModel(durations.rows() if durations else [])
+        if model.fits:
+            logger.info(f'Time budgets calibrated on earlier runs: {model.describe()}')
+        tasks = []
+        for input_tuple in chunked:
+            size = input_size(input_tuple[0])
+            # Until calibrated, the time limit applies to every window
+            tasks.append((wrapper_convert_chunked, input_tuple, (args.window_chars, args.pages_per_part), input_kind(input_tuple[0], 'chunked'),
+                          size, args.time_limit * math.ceil(size / args.window_chars)))
+        for input_tuple in input_tuples:
+            if input_tuple not in split:
+                tasks.append((wrapper_convert, input_tuple, (), input_kind(input_tuple[0]), input_size(input_tuple[0]), args.time_limit))
+        # The largest predicted cost first, so that long files do not end up as the tail of the batch; uncalibrated kinds by size
+        tasks.sort(key=lambda task: model.predict(task[3], task[4]) or task[4] / 2 ** 20, reverse=True)
+
+        # The language model is loaded before the workers are forked, so that neither they nor the ones
+        # replacing killed workers spend their budget on loading it
+        is_turkish_content('Bu cümle dil modelini yüklemek için kullanılır.')
+        starts = Queue()
+        with Pool(args.num_threads, initializer=set_start_queue, initargs=(starts,),
+                  maxtasksperchild=worker_limit(args.max_tasks_per_worker, args.max_worker_rss, logger)) as pool:
+            # The page ranges of large files are queued first, as they are converted only once all of them are extracted
+            parts = {input_tuple: [pool.apply_async(extract_range, (input_tuple[0], args.tool, pages)) for pages in ranges]
+                     for input_tuple, ranges in split.items()}
+            run_scheduled(pool, starts, tasks, parts, model, durations, writer, args.time_limit, args.min_time_limit,
+                          memory_budget(args), args.num_threads)
+        if durations:
+            durations.close()
+        if writer:
+            writer.close()
+            writer.joiner.close()
     else:
         with Profiler(interval=0.1) as profiler:
             profiler_convert(input_tuples, args.profiler)
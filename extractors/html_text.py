@@ -0,0 +1,130 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+
+HTML_SUFFIXES = ('.htm', '.html')
+
+# Tags whose start and end break the line, as a browser would start a new block
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'center', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption', 'figure',
+    'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tbody', 'thead', 'tfoot', 'tr', 'ul', 'body', 'html',
+}
+# Table cells are separated by a space, so that a row stays on one line
+CELL_TAGS = {'td', 'th'}
+SKIPPED_TAGS = {'script', 'style', 'title', 'noscript'}
+
+charset_pattern = re.compile(rb'charset\s*=\s*["\']?([A-Za-z0-9_-]+)', re.IGNORECASE)
+# Resmi Gazete dates are saved as htm/{YYYYMMDD}/
+gazette_date_pattern = re.compile(r'^\d{8}$')
+
+
+class TextExtractor(HTMLParser):
+    """
+    Collects the text of an HTML page as it is fed, with a line per block.
+
+    Whitespace is collapsed as a browser would, and block tags and <br> end the current line. Empty lines
+    are never written, so that the runs of empty lines the line filters treat as page breaks only come
+    from the separators between pages.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipping = 0
+        self.line_empty = True
+        self.space = False
+
+    def break_line(self):
+        if not self.line_empty:
+            self.parts.append('\n')
+            self.line_empty = True
+        self.space = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skipping += 1
+        elif tag in BLOCK_TAGS or tag == 'br':
+            self.break_line()
+        elif tag in CELL_TAGS:
+            self.space = True
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in BLOCK_TAGS:
+            self.break_line()
+
+    def handle_data(self, data):
+        if self.skipping or not data:
+            return
+        text = ' '.join(data.split())
+        if not text:
+            self.space = True
+            return
+        if (self.space or data[0].isspace()) and not self.line_empty:
+            self.parts.append(' ')
+        self.parts.append(text)
+        self.line_empty = False
+        self.space = data[-1].isspace()
+
+
+def detect_encoding(head):
+    """Returns the charset declared in the first bytes of a page, else UTF-8 if they decode as such, else Windows-1254."""
+    match = charset_pattern.search(head)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        # The older Resmi Gazete pages are Turkish Windows pages without a declared charset
+        return 'cp1254'
+
+
+def html_lines(path, chunk_size=1 << 16):
+    """Yields the lines of the text of an HTML file, reading and parsing it `chunk_size` bytes at a time."""
+    parser = TextExtractor()
+    pending = ''
+    with open(path, 'rb') as f:
+        chunk = f.read(chunk_size)
+        decoder = codecs.getincrementaldecoder(detect_encoding(chunk))(errors='replace')
+        while chunk:
+            parser.feed(decoder.decode(chunk))
+            *lines, pending = (pending + ''.join(parser.parts)).split('\n')
+            parser.parts.clear()
+            for line in lines:
+                yield line + '\n'
+            chunk = f.read(chunk_size)
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    parser.break_line()
+    yield from (line + '\n' for line in (pending + ''.join(parser.parts)).split('\n')[:-1])
+
+
+def html_to_text(path):
+    """Returns the text of an HTML file with a line per block."""
+    return ''.join(html_lines(path))
+
+
+def natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def gazette_pages(directory):
+    """
+    Returns the pages saved for a Resmi Gazete date by `resmigazete.py`: the page of the day first, then the
+    annex pages and PDFs it links to in their natural order, e.g. 20230101-2.htm before 20230101-10.htm.
+    """
+    directory = Path(directory)
+    pages = [page for page in directory.iterdir() if page.suffix.lower() in HTML_SUFFIXES + ('.pdf',)]
+    return sorted(pages, key=lambda page: (page.stem != directory.name, natural_key(page.name)))
+
+
+def is_gazette_directory(path):
+    path = Path(path)
+    return path.is_dir() and bool(gazette_date_pattern.match(path.name))
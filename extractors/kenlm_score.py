@@ -2,13 +2,18 @@ import kenlm
 import pandas as pd
 from transformers import PreTrainedTokenizerFast
 from normalize import preprocess_text
+from sentence_splitter import get_sentence_splitter
 import argparse
 from pathlib import Path
-from vnlp import SentenceSplitter
 from pyinstrument import Profiler
 from multiprocessing import Pool
+from memory import add_memory_arguments, imap_admitted, memory_budget, worker_limit
+from functools import partial
 import logging
 import langid
+import hashlib
+import sqlite3
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 level = logging.INFO
@@ -29,7 +34,6 @@ logger.addHandler(fh)
 
 tokenizer = PreTrainedTokenizerFast.from_pretrained('VBARTTokenizer')
 model=kenlm.Model("kenlm/tr_wiki_spiece_5gram.binary")
-sentence_splitter = SentenceSplitter()
 
 def is_turkish_content(text):
     """
@@ -48,25 +52,109 @@ def is_turkish_content(text):
     except:
         return False
 
-def split_score(file):
+class ScoreCache:
+    """
+    A per-worker LRU cache of sentence scores, keyed on a hash of the lowercased sentence with normalized whitespace.
+
+    Boilerplate such as ethics statements and keyword lines is tokenized and scored once per worker. With a
+    path, the scores are also kept in an SQLite database shared by the workers and by later runs.
+
+    Args:
+        max_size (int): The number of sentences kept in memory, 0 disables the cache.
+        path (str): The SQLite database of scores, if they should be persisted.
+    """
+
+    def __init__(self, max_size=100000, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.connection = None
+        self.pending = []
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    def connect(self):
+        # Opened in the worker that uses it, since SQLite connections cannot be shared across processes
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, token_count INTEGER NOT NULL, tokenized_line TEXT NOT NULL, lm_score REAL NOT NULL)')
+        return self.connection
+
+    @staticmethod
+    def key(sentence):
+        return hashlib.blake2b(' '.join(sentence.lower().split()).encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        """Returns the (token_count, tokenized_line, lm_score) of a sentence key, or None."""
+        if self.max_size == 0:
+            return None
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+        if self.path:
+            value = self.connect().execute('SELECT token_count, tokenized_line, lm_score FROM scores WHERE key = ?', (key,)).fetchone()
+            if value is not None:
+                self.stats['disk_hits'] += 1
+                self.add(key, value, persist=False)
+                return value
+        self.stats['misses'] += 1
+        return None
+
+    def add(self, key, value, persist=True):
+        if self.max_size == 0:
+            return
+        self.entries[key] = value
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        if self.path and persist:
+            self.pending.append((key, *value))
+
+    def flush(self):
+        """Writes the new scores to the database in one transaction."""
+        if self.pending:
+            with self.connect():
+                self.connection.executemany('INSERT OR IGNORE INTO scores VALUES (?, ?, ?, ?)', self.pending)
+            self.pending = []
+
+score_cache = ScoreCache()
+
+def configure_cache(max_size, path):
+    """Replaces the score cache of a worker, see `ScoreCache`."""
+    global score_cache
+    score_cache = ScoreCache(max_size, path)
+
+def score_sentence(sentence):
+    """Returns the token count, the tokenized sentence and the LM score of a sentence, from the cache if possible."""
+    key = ScoreCache.key(sentence)
+    value = score_cache.get(key)
+    if value is None:
+        lower_sentence = sentence.lower().strip()
+        tokens = tokenizer.tokenize(lower_sentence)
+        tokenized_sentence = " ".join(tokens)
+        value = (len(tokens), tokenized_sentence, model.score(tokenized_sentence, bos = True, eos = True))
+        score_cache.add(key, value)
+    return value
+
+def split_score(file, splitter='vnlp'):
 	logger.info(f'Scoring {file}')
 	with open(file, encoding="utf-8") as extracted_file:
 		text = extracted_file.read()
 	# text = preprocess_text(text)
-	sentences = sentence_splitter.split_sentences(text)
+	sentences = get_sentence_splitter(splitter).split_sentences(text)
 	df = pd.DataFrame()
 	for i, sentence in enumerate(sentences):
 		if len(sentence.split(" ")) > 3:
-			lower_sentence = sentence.lower().strip()
-			tokens = tokenizer.tokenize(lower_sentence)
-			tokenized_sentence = " ".join(tokens)
+			token_count, tokenized_sentence, lm_score = score_sentence(sentence)
 			df.loc[i, 'line'] = sentence
-			df.loc[i, 'token_count'] = len(tokens)
+			df.loc[i, 'token_count'] = token_count
 			df.loc[i, 'tokenized_line'] = tokenized_sentence
 			#df.loc[i, 'perplexity'] = model.perplexity(tokenized_sentence)
 			#df.loc[i, 'is_turkish'] = is_turkish_content(sentence)
-			df.loc[i, 'lm_score'] = model.score(tokenized_sentence, bos = True, eos = True)
+			df.loc[i, 'lm_score'] = lm_score
 			df.loc[i, 'lm_score_div'] = df.loc[i, 'lm_score'] / df.loc[i, 'token_count']
+	score_cache.flush()
 	
 	file_path = Path(file)
 
@@ -75,12 +163,23 @@ def split_score(file):
 
 	df.to_csv(scored_filename, encoding='utf-8', index=False)
 	logger.info(f'Finished scoring {file}, generated {str(scored_filename)}')
+	return scored_filename
+
+def split_score_with_stats(file, splitter='vnlp'):
+	"""Scores a file and returns how many of its sentences were found in the score cache."""
+	before = dict(score_cache.stats)
+	split_score(file, splitter)
+	return {name: count - before[name] for name, count in score_cache.stats.items()}
 
 def main():
 	arg_parser = argparse.ArgumentParser(description='Splits, normalizes and scores extracted text')
 	arg_parser.add_argument('-p', '--path', type=str, help='The path to the TXT folder or file.', required=True)
 	arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of threads to use.', default=4)
 	arg_parser.add_argument('-s', '--skip',  action='store_true', help='Skip files that already exist in the output directory.')
+	arg_parser.add_argument('--cache_size', type=int, help='The number of sentence scores each worker keeps in memory, 0 disables the cache.', default=100000)
+	arg_parser.add_argument('--cache_path', type=str, help='Also keep the sentence scores in this SQLite file, shared by the workers and later runs.')
+	arg_parser.add_argument('--splitter', choices=['vnlp', 'rule'], help='The sentence splitter: vnlp, or the faster rule-based one in sentence_splitter.py.', default='vnlp')
+	add_memory_arguments(arg_parser)
 	args = arg_parser.parse_args()
 
 	input_path = Path(args.path)
@@ -97,8 +196,17 @@ def main():
 		input_files = [str(input_file) for input_file in input_files if Path(input_file).name not in output_files]
 
 	logger.info(f'{len(input_files)} will be processed with {args.num_threads} threads')
-	with Pool(args.num_threads) as pool:
-		pool.map(split_score, input_files)
+	totals = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+	# A replaced worker starts with an empty in-memory score cache, the --cache_path scores are kept
+	with Pool(args.num_threads, initializer=configure_cache, initargs=(args.cache_size, args.cache_path),
+			  maxtasksperchild=worker_limit(args.max_tasks_per_worker, args.max_worker_rss, logger)) as pool:
+		for stats in imap_admitted(pool, partial(split_score_with_stats, splitter=args.splitter), input_files, memory_budget(args), args.num_threads):
+			for name, count in stats.items():
+				totals[name] += count
+
+	lookups = sum(totals.values())
+	logger.info(f'Score cache: {totals["hits"]} memory hits, {totals["disk_hits"]} disk hits and {totals["misses"]} misses, '
+				f'hit rate {(totals["hits"] + totals["disk_hits"]) / max(lookups, 1):.1%}')
 
 	"""with Profiler(interval=0.1) as profiler:
 		for file in input_files:
@@ -0,0 +1,209 @@
+import argparse
+import json
+import logging
+import math
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from shards import MetadataJoiner, ShardWriter, dergipark_name_pattern
+
+logger = logging.getLogger(__name__)
+
+
+class QuantileSketch:
+    """
+    A mergeable KLL quantile sketch with bounded memory.
+
+    Values are kept in levels of compactors: an item at level h stands for 2**h values. A full level is
+    sorted and every other item, starting at a random offset, moves up a level. The sketch keeps
+    O(k) items, and the rank error of a quantile is about 1.7 / k of the number of values.
+
+    Args:
+        k (int): The size of the top compactor; larger is more accurate.
+        seed (int): The seed of the compaction offsets.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.count = 0
+
+    def capacity(self, level):
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.count += len(values)
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays, so the total weight is unchanged
+                kept, items = (items[-1:], items[:-1]) if len(items) % 2 else (items[:0], items)
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.rng.integers(2)::2]])
+                self.levels[level] = kept
+                # Adding a level lowers the capacities of the ones below it
+                level = 0
+            else:
+                level += 1
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.compress()
+
+    def quantile(self, q):
+        """Returns the value with about q * count values below it, or None if the sketch is empty."""
+        if self.count == 0:
+            return None
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items)
+        cumulative = np.cumsum(weights[order])
+        return float(items[order][min(np.searchsorted(cumulative, q * cumulative[-1]), len(items) - 1)])
+
+    def to_dict(self):
+        return {'k': self.k, 'count': self.count, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d['k'])
+        sketch.levels = [np.array(items, dtype=float) for items in d['levels']]
+        sketch.count = d['count']
+        return sketch
+
+
+def document_id(path):
+    return Path(path).name.replace('_scored.csv', '')
+
+
+def document_groups(doc_id):
+    """Returns the sketch keys a document counts towards: overall, its source and, for Dergipark, its journal."""
+    match = dergipark_name_pattern.match(doc_id)
+    if match:
+        return ['all', 'source:dergipark', f'journal:{match.group(1)}']
+    return ['all', 'source:yok' if doc_id.isdigit() else 'source:other']
+
+
+def read_scores(path, columns):
+    try:
+        return pd.read_csv(path, usecols=columns)
+    except (ValueError, pd.errors.EmptyDataError):
+        # Documents without scored sentences are written as empty CSVs
+        return pd.DataFrame(columns=columns)
+
+
+def sketch_files(files, k=200):
+    """The first pass over a batch of scored CSVs: returns the sketches of `lm_score_div` by group."""
+    sketches = {}
+    for file in files:
+        scores = read_scores(file, ['lm_score_div'])['lm_score_div']
+        for group in document_groups(document_id(file)):
+            sketches.setdefault(group, QuantileSketch(k)).update(scores)
+    return sketches
+
+
+def compute_thresholds(sketches, percentile, by='journal', min_count=1000):
+    """
+    Returns the `percentile` of `lm_score_div` of every group.
+
+    With `by='journal'` every journal gets its own threshold, and journals with fewer than `min_count`
+    sentences use the threshold of their source. With `by='source'` every source gets one threshold.
+    """
+    thresholds = {}
+    for group, sketch in sketches.items():
+        kind = group.split(':')[0]
+        if group == 'all' or kind == 'source' or (kind == 'journal' and by == 'journal' and sketch.count >= min_count):
+            thresholds[group] = sketch.quantile(percentile / 100)
+    return thresholds
+
+
+def document_threshold(doc_id, thresholds, by):
+    """Returns the threshold of the most specific group of a document that has one."""
+    groups = document_groups(doc_id)
+    groups = groups if by == 'journal' else groups[:2] if by == 'source' else groups[:1]
+    return next(thresholds[group] for group in reversed(groups) if thresholds.get(group) is not None)
+
+
+def filter_file(file, thresholds, by):
+    """The second pass over a scored CSV: returns the document id, its kept sentences in order and its sentence count."""
+    doc_id = document_id(file)
+    df = read_scores(file, ['line', 'lm_score_div'])
+    threshold = document_threshold(doc_id, thresholds, by)
+    return doc_id, df.loc[df['lm_score_div'] >= threshold, 'line'].tolist(), len(df)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    arg_parser = argparse.ArgumentParser(description='Computes KenLM score thresholds with streaming quantile sketches and keeps the sentences above them.')
+    arg_parser.add_argument('-p', '--path', type=str, help='The scored_csv folder written by kenlm_score.py.', required=True)
+    arg_parser.add_argument('-o', '--output', type=str, help='The shard directory for the kept sentences.')
+    arg_parser.add_argument('-q', '--percentile', type=float, help='Drop the sentences below this percentile of lm_score_div.', default=30)
+    arg_parser.add_argument('-b', '--by', choices=['journal', 'source', 'all'], help='The group each threshold is computed over.', default='journal')
+    arg_parser.add_argument('-m', '--min_count', type=int, help='Journals with fewer sentences use the threshold of their source.', default=1000)
+    arg_parser.add_argument('-t', '--thresholds', type=str, help='Write the thresholds and sentence counts to this JSON file.', default='lm_thresholds.json')
+    arg_parser.add_argument('-s', '--sketches', type=str, help='Also write the sketches to this JSON file, to merge with later runs.')
+    arg_parser.add_argument('-i', '--previous_sketches', type=str, help='Merge the sketches written by an earlier run on other documents.')
+    arg_parser.add_argument('-k', '--sketch_size', type=int, help='The size of the quantile sketches.', default=200)
+    arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of processes to use.', default=4)
+    arg_parser.add_argument('--dergipark', type=str, help='The Dergipark output directory holding metadata/, joined into the shard records.')
+    arg_parser.add_argument('--yok', type=str, help='The YÖK md.sqlite store or md.json export, joined into the shard records.')
+    args = arg_parser.parse_args()
+
+    files = sorted(Path(args.path).glob('*_scored.csv'))
+    batches = [(files[i:i + 64], args.sketch_size) for i in range(0, len(files), 64)]
+    logger.info(f'Sketching the scores of {len(files)} documents')
+    sketches = {}
+    with Pool(args.num_threads) as pool:
+        for batch_sketches in pool.starmap(sketch_files, batches):
+            for group, sketch in batch_sketches.items():
+                sketches.setdefault(group, QuantileSketch(args.sketch_size)).merge(sketch)
+
+    if args.previous_sketches:
+        with open(args.previous_sketches, encoding='utf-8') as f:
+            for group, d in json.load(f).items():
+                sketches.setdefault(group, QuantileSketch(args.sketch_size)).merge(QuantileSketch.from_dict(d))
+
+    thresholds = compute_thresholds(sketches, args.percentile, args.by, args.min_count)
+    with open(args.thresholds, 'w', encoding='utf-8') as f:
+        json.dump({'percentile': args.percentile, 'by': args.by, 'thresholds': thresholds,
+                   'counts': {group: sketch.count for group, sketch in sketches.items()}}, f, ensure_ascii=False, indent=4)
+    logger.info(f'{len(thresholds)} thresholds written to {args.thresholds}, overall {thresholds.get("all")}')
+    if args.sketches:
+        with open(args.sketches, 'w', encoding='utf-8') as f:
+            json.dump({group: sketch.to_dict() for group, sketch in sketches.items()}, f)
+
+    if not args.output or thresholds.get('all') is None:
+        return
+    writer = ShardWriter(args.output, joiner=MetadataJoiner(args.dergipark, args.yok))
+    kept = total = 0
+    with Pool(args.num_threads) as pool:
+        # imap keeps the order of the files, so the shards are written in document order
+        for doc_id, sentences, count in pool.imap(partial(filter_file, thresholds=thresholds, by=args.by), files, chunksize=16):
+            kept += len(sentences)
+            total += count
+            if sentences:
+                writer.add(doc_id, '\n'.join(sentences), sentences=len(sentences), scored_sentences=count)
+    writer.close()
+    writer.joiner.close()
+    logger.info(f'{kept} of {total} sentences kept in {args.output}')
+
+
+if __name__ == '__main__':
+    main()
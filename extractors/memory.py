@@ -0,0 +1,215 @@
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+from multiprocessing.pool import worker
+from pathlib import Path
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Filtering a whole document took about 64 MB of worker memory per MB of text in our measurements
+MEMORY_PER_MB = 64
+# PDFs are estimated from the text they hold, a rough share of their size
+PDF_TEXT_RATIO = 0.25
+
+
+def current_rss():
+    """Returns the resident memory of this process in bytes, or its peak where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def physical_memory():
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class WorkerLimit(int):
+    """
+    A `maxtasksperchild` for `multiprocessing.Pool` that also retires a worker once its resident memory
+    exceeds a ceiling, so that the memory fragmentation of large documents does not build up for hours.
+
+    This depends on CPython's `multiprocessing.pool.worker`, which tests `completed < maxtasks` after it has
+    sent the result of every task; Python calls the reflected `__gt__` of the int subclass for it. The worker
+    then exits between two tasks and the pool starts a fresh one in its place. As this hooks a private part
+    of the standard library, the ceiling is opt-in (`--max_worker_rss`); without it the pools get a plain
+    `maxtasksperchild`. `worker_limit` checks that the running Python still behaves so before it uses the
+    ceiling, and `python memory.py` checks that a real pool replaces its worker.
+
+    Args:
+        max_tasks (int): The number of tasks after which a worker is replaced, 0 for no limit.
+        max_rss_mb (float): The resident memory in megabytes above which a worker is replaced, 0 for no limit.
+        log (Logger): The logger the replacements are reported on.
+    """
+
+    def __new__(cls, max_tasks=0, max_rss_mb=0, log=None):
+        limit = super().__new__(cls, max_tasks or sys.maxsize)
+        limit.max_rss = int(max_rss_mb * 2 ** 20)
+        limit.log = log or logger
+        return limit
+
+    def __gt__(self, completed):
+        if completed >= int(self):
+            return False
+        if self.max_rss and completed:
+            rss = current_rss()
+            if rss > self.max_rss:
+                self.log.info(f'Worker {os.getpid()} is replaced after {completed} tasks at {rss / 2 ** 20:.0f} MB')
+                return False
+        return True
+
+
+def recycling_supported():
+    """
+    Returns True if the pool worker loop of this Python ends a worker when a `WorkerLimit` says so. The loop is
+    run in this process on three tasks, with a ceiling that any process exceeds, and must stop after the first.
+    """
+    tasks = [(0, i, int, (), {}) for i in range(3)] + [None]
+    results = []
+    queue = SimpleNamespace(get=lambda: tasks.pop(0), put=results.append)
+    silent = logging.getLogger(f'{__name__}.check')
+    silent.propagate = False
+    limit = WorkerLimit(0, 0, silent)
+    limit.max_rss = 1
+    try:
+        worker(queue, queue, maxtasks=limit)
+    except Exception:
+        return False
+    return len(results) == 1
+
+
+def worker_limit(max_tasks, max_rss_mb, log=None):
+    """Returns the `maxtasksperchild` of the pools, None if workers are never replaced."""
+    log = log or logger
+    if max_rss_mb and not recycling_supported():
+        log.warning(f'The pool workers of Python {sys.version.split()[0]} cannot be replaced by their memory, '
+                    '--max_worker_rss is ignored')
+        max_rss_mb = 0
+    if not max_rss_mb:
+        return max_tasks or None
+    if current_rss() > max_rss_mb * 2 ** 20:
+        log.warning(f'The worker memory ceiling of {max_rss_mb:.0f} MB is below the {current_rss() / 2 ** 20:.0f} MB of a fresh worker, '
+                    'so every worker is replaced after each task')
+    return WorkerLimit(max_tasks, max_rss_mb, log)
+
+
+class MemoryBudget:
+    """
+    Admission control for a pool: the inputs in progress are charged an estimate of the worker memory they
+    take, and an input is only started while the estimates fit in the budget. The first input is always
+    admitted, so that an input larger than the whole budget runs, alone.
+
+    Args:
+        budget_mb (float): The memory the inputs in progress may take together, in megabytes.
+        memory_per_mb (float): The estimated worker memory per megabyte of text.
+    """
+
+    def __init__(self, budget_mb, memory_per_mb=MEMORY_PER_MB):
+        self.budget = budget_mb * 2 ** 20
+        self.memory_per_mb = memory_per_mb
+        self.reserved = {}
+
+    def estimate(self, size, kind=None):
+        """Returns the estimated worker memory of an input of `size` bytes, e.g. of kind 'pdf' (see `scheduling.input_kind`)."""
+        if kind and kind.startswith('pdf'):
+            size *= PDF_TEXT_RATIO
+        return size * self.memory_per_mb
+
+    @property
+    def used(self):
+        return sum(self.reserved.values())
+
+    def fits(self, estimate):
+        return not self.reserved or self.used + estimate <= self.budget
+
+    def reserve(self, key, estimate):
+        self.reserved[key] = estimate
+
+    def release(self, key):
+        self.reserved.pop(key, None)
+
+
+def imap_admitted(pool, function, items, budget=None, slots=1, size=os.path.getsize):
+    """
+    Yields the results of `function` on `items` in completion order like `pool.imap_unordered`, but submits an
+    item only when `budget` admits it and fewer than `slots` items are in progress. Items that do not fit are
+    held back while smaller ones behind them go ahead.
+
+    Args:
+        budget (MemoryBudget): The admission control, None submits every item at once.
+        slots (int): The number of items in progress at once, usually the number of workers.
+        size (callable): Returns the size of an item in bytes.
+    """
+    if budget is None:
+        yield from pool.imap_unordered(function, items)
+        return
+
+    backlog = [(key, item, budget.estimate(size(item), Path(item).suffix.lower().lstrip('.'))) for key, item in enumerate(items)]
+    pending = []
+    while backlog or pending:
+        for entry in list(backlog):
+            if len(pending) >= slots:
+                break
+            key, item, estimate = entry
+            if budget.fits(estimate):
+                backlog.remove(entry)
+                budget.reserve(key, estimate)
+                pending.append((key, pool.apply_async(function, (item,))))
+        for entry in list(pending):
+            key, result = entry
+            if result.ready():
+                pending.remove(entry)
+                budget.release(key)
+                yield result.get()
+        time.sleep(0.05)
+
+
+def add_memory_arguments(arg_parser):
+    arg_parser.add_argument('--max_tasks_per_worker', type=int, help='Replace a worker after this many files, 0 for no limit.', default=0)
+    arg_parser.add_argument('--max_worker_rss', type=float, help='Replace a worker after a file once its resident memory exceeds this many megabytes, '
+                                                                 'e.g. 2048. Off by default.', default=0)
+    arg_parser.add_argument('--memory_budget', type=float, help='Hold back large files while the estimated memory of the files in progress is near this many megabytes, '
+                                                                '0 disables it. Defaults to three quarters of the physical memory.')
+    arg_parser.add_argument('--memory_per_mb', type=float, help='The estimated worker memory per megabyte of text, for --memory_budget.', default=MEMORY_PER_MB)
+
+
+def memory_budget(args):
+    """Returns the `MemoryBudget` of the parsed `add_memory_arguments`, None if it is disabled."""
+    budget_mb = args.memory_budget if args.memory_budget is not None else physical_memory() * 0.75 / 2 ** 20
+    return MemoryBudget(budget_mb, args.memory_per_mb) if budget_mb > 0 else None
+
+
+def allocate(megabytes):
+    """A pool task for the check below: keeps `megabytes` allocated in the worker and returns its pid."""
+    allocate.kept = bytearray(int(megabytes * 2 ** 20))
+    return os.getpid()
+
+
+def main():
+    """Checks that a pool with a memory ceiling replaces a worker that exceeds it, and keeps one that does not."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ceiling = current_rss() / 2 ** 20 + 100
+    with Pool(1, maxtasksperchild=worker_limit(0, ceiling)) as pool:
+        small = [pool.apply(allocate, (1,)) for _ in range(3)]
+        large = [pool.apply(allocate, (200,)) for _ in range(3)]
+    ok = recycling_supported() and len(set(small)) == 1 and len(set(large)) == 3
+    print(f'Python {sys.version.split()[0]}: worker recycling {"works" if ok else "does NOT work"} '
+          f'({len(set(small))} worker for the small tasks, {len(set(large))} for the large ones)')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
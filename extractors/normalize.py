@@ -70,26 +70,24 @@ replacement_dict = {'“': '"',
  "§": "ğ"                   
 }
 
-def find_invalid_chars(files):
-    invalid_dict = {}
-    example_dict = {}
-    for file in files:
-        text = open(str(file), encoding="utf-8").read()
-        for i, c in enumerate(text):
-            if c not in valid_chars:
-                if c in invalid_dict:
-                    invalid_dict[c] += 1
-                    if len(example_dict[c]) < 10 and invalid_dict[c] > 500:
-                        example_dict[c].append((str(text[i-10:i+10]), str(file)))
-                else:
-                    invalid_dict[c] = 1
-                    example_dict[c] = [(str(text[i-10:i+10]), str(file))]
-    invalid_dict = sorted(invalid_dict.items(), key=lambda x:x[1], reverse=True)
-    print(invalid_dict)
-    print(example_dict)
-    return invalid_dict, example_dict
+def find_invalid_chars(files, num_workers=4):
+    """
+    Counts the characters outside `valid_chars` in the files, see char_histogram.py for the full report.
+
+    Returns:
+        tuple: The (character, count) pairs, most frequent first, and up to 10 (context, file) examples per character.
+    """
+    from char_histogram import histogram_files_parallel
+    histogram = histogram_files_parallel(list(files), num_workers)
+    return histogram.invalid_counts(), histogram.examples
 
 def preprocess_text(line):
     for key, value in replacement_dict.items():
         line = line.strip().replace(key, value)
     return line
+
+def replace_characters(text):
+    """`preprocess_text` without stripping, for parts of a document whose edges are not its ends."""
+    for key, value in replacement_dict.items():
+        text = text.replace(key, value)
+    return text
@@ -1,27 +1,97 @@
 import logging
+import re
+import tempfile
+from contextlib import nullcontext
+from functools import partial
 from tika import parser
 from multiprocessing import Pool
 from argparse import ArgumentParser
 from pathlib import Path
+from memory import add_memory_arguments, imap_admitted, memory_budget, worker_limit
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
-def parse_file(file_path, output_dir):
+# Pages are joined with a run of empty lines, which the page-aware preprocessing treats as a page break
+PAGE_SEPARATOR = '\n' * 6
+
+def tika_pages(file_path, pages=None):
+    """Extracts the text of a PDF, or of a range of its pages, through the Tika server, as a single page."""
+    if pages is None:
+        return [parser.from_file(str(file_path))['content'] or '']
+
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(str(file_path))
+    writer = PdfWriter()
+    for i in pages:
+        writer.add_page(reader.pages[i])
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as part:
+        writer.write(part)
+        part.flush()
+        return [parser.from_file(part.name)['content'] or '']
+
+def tika_xhtml_pages(file_path):
+    """
+    Extracts the text of every page of a PDF through the Tika server, from the `<div class="page">` elements of its XHTML.
+
+    Only the OCR triage uses it: the text differs in its whitespace from the plain text the filters were tuned on.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(parser.from_file(str(file_path), xmlContent=True)['content'] or '', 'html.parser')
+    return [page.get_text() for page in soup.find_all('div', class_='page')]
+
+def pypdf_pages(file_path, pages=None):
+    """Extracts the text of every page of a PDF, or of the given pages, in-process with pypdf."""
+    from pypdf import PdfReader
+    reader = PdfReader(str(file_path))
+    return [reader.pages[i].extract_text() or '' for i in (pages if pages is not None else range(len(reader.pages)))]
+
+def pymupdf_pages(file_path, pages=None):
+    """Extracts the text of every page of a PDF, or of the given pages, in-process with PyMuPDF."""
+    import fitz
+    with fitz.open(str(file_path)) as document:
+        return [document[i].get_text() for i in (pages if pages is not None else range(len(document)))]
+
+# Text extraction backends: each one maps a PDF path and optional 0-based page indices to the list of page texts
+BACKENDS = {
+    'tika': tika_pages,
+    'pypdf': pypdf_pages,
+    'pymupdf': pymupdf_pages,
+}
+
+def extract_text(file_path, tool='tika', pages=None):
+    """
+    Extracts the text of a PDF file with the given backend.
+
+    Args:
+        file_path (str or Path): The path to the PDF file.
+        tool (str): The name of a backend in `BACKENDS`.
+        pages (range): The 0-based indices of the pages to extract, all pages if None.
+
+    Returns:
+        str: The page texts joined with `PAGE_SEPARATOR`.
+    """
+    return PAGE_SEPARATOR.join(BACKENDS[tool](file_path, pages))
+
+def page_count(file_path):
+    from pypdf import PdfReader
+    return len(PdfReader(str(file_path)).pages)
+
+def page_ranges(file_path, pages_per_part):
+    """Splits the pages of a PDF file into consecutive ranges of at most `pages_per_part` pages."""
+    count = page_count(file_path)
+    return [range(start, min(start + pages_per_part, count)) for start in range(0, count, pages_per_part)]
+
+def parse_file(file_path, output_dir, tool='tika'):
     """
     Extracts text content from a PDF file and writes it to a text file.
 
     Args:
         file_path (Path): The path to the input PDF file.
         output_dir (Path): The output folder path where the text file will be saved.
+        tool (str): The name of the extraction backend.
     """
     try:
-        content = parser.from_file(str(file_path))['content']
+        content = extract_text(file_path, tool)
         logger.info(f"Parsing: {file_path}")
         with open(output_dir / f'{file_path.stem}.txt', 'w', encoding='utf-8') as f:
             f.write(content)
@@ -30,18 +100,116 @@ def parse_file(file_path, output_dir):
 
 def parse_scanned_file(file_path, output_dir):
     try:
+        from unstructured.partition.pdf import partition_pdf
+        from unstructured.staging.base import convert_to_dataframe
         elements = partition_pdf(str(file_path), strategy="fast")
         df = convert_to_dataframe(elements)
         df.to_csv(output_dir / f'{file_path.stem}.csv')
     except Exception as e:
         logger.error(f"Error while parsing {file_path}: {e}")
-        
+
+# A page needs OCR if its text layer has fewer letters than this, or mostly non-letters
+MIN_PAGE_LETTERS = 20
+MIN_LETTER_RATIO = 0.5
+unmapped_glyph_pattern = re.compile(r'\(cid:\d+\)|\ufffd')
+
+def is_scanned_page(text):
+    """
+    Checks whether a page has no usable text layer: it is empty, nearly empty, or made of unmapped glyphs and symbols.
+
+    Args:
+        text (str): The text extracted from the page.
+
+    Returns:
+        bool: True if the page should be OCRed.
+    """
+    text = unmapped_glyph_pattern.sub('', text)
+    letters = sum(c.isalpha() for c in text)
+    visible = sum(not c.isspace() for c in text)
+    return letters < MIN_PAGE_LETTERS or letters / visible < MIN_LETTER_RATIO
+
+def triage_file(file_path, tool='tika'):
+    """
+    Extracts the text layer of a PDF file and finds the pages that need OCR.
+
+    Args:
+        file_path (Path): The path to the input PDF file.
+        tool (str): The name of the extraction backend.
+
+    Returns:
+        tuple: The file path, the list of page texts (None on failure) and the indices of the pages that need OCR.
+    """
+    try:
+        # Tika returns the plain text of a document as one page, its XHTML has the pages
+        pages = tika_xhtml_pages(file_path) if tool == 'tika' else BACKENDS[tool](file_path)
+        scanned = [i for i, page in enumerate(pages) if is_scanned_page(page)]
+        logger.info(f"Parsing: {file_path}")
+        return file_path, pages, scanned
+    except Exception as e:
+        logger.error(f"Error while parsing {file_path}: {e}")
+        return file_path, None, []
+
+def ocr_page(file_path, page_number, language='tur', time_limit=120):
+    """
+    Renders one page of a PDF file and runs Tesseract on it.
+
+    Args:
+        file_path (Path): The path to the PDF file.
+        page_number (int): The 1-based page number.
+        language (str): The Tesseract language code.
+        time_limit (int): The time limit in seconds for rendering and for recognition.
+
+    Returns:
+        str: The recognized text, or an empty string if OCR failed or timed out.
+    """
+    try:
+        import pytesseract
+        from pdf2image import convert_from_path
+        images = convert_from_path(str(file_path), dpi=300, first_page=page_number, last_page=page_number, timeout=time_limit)
+        return pytesseract.image_to_string(images[0], lang=language, timeout=time_limit)
+    except Exception as e:
+        logger.error(f"Error during OCR of page {page_number} of {file_path}: {e}")
+        return ''
+
+def write_pages(file_path, pages, output_dir):
+    with open(output_dir / f'{file_path.stem}.txt', 'w', encoding='utf-8') as f:
+        f.write(PAGE_SEPARATOR.join(pages))
+
+def write_ocr_results(ocr_jobs, output_dir, wait=False):
+    """
+    Stitches the OCR text into the documents whose pages are all recognized and writes them.
+
+    Args:
+        ocr_jobs (list): (file path, page texts, {page index: AsyncResult}) tuples; finished ones are removed.
+        output_dir (Path): The output folder.
+        wait (bool): Wait for the remaining OCR tasks.
+    """
+    for job in list(ocr_jobs):
+        file_path, pages, results = job
+        if not wait and not all(result.ready() for result in results.values()):
+            continue
+        for i, result in results.items():
+            pages[i] = result.get() or pages[i]
+        write_pages(file_path, pages, output_dir)
+        logger.info(f"OCR finished: {file_path}")
+        ocr_jobs.remove(job)
+
 def main():
+    # Configure logging here, so that importing the backends does not configure the importer's logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
     arg_parser = ArgumentParser(description='Performs OCR on PDF files in the given path.')
     arg_parser.add_argument('-i', '--input', type=str, help='The path to the PDF folder.', required=True)
     arg_parser.add_argument('-o', '--output', type=str, help='The output folder.')
     arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of threads to use.', default=4)
-    arg_parser.add_argument('-t', '--tool', choices=['tika', 'unstructured'], help='The tool to use.', default='tika')
+    arg_parser.add_argument('-t', '--tool', choices=list(BACKENDS) + ['unstructured'], help='The tool to use.', default='tika')
+    arg_parser.add_argument('--ocr_threads', type=int, help='The number of OCR processes for pages without a text layer, 0 disables OCR.', default=1)
+    arg_parser.add_argument('--ocr_time_limit', type=int, help='The time limit in seconds for rendering and recognizing one page.', default=120)
+    arg_parser.add_argument('--ocr_language', type=str, help='The Tesseract language code.', default='tur')
+    add_memory_arguments(arg_parser)
     args = arg_parser.parse_args()
 
     input_dir = Path(args.input)
@@ -51,10 +219,33 @@ def main():
     logger.info(f"Input directory: {input_dir}")
     logger.info(f"Output directory: {output_dir}")
     logger.info(f"Number of threads: {args.num_threads}")
+    logger.info(f"Tool: {args.tool}")
+
+    recycling = worker_limit(args.max_tasks_per_worker, args.max_worker_rss)
+    if args.tool == 'unstructured':
+        with Pool(args.num_threads, maxtasksperchild=recycling) as pool:
+            pool.starmap(parse_scanned_file, [(file_path, output_dir) for file_path in input_dir.iterdir()])
+        return
+
+    logger.info(f"Number of OCR threads: {args.ocr_threads}")
 
-    with Pool(args.num_threads) as pool:
-        parse_fn = parse_file if args.tool == 'tika' else parse_scanned_file
-        pool.starmap(parse_fn, [(file_path, output_dir) for file_path in input_dir.iterdir()])
+    # Scanned pages go to a separate pool, so slow OCR never holds up the text-layer extraction
+    with Pool(args.num_threads, maxtasksperchild=recycling) as pool, \
+         (Pool(args.ocr_threads, maxtasksperchild=recycling) if args.ocr_threads > 0 else nullcontext()) as ocr_pool:
+        ocr_jobs = []
+        # Large files are held back while the estimated memory of the files in progress is near the budget
+        for file_path, pages, scanned in imap_admitted(pool, partial(triage_file, tool=args.tool), list(input_dir.iterdir()),
+                                                        memory_budget(args), args.num_threads):
+            if pages is None:
+                continue
+            if scanned and ocr_pool is not None:
+                logger.info(f"{len(scanned)} of {len(pages)} pages need OCR: {file_path}")
+                ocr_jobs.append((file_path, pages, {i: ocr_pool.apply_async(ocr_page, (file_path, i + 1, args.ocr_language, args.ocr_time_limit))
+                                                    for i in scanned}))
+            else:
+                write_pages(file_path, pages, output_dir)
+            write_ocr_results(ocr_jobs, output_dir)
+        write_ocr_results(ocr_jobs, output_dir, wait=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,334 @@
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from argparse import ArgumentParser
+from functools import partial
+from multiprocessing import Pool, Queue
+from pathlib import Path
+
+from parallel_parser import BACKENDS, extract_text
+
+logger = logging.getLogger(__name__)
+
+
+class TraceLog:
+    """
+    A JSON lines log of the events of every document, e.g. {"time": ..., "doc": "123", "stage": "extract", "event": "finished", "seconds": 4.2}.
+
+    Events: `found` and `skipped` by the watcher, `started`, `finished`, `dropped`, `failed` and `timeout` by the stages.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def __call__(self, doc, stage, event, **details):
+        record = {'time': round(time.time(), 3), 'doc': doc, 'stage': stage, 'event': event, **details}
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def document_history(trace_path, doc):
+    """Returns the trace events of a document in the order they were logged."""
+    with open(trace_path, encoding='utf-8') as f:
+        return [record for record in map(json.loads, f) if record['doc'] == doc]
+
+
+# Set in every pool worker by the initializer, so that a stage knows which worker runs a document and since when
+task_starts = None
+
+
+def set_task_starts(starts):
+    global task_starts
+    task_starts = starts
+
+
+def run_task(function, args, doc):
+    """Runs a stage function in a pool worker after announcing its start, and reports how long it took and where."""
+    task_starts.put((doc, os.getpid(), time.monotonic()))
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start, os.getpid()
+
+
+class Stage:
+    """
+    A pool of worker processes fed from a bounded queue.
+
+    At most `num_workers` documents are handed to the pool at a time, and a result is put on the next
+    stage's queue before its slot is freed. A stage that falls behind fills its queue, which blocks
+    the stage before it, back to the watcher that finds new files. The results are forwarded by a thread
+    of the stage, so that a full queue downstream does not block the result handler of the pool.
+
+    The time limit of a document counts from the moment a worker starts it. A worker that runs over it,
+    e.g. on a stuck Tika call, is killed and replaced by the pool.
+
+    Args:
+        name (str): The stage name in the trace log.
+        function (callable): Maps the arguments of a document to the arguments of the next stage, or None to stop there.
+        num_workers (int): The number of processes.
+        queue_size (int): The number of documents that can wait for this stage.
+        time_limit (float): Documents that take longer are logged as timed out, their worker is killed and their slot is freed.
+        trace (TraceLog): The trace log.
+    """
+
+    def __init__(self, name, function, num_workers, queue_size, time_limit, trace):
+        self.name = name
+        self.function = function
+        self.num_workers = num_workers
+        self.time_limit = time_limit
+        self.trace = trace
+        self.queue = queue.Queue(queue_size)
+        self.next = None
+        self.starts = Queue()
+        self.pool = Pool(num_workers, initializer=set_task_starts, initargs=(self.starts,))
+        self.slots = threading.Semaphore(num_workers)
+        # The async results of the documents in progress, the pid and start time of those a worker has started, and the
+        # document each worker started last
+        self.running = {}
+        self.workers = {}
+        self.current = {}
+        self.lock = threading.Lock()
+        self.outputs = queue.Queue()
+        self.counts = {'finished': 0, 'dropped': 0, 'failed': 0, 'timeout': 0}
+        self.thread = threading.Thread(target=self.dispatch, name=name, daemon=True)
+        self.forwarder = threading.Thread(target=self.forward, name=f'{name}-forward', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.forwarder.start()
+
+    def dispatch(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            doc, args = item
+            self.slots.acquire()
+            self.trace(doc, self.name, 'started', waiting=self.queue.qsize())
+            with self.lock:
+                self.running[doc] = self.pool.apply_async(run_task, (self.function, args, doc),
+                                                          callback=partial(self.finish, doc), error_callback=partial(self.fail, doc))
+        # Wait for the documents in progress before telling the next stage that nothing more is coming
+        for _ in range(self.num_workers):
+            self.slots.acquire()
+        self.outputs.put(None)
+
+    def forward(self):
+        """Puts the results on the next stage's queue, and only then frees their slots."""
+        while True:
+            item = self.outputs.get()
+            if item is None:
+                break
+            doc, output = item
+            if self.next:
+                self.next.queue.put((doc, output))
+            self.release(doc, 'finished')
+        if self.next:
+            self.next.queue.put(None)
+
+    def release(self, doc, event):
+        """Frees the slot of a document, unless it was already freed because the document timed out."""
+        with self.lock:
+            if self.running.pop(doc, None) is None:
+                return False
+            self.workers.pop(doc, None)
+            self.counts[event] += 1
+        self.slots.release()
+        return True
+
+    def finish(self, doc, result):
+        output, seconds, pid = result
+        # Waits for `dispatch` to record the document, and ignores documents that already timed out
+        with self.lock:
+            if doc not in self.running:
+                return
+        if output is None:
+            self.trace(doc, self.name, 'dropped', seconds=round(seconds, 3), pid=pid)
+            self.release(doc, 'dropped')
+        else:
+            self.trace(doc, self.name, 'finished', seconds=round(seconds, 3), pid=pid)
+            self.outputs.put((doc, output))
+
+    def fail(self, doc, error):
+        if self.release(doc, 'failed'):
+            self.trace(doc, self.name, 'failed', error=repr(error))
+
+    def check_time_limit(self):
+        """Frees the slots of the documents that run over the time limit and kills their workers; the pool replaces them."""
+        with self.lock:
+            while True:
+                try:
+                    doc, pid, started = self.starts.get_nowait()
+                except queue.Empty:
+                    break
+                self.current[pid] = doc
+                if doc in self.running:
+                    self.workers[doc] = (pid, started)
+            now = time.monotonic()
+            late = [(doc, pid) for doc, (pid, started) in self.workers.items()
+                    if now - started > self.time_limit and not self.running[doc].ready()]
+        for doc, pid in late:
+            result = self.running.get(doc)
+            if not self.release(doc, 'timeout'):
+                continue
+            logger.info(f'{self.name} timed out for {doc}, killing worker {pid}')
+            self.trace(doc, self.name, 'timeout', seconds=self.time_limit, pid=pid)
+            # The worker may have moved on if the result arrived in the meantime
+            if self.current.get(pid) == doc and not result.ready():
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def status(self):
+        return f'{self.name}: {self.queue.qsize()} waiting, {len(self.running)} running, ' + ', '.join(f'{count} {event}' for event, count in self.counts.items())
+
+    def close(self):
+        self.pool.terminate()
+
+
+def extract_document(file, tool):
+    """The extraction stage: returns the file and its text, or None if it has no text."""
+    if file.endswith('.txt'):
+        with open(file, encoding='utf-8') as f:
+            content = f.read()
+    else:
+        content = extract_text(file, tool)
+    return (file, content) if content.strip() else None
+
+
+def filter_document(file, content, is_thesis, output_dir, features_dir):
+    """The filtering stage: writes the filtered text and returns its path, or None if no content is left."""
+    from extractor import convert_pdf_to_text
+    filename = convert_pdf_to_text(file, is_thesis, output_dir, content=content, features_dir=features_dir)
+    return (filename,) if filename else None
+
+
+def score_document(file, splitter):
+    """The scoring stage: splits and scores the sentences and returns the path of the scores."""
+    # Imported here, so that only the scoring workers load the tokenizer and the language model
+    from kenlm_score import split_score
+    return str(split_score(file, splitter))
+
+
+def watch(directories, poll_interval, once):
+    """Yields the PDF and text files in the directories, then, unless `once` is set, the files that appear later."""
+    seen = set()
+    while True:
+        for directory in directories:
+            # The downloaders write to .part files and rename them when they are complete
+            for path in sorted(p for p in Path(directory).iterdir() if p.suffix in ('.pdf', '.txt')):
+                if path not in seen:
+                    seen.add(path)
+                    yield path
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+def run_pipeline(directories, output_dir, tool='tika', is_thesis=False, features_dir=None, workers=(4, 4, 2), queue_size=8,
+                 time_limit=600, poll_interval=30, once=False, skip=True, trace_path='pipeline_trace.jsonl', status_interval=60, splitter='vnlp'):
+    """
+    Extracts, filters and scores the documents in `directories` as they appear.
+
+    Filtered texts are written to `output_dir/txt` and scores to `output_dir/scored_csv`, the layout kenlm_score.py expects.
+
+    Args:
+        workers (tuple): The number of processes of the extraction, filtering and scoring stages.
+        queue_size (int): The number of documents that can wait for each stage.
+        once (bool): Stop when the files present at the start are done instead of watching for new ones.
+        skip (bool): Skip documents that already have scores.
+        splitter (str): The sentence splitter of the scoring stage, see `kenlm_score.get_sentence_splitter`.
+    """
+    output_dir = Path(output_dir)
+    text_dir = output_dir / 'txt'
+    scored_dir = output_dir / 'scored_csv'
+    text_dir.mkdir(parents=True, exist_ok=True)
+    scored_dir.mkdir(parents=True, exist_ok=True)
+
+    trace = TraceLog(trace_path)
+    stages = [
+        Stage('extract', partial(extract_document, tool=tool), workers[0], queue_size, time_limit, trace),
+        Stage('filter', partial(filter_document, is_thesis=is_thesis, output_dir=str(text_dir), features_dir=features_dir), workers[1], queue_size, time_limit, trace),
+        Stage('score', partial(score_document, splitter=splitter), workers[2], queue_size, time_limit, trace),
+    ]
+    for stage, next_stage in zip(stages, stages[1:]):
+        stage.next = next_stage
+    for stage in stages:
+        stage.start()
+
+    def monitor():
+        last_status = time.monotonic()
+        while stages[-1].thread.is_alive():
+            time.sleep(1)
+            for stage in stages:
+                stage.check_time_limit()
+            if time.monotonic() - last_status >= status_interval:
+                last_status = time.monotonic()
+                logger.info(' | '.join(stage.status() for stage in stages))
+
+    monitor_thread = threading.Thread(target=monitor, daemon=True)
+    monitor_thread.start()
+
+    try:
+        for path in watch(directories, poll_interval, once):
+            doc = path.stem
+            if skip and (scored_dir / f'{doc}_scored.csv').exists():
+                trace(doc, 'watch', 'skipped')
+                continue
+            trace(doc, 'watch', 'found', path=str(path))
+            # Blocks while the extraction queue is full
+            stages[0].queue.put((doc, (str(path),)))
+        stages[0].queue.put(None)
+        for stage in stages:
+            stage.thread.join()
+    finally:
+        logger.info(' | '.join(stage.status() for stage in stages))
+        for stage in stages:
+            stage.close()
+        trace.close()
+
+
+def main():
+    # The extractor and kenlm_score loggers have their own handlers, so the root logger is left alone
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    arg_parser = ArgumentParser(description='Extracts, filters and scores downloaded PDFs as soon as they land, with a worker pool per stage.')
+    arg_parser.add_argument('-p', '--path', type=str, nargs='+', help='The folders the scrapers download PDFs to, e.g. pdf/ and pdfs/.', required=True)
+    arg_parser.add_argument('-o', '--output', type=str, help='The output directory for the txt/ and scored_csv/ folders.', required=True)
+    arg_parser.add_argument('-w', '--workers', type=int, nargs=3, metavar=('EXTRACT', 'FILTER', 'SCORE'), help='The number of processes of each stage.', default=[4, 4, 2])
+    arg_parser.add_argument('-q', '--queue_size', type=int, help='The number of documents that can wait for each stage.', default=8)
+    arg_parser.add_argument('-l', '--time_limit', type=int, help='The time limit for each document in each stage in seconds.', default=600)
+    arg_parser.add_argument('-t', '--thesis_preprocessing', action='store_true', help='Enable thesis preprocessing during filtering.')
+    arg_parser.add_argument('--tool', choices=list(BACKENDS), help='The PDF text extraction backend.', default='tika')
+    arg_parser.add_argument('--features', type=str, help='Also save the line features of every document to this directory for refilter.py.')
+    arg_parser.add_argument('--poll', type=float, help='Look for new files every this many seconds.', default=30)
+    arg_parser.add_argument('--once', action='store_true', help='Process the files that are already there and exit.')
+    arg_parser.add_argument('--no_skip', action='store_true', help='Also process documents that already have scores.')
+    arg_parser.add_argument('--splitter', choices=['vnlp', 'rule'], help='The sentence splitter: vnlp, or the faster rule-based one in sentence_splitter.py.', default='vnlp')
+    arg_parser.add_argument('--trace', type=str, help='The trace log of every document.', default='pipeline_trace.jsonl')
+    arg_parser.add_argument('--show', type=str, help='Print the trace of a document, e.g. --show 123456, and exit.')
+    args = arg_parser.parse_args()
+
+    if args.show:
+        for record in document_history(args.trace, args.show):
+            print(json.dumps(record, ensure_ascii=False))
+        return
+
+    run_pipeline(args.path, args.output, args.tool, args.thesis_preprocessing, args.features, args.workers, args.queue_size,
+                 args.time_limit, args.poll, args.once, not args.no_skip, args.trace, splitter=args.splitter)
+
+
+if __name__ == '__main__':
+    main()
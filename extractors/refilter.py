@@ -0,0 +1,72 @@
+import argparse
+import json
+import logging
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+
+import pandas as pd
+
+from extractor import DEFAULT_RULES, filter_lines, write_filtered_text
+
+logger = logging.getLogger('extractor')
+
+
+def refilter_file(path, rules, output_dir=None):
+    """
+    Applies the line filters with the given thresholds to the cached line features of one document.
+
+    Args:
+        path (Path): The Parquet file written by `extractor.save_features`.
+        rules (dict): The filter thresholds.
+        output_dir (Path): If given, the filtered text is written here.
+
+    Returns:
+        dict: The number of lines in the document and the number of lines matched by each rule.
+    """
+    df = pd.read_parquet(path)
+    counts = {'lines': df.shape[0]}
+    filtered_df = filter_lines(df, rules, detect_language='is_turkish' in df, counts=counts)
+    if filtered_df is not None and output_dir is not None:
+        write_filtered_text(filtered_df, output_dir / f'{path.stem}_no_inline_citations.txt')
+    return counts
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Applies new filter thresholds to cached line features without extracting the PDFs again.')
+    arg_parser.add_argument('-f', '--features', type=str, help='The directory written by extractor.py --features.', required=True)
+    arg_parser.add_argument('-o', '--output', type=str, help='The output directory for the refiltered texts; only a report is printed if omitted.')
+    arg_parser.add_argument('-r', '--rules', type=str, help='A JSON file with the thresholds to change, e.g. {"max_occurrence": 3}.')
+    arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of threads to use.', default=4)
+    args = arg_parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    rules = dict(DEFAULT_RULES)
+    if args.rules:
+        with open(args.rules, encoding='utf-8') as f:
+            rules.update(json.load(f))
+    output_dir = Path(args.output) if args.output else None
+    if output_dir:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    totals = {}
+    documents = 0
+    empty = 0
+    with Pool(args.num_threads) as pool:
+        for counts in pool.imap_unordered(partial(refilter_file, rules=rules, output_dir=output_dir), sorted(Path(args.features).glob('*.parquet'))):
+            documents += 1
+            empty += 'kept' not in counts
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+
+    lines = totals.pop('lines', 0)
+    kept = totals.pop('kept', 0)
+    print(f'Rules: {json.dumps(rules)}')
+    print(f'{documents} documents, {empty} with no content left, {kept} of {lines} lines kept')
+    print('Lines matched by each rule (a line can match several):')
+    for name, count in sorted(totals.items()):
+        print(f'  {name:<32}{count:>10}{100 * count / max(lines, 1):>8.2f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def input_kind(input_file, mode=None):
+    """Returns the kind of an input for the cost model, e.g. 'pdf', 'txt', 'html', 'gazette' or 'pdf:chunked'."""
+    path = Path(input_file)
+    kind = 'gazette' if path.is_dir() else path.suffix.lower().lstrip('.')
+    kind = 'html' if kind == 'htm' else kind
+    return f'{kind}:{mode}' if mode else kind
+
+
+class DurationLog:
+    """
+    The processing time of every file of earlier runs, kept in SQLite so that the budgets of later runs
+    can be calibrated on them.
+
+    Args:
+        path (str or Path): The SQLite file.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS durations (file TEXT NOT NULL, kind TEXT NOT NULL, size INTEGER NOT NULL, '
+                                    'seconds REAL NOT NULL, budget REAL, status TEXT NOT NULL, recorded REAL NOT NULL)')
+
+    def add(self, file, kind, size, seconds, budget, status):
+        """Records a file; `status` is 'ok', 'empty' for files without any text left, or 'timeout'."""
+        with self.connection:
+            self.connection.execute('INSERT INTO durations VALUES (?, ?, ?, ?, ?, ?, ?)', (file, kind, size, seconds, budget, status, time.time()))
+
+    def rows(self, limit=20000):
+        """
+        Returns the (kind, size, seconds, timed out) of the most recent files that produced a text or timed out.
+
+        A file killed at its budget took at least that long, so its seconds are a lower bound.
+        """
+        return self.connection.execute("SELECT kind, size, CASE WHEN status = 'timeout' THEN MAX(seconds, COALESCE(budget, seconds)) ELSE seconds END, "
+                                       "status = 'timeout' FROM durations WHERE status IN ('ok', 'timeout') ORDER BY rowid DESC LIMIT ?", (limit,)).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+
+class CostModel:
+    """
+    Predicts how long a file takes from its size, with a linear fit per kind of input on the durations of
+    earlier runs. The budget of a file covers the `quantile` of the ratios of the recorded durations to
+    their predictions, times `margin`.
+
+    Timed out files enter the fit with their budget as a lower bound of their duration. When more of the
+    files of a kind timed out than the quantile leaves out, the quantile is itself only a lower bound, so
+    the budgets of that kind are doubled until fewer files time out.
+
+    Args:
+        rows (list): The (kind, size, seconds, timed out) of earlier files, see `DurationLog.rows`.
+        min_samples (int): Kinds with fewer durations are not calibrated.
+        quantile (float): The quantile of the duration ratios the budgets cover.
+        margin (float): The factor between the covered duration and the budget.
+    """
+
+    def __init__(self, rows, min_samples=20, quantile=0.95, margin=2.0):
+        self.margin = margin
+        self.fits = {}
+        samples = {}
+        for kind, size, seconds, timed_out in rows:
+            samples.setdefault(kind, []).append((size / 2 ** 20, seconds, timed_out))
+        for kind, kind_samples in samples.items():
+            if len(kind_samples) < min_samples:
+                continue
+            sizes, seconds, timed_out = np.array(kind_samples, dtype=float).T
+            slope, intercept = np.polyfit(sizes, seconds, 1) if np.ptp(sizes) > 0 else (0.0, seconds.mean())
+            # A negative slope or intercept would predict no time for some files
+            slope, intercept = max(slope, 0.0), max(intercept, 0.01)
+            ratios = seconds / (intercept + slope * sizes)
+            ratio = float(np.quantile(ratios, quantile))
+            if timed_out.mean() > 1 - quantile:
+                ratio *= 2
+            self.fits[kind] = (intercept, slope, ratio)
+
+    def predict(self, kind, size):
+        """Returns the predicted seconds of a file, or None if its kind is not calibrated."""
+        if kind not in self.fits:
+            return None
+        intercept, slope, _ = self.fits[kind]
+        return intercept + slope * size / 2 ** 20
+
+    def budget(self, kind, size, default, minimum=5):
+        """Returns the time budget of a file in seconds, `default` if its kind is not calibrated."""
+        if kind not in self.fits:
+            return default
+        return max(minimum, self.margin * self.fits[kind][2] * self.predict(kind, size))
+
+    def describe(self):
+        return ', '.join(f'{kind}: {intercept:.1f}s + {slope:.1f}s/MB, x{ratio:.1f}' for kind, (intercept, slope, ratio) in sorted(self.fits.items()))
@@ -0,0 +1,116 @@
+import re
+
+# Abbreviations that end with a period without ending the sentence, in lowercase without the final period
+ABBREVIATIONS = {
+    # Titles
+    'prof', 'doç', 'dr', 'yrd', 'yard', 'arş', 'gör', 'öğr', 'okt', 'uzm', 'müh', 'mim', 'sn', 'bşk', 'gn', 'alb', 'hz',
+    # References
+    'bkz', 'bk', 'krş', 'karş', 'akt', 'çev', 'çv', 'ed', 'eds', 'yayl', 'vd', 'vol', 'no', 'nr', 'sy', 's', 'ss',
+    'sf', 'c', 'pp', 'p', 'bl', 'böl', 'md', 'mad', 'fık', 'şek', 'tab', 'res', 'age', 'agm', 'a.g.e', 'a.g.m', 'ibid', 'op', 'cit',
+    'dn', 'dipn', 'vb', 'vs', 'örn', 'ör', 'yy', 'yüzy', 'mö', 'ms', 'm.ö', 'm.s', 'st',
+    # Institutions and places
+    'üniv', 'ünv', 'fak', 'enst', 'müd', 'ltd', 'şti', 'a.ş', 'inc', 'co', 'cad', 'mah', 'apt', 'blv', 't.c',
+    # Languages
+    'ing', 'alm', 'fr', 'lat', 'fa', 'osm', 'yun', 'isp',
+    # Units
+    'kr', 'km', 'cm', 'mm', 'kg', 'gr', 'lt', 'ml', 'dk',
+}
+
+# Abbreviations that are also common words, e.g. "der" (says), "ek" (adds) or "al" (take). They only hold
+# before a number, an initial or another abbreviation, as in "say. 15", "Haz. A. Yılmaz" or "Kur. Alb."
+WORD_ABBREVIATIONS = {
+    'gen', 'kur', 'av', 'haz', 'der', 'yay', 'say', 'ek', 'al', 'sok', 'tel', 'ar', 'far', 'rus', 'yak', 'sa',
+}
+
+# The end of a sentence: terminal punctuation, optional closing quotes or brackets and the following whitespace
+boundary_pattern = re.compile('([.!?…]+)(["\'”’»)\\]]*)(\\s+)')
+paragraph_pattern = re.compile('\\n\\s*\\n')
+# A numbered heading or an ordinal such as "2.", "2.1." or "15."
+number_pattern = re.compile('^\\(?\\d+(\\.\\d+)*$')
+# Roman numerals used as ordinals, e.g. "II. Abdülhamid"
+roman_numeral_pattern = re.compile('^[IVXLC]+$')
+# Initials such as "A." in "A. Yılmaz", and dotted abbreviations such as "T.C." or "a.g.e."
+initial_pattern = re.compile('^([A-Za-zÇĞİÖŞÜçğıöşü]\\.)*[A-Za-zÇĞİÖŞÜçğıöşü]$')
+
+
+def is_abbreviation(word, text, end):
+    """Decides whether `word`, followed by a period, is an abbreviation, looking at the word that starts at `end`."""
+    word = word.lower()
+    if word in ABBREVIATIONS:
+        return True
+    if word not in WORD_ABBREVIATIONS:
+        return False
+    following = text[end:end + 40].split(maxsplit=1)
+    following = following[0].lstrip('("\'“‘«[') if following else ''
+    if following[:1].isdigit():
+        return True
+    return following.endswith('.') and (following[:-1].lower() in ABBREVIATIONS or initial_pattern.match(following[:-1]) is not None)
+
+
+def is_boundary(text, match):
+    """Decides whether a match of `boundary_pattern` ends a sentence, looking only at the words around it."""
+    end = match.end()
+    if end == len(text):
+        return True
+    following = text[end]
+    # Sentences start with a capital letter, a digit, a quote or a bracket
+    if following.islower():
+        return False
+    if match.group(1) != '.':
+        return True
+    # Only a short window is searched for the start of the word, so the pass stays linear without line breaks
+    window = max(0, match.start() - 40)
+    start = max(text.rfind(' ', window, match.start()), text.rfind('\n', window, match.start()), window - 1) + 1
+    word = text[start:match.start()].lstrip('("\'“‘«[')
+    if initial_pattern.match(word) or is_abbreviation(word, text, end):
+        return False
+    if number_pattern.match(word) or roman_numeral_pattern.match(word):
+        # "2.1. Yöntem" numbers a heading, "15. yüzyıl" and "II. Abdülhamid" are ordinals, but a year such
+        # as "1923." ends a sentence unless it numbers a heading
+        i = start - 1
+        while i >= 0 and text[i].isspace():
+            i -= 1
+        return word.isdigit() and len(word) == 4 and i >= 0 and text[i] not in '.!?…:'
+    return True
+
+
+def split_sentences(text):
+    """
+    Splits Turkish text into sentences in a single pass over the sentence-final punctuation.
+
+    A period does not end a sentence after an abbreviation in `ABBREVIATIONS` or, in context, in `WORD_ABBREVIATIONS`,
+    an initial, a numbered heading or an ordinal, or when the next word is in lowercase. Blank lines always end a sentence.
+
+    Returns:
+        list: The sentences, stripped of surrounding whitespace.
+    """
+    sentences = []
+    for paragraph in paragraph_pattern.split(text):
+        start = 0
+        for match in boundary_pattern.finditer(paragraph):
+            if is_boundary(paragraph, match):
+                sentences.append(paragraph[start:match.start(3)].strip())
+                start = match.end()
+        sentences.append(paragraph[start:].strip())
+    return [sentence for sentence in sentences if sentence]
+
+
+class SentenceSplitter:
+    """The rule-based splitter with the interface of `vnlp.SentenceSplitter`."""
+
+    def split_sentences(self, text):
+        return split_sentences(text)
+
+
+# Created on first use, so that a worker only imports the splitter it uses
+sentence_splitters = {}
+
+def get_sentence_splitter(name='vnlp'):
+    """Returns the `vnlp` sentence splitter, or the rule-based one above for `rule`."""
+    if name not in sentence_splitters:
+        if name == 'vnlp':
+            from vnlp import SentenceSplitter as VnlpSentenceSplitter
+            sentence_splitters[name] = VnlpSentenceSplitter()
+        else:
+            sentence_splitters[name] = SentenceSplitter()
+    return sentence_splitters[name]
@@ -0,0 +1,201 @@
+import argparse
+import gzip
+import json
+import logging
+import re
+import sqlite3
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Dergipark files are named {journal_code}_{issue_number}_{article_no}, YÖK files by TezNo
+dergipark_name_pattern = re.compile(r'^(.+)_(\d+)_(\d+)$')
+
+SHARD_SIZE = 256 * 2 ** 20
+INDEX_NAME = 'index.sqlite'
+
+
+class MetadataJoiner:
+    """
+    Looks up the scraper metadata of a document by its file name.
+
+    Args:
+        dergipark_dir (str or Path): The Dergipark output directory holding `metadata/`.
+        yok_metadata (str or Path): The YÖK `md.sqlite` store or an `md.json` export.
+    """
+
+    def __init__(self, dergipark_dir=None, yok_metadata=None):
+        self.dergipark_dir = Path(dergipark_dir) / 'metadata' if dergipark_dir else None
+        self.yok_connection = None
+        self.yok_json = None
+        if yok_metadata and str(yok_metadata).endswith('.json'):
+            with open(yok_metadata, encoding='utf-8') as f:
+                self.yok_json = json.load(f)
+        elif yok_metadata:
+            self.yok_connection = sqlite3.connect(f'file:{yok_metadata}?mode=ro', uri=True, check_same_thread=False)
+
+    def yok_record(self, thesis_id):
+        if self.yok_json is not None:
+            return self.yok_json.get(thesis_id)
+        row = self.yok_connection.execute('SELECT metadata FROM theses WHERE thesis_id = ?', (int(thesis_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __call__(self, doc_id):
+        """Returns the metadata fields of a record, with None for the fields the scraper did not save."""
+        record = {'source': None, 'source_id': doc_id, 'journal': None, 'issue': None, 'year': None, 'thesis_type': None, 'title': None}
+        match = dergipark_name_pattern.match(doc_id)
+        if doc_id.isdigit() and (self.yok_connection or self.yok_json is not None):
+            metadata = self.yok_record(doc_id)
+            if metadata is not None:
+                record.update(source='yok', year=metadata.get('year'), thesis_type=metadata.get('type'), title=metadata.get('title'))
+        elif match and self.dergipark_dir:
+            path = self.dergipark_dir / f'{doc_id}.json'
+            if path.is_file():
+                with open(path, encoding='utf-8') as f:
+                    metadata = json.load(f)
+                # Article pages do not show the year, so it is only set if the metadata has one
+                record.update(source='dergipark', journal=match.group(1), issue=match.group(2),
+                              year=metadata.get('year'), title=metadata.get('article-title'))
+        return record
+
+    def close(self):
+        if self.yok_connection:
+            self.yok_connection.close()
+
+
+class ShardWriter:
+    """
+    Appends documents to size-rolled gzip JSON lines shards and indexes them by document id.
+
+    Every record is compressed as a separate gzip member, so a shard is still a regular .jsonl.gz file,
+    and a record can be read by seeking to its offset in the index. A writer never appends to an
+    existing shard, so a crash leaves at most one shard with an unindexed tail. A document written
+    again replaces its index entry.
+
+    Args:
+        output_dir (str or Path): The directory of the shards and `index.sqlite`.
+        shard_size (int): A new shard is started once the current one reaches this many bytes.
+        joiner (MetadataJoiner): Adds the scraper metadata to every record.
+        commit_every (int): The number of records between index commits.
+    """
+
+    def __init__(self, output_dir, shard_size=SHARD_SIZE, joiner=None, commit_every=100):
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.joiner = joiner
+        self.commit_every = commit_every
+        self.connection = sqlite3.connect(self.output_dir / INDEX_NAME)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, shard TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS documents_by_shard ON documents (shard, offset)')
+        self.shard_number = max((int(p.name[6:11]) + 1 for p in self.output_dir.glob('shard-*.jsonl.gz')), default=0)
+        self.file = None
+        self.pending = 0
+
+    def open_shard(self):
+        self.shard_name = f'shard-{self.shard_number:05d}.jsonl.gz'
+        self.shard_number += 1
+        self.file = open(self.output_dir / self.shard_name, 'xb')
+
+    def add(self, doc_id, text, **fields):
+        """Appends a document with its metadata and any extra fields."""
+        record = {'id': doc_id, **(self.joiner(doc_id) if self.joiner else {}), **fields, 'text': text}
+        member = gzip.compress((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'), compresslevel=6)
+        if self.file is None:
+            self.open_shard()
+        offset = self.file.tell()
+        self.file.write(member)
+        self.connection.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)', (doc_id, self.shard_name, offset, len(member)))
+        self.pending += 1
+        if self.file.tell() >= self.shard_size:
+            self.file.close()
+            self.file = None
+            self.commit()
+        elif self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        # The shard is flushed first, so the index never points past the end of a shard
+        if self.file:
+            self.file.flush()
+        self.connection.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.connection.close()
+
+
+class ShardReader:
+    """Reads the records written by `ShardWriter`, one by id or all of them in shard order."""
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.connection = sqlite3.connect(f'file:{self.output_dir / INDEX_NAME}?mode=ro', uri=True)
+
+    def get_location(self, doc_id):
+        """Returns the shard, offset and length of a document, or None if it is not in the index."""
+        return self.connection.execute('SELECT shard, offset, length FROM documents WHERE doc_id = ?', (doc_id,)).fetchone()
+
+    def get(self, doc_id):
+        """Returns the record of a document, or None if it is not in the index."""
+        row = self.get_location(doc_id)
+        if row is None:
+            return None
+        shard, offset, length = row
+        with open(self.output_dir / shard, 'rb') as f:
+            f.seek(offset)
+            return json.loads(gzip.decompress(f.read(length)))
+
+    def __iter__(self):
+        """Yields the indexed records; older copies of documents written again are skipped."""
+        for shard in sorted(self.output_dir.glob('shard-*.jsonl.gz')):
+            with open(shard, 'rb') as f:
+                for offset, length in self.connection.execute('SELECT offset, length FROM documents WHERE shard = ? ORDER BY offset', (shard.name,)):
+                    f.seek(offset)
+                    yield json.loads(gzip.decompress(f.read(length)))
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    arg_parser = argparse.ArgumentParser(description='Packs extracted texts into compressed shards with their scraper metadata, or reads them back.')
+    arg_parser.add_argument('-s', '--shards', type=str, help='The shard directory.', required=True)
+    arg_parser.add_argument('-p', '--path', type=str, help='Pack the _no_inline_citations.txt files of this folder into the shards.')
+    arg_parser.add_argument('-d', '--dergipark', type=str, help='The Dergipark output directory holding metadata/.')
+    arg_parser.add_argument('-y', '--yok', type=str, help='The YÖK md.sqlite store or md.json export.')
+    arg_parser.add_argument('-m', '--shard_size', type=float, help='The size of a shard in megabytes.', default=256)
+    arg_parser.add_argument('-g', '--get', type=str, help='Print the record of a document id.')
+    args = arg_parser.parse_args()
+
+    if args.path:
+        joiner = MetadataJoiner(args.dergipark, args.yok)
+        writer = ShardWriter(args.shards, int(args.shard_size * 2 ** 20), joiner)
+        files = sorted(Path(args.path).glob('*_no_inline_citations.txt'))
+        for file in files:
+            writer.add(file.name.replace('_no_inline_citations.txt', ''), file.read_text(encoding='utf-8'))
+        writer.close()
+        joiner.close()
+        logger.info(f'Packed {len(files)} documents into {writer.shard_number} shards in {args.shards}')
+
+    reader = ShardReader(args.shards)
+    if args.get:
+        record = reader.get(args.get)
+        print(json.dumps(record, ensure_ascii=False, indent=4) if record else f'{args.get} is not in {args.shards}')
+    else:
+        logger.info(f'{len(reader)} documents in {args.shards}')
+    reader.close()
+
+
+if __name__ == '__main__':
+    main()
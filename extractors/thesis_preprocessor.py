@@ -16,14 +16,16 @@ def find_most_frequent_empty_line_count(text):
     most_common_count, frequency = Counter(counts).most_common(1)[0]
     return most_common_count, frequency
 
-def insert_page_breaks(text):
+def insert_page_breaks(text, most_common_count=None):
     """
     Replace the most frequent count of consecutive empty lines with a placeholder.
     
     :param text: str - Input text to modify.
+    :param most_common_count: int - The count to replace, found in `text` if None.
     :return: str - Text with placeholders replacing the most common count of consecutive empty lines.
     """
-    most_common_count = find_most_frequent_empty_line_count(text)[0]
+    if most_common_count is None:
+        most_common_count = find_most_frequent_empty_line_count(text)[0]
     if most_common_count == 0:
         return text
     
@@ -61,7 +63,7 @@ DISCARD_TEXT_PATTERN  = r'(' + '|'.join(SECTIONS_TO_DISCARD )  + r')\n+?[\s\S]*?
 ALTERNATIVE_DISCARD_TEXT_PATTERN  = r'(' + '|'.join(["ÖNSÖZ", "ÖN SÖZ", "TEŞEKKÜR"])  + r')[\s\S]*?' + PLACEHOLDER_PATTERN +  r'[\s\S]*?' + PLACEHOLDER_PATTERN 
 
 
-def process_thesis_text(text):
+def process_thesis_text(text, empty_line_count=None):
     """
     Process and clean thesis text: 
     1. Marks sections with Roman and page numbers.
@@ -69,11 +71,12 @@ def process_thesis_text(text):
     3. Removes specified sections from the thesis.
     
     :param text: str - Thesis text to be processed.
+    :param empty_line_count: int - The empty line count of the whole thesis when `text` is a part of it.
     :return: str - Processed text.
     """
     text = replace_roman_numbers_with_placeholder(text)
     text = replace_page_numbers_with_placeholder(text)
-    text = insert_page_breaks(text)
+    text = insert_page_breaks(text, empty_line_count)
     text = text.replace('ROMAN_PAGE_NUMBER', 'PAGE_BREAK')
     text = text.replace('PAGE_NUMBER', 'PAGE_BREAK')  
     text = remove_text_between_patterns(text, DISCARD_TEXT_PATTERN)
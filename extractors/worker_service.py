@@ -0,0 +1,293 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+import time
+from argparse import ArgumentParser
+from multiprocessing import Pool, Queue
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = '/tmp/extraction_workers.sock'
+
+# Set in every pool worker by the initializers, so that the service knows when a job really starts
+job_starts = None
+
+
+def set_job_starts(starts):
+    global job_starts
+    job_starts = starts
+
+
+def run_job(key, function, *args):
+    """Runs a job in a pool worker after announcing its start, so that its time limit counts from there."""
+    job_starts.put((key, os.getpid(), time.monotonic()))
+    return function(*args)
+
+
+def warm_extractor(tool, starts):
+    """Pool initializer: imports the extractor, loads the langid model and connects to Tika once per worker."""
+    set_job_starts(starts)
+    import extractor
+    extractor.is_turkish_content('Bu cümle dil modelini yüklemek için kullanılır.')
+    if tool == 'tika':
+        try:
+            from tika import parser
+            parser.from_buffer('Tika')
+        except Exception as e:
+            logger.warning(f'Could not reach the Tika server: {e}')
+
+
+def warm_scorer(splitter, cache_size, cache_path, starts):
+    """Pool initializer: loads the tokenizer, the language model and the sentence splitter once per worker."""
+    set_job_starts(starts)
+    import kenlm_score
+    from sentence_splitter import get_sentence_splitter
+    kenlm_score.configure_cache(cache_size, cache_path)
+    get_sentence_splitter(splitter)
+
+
+def extract_file(file, is_thesis, output_dir, tool, features_dir):
+    from extractor import convert_pdf_to_text
+    result = convert_pdf_to_text(file, is_thesis, output_dir, tool=tool, features_dir=features_dir)
+    return str(result) if result else None
+
+
+def score_file(file, splitter):
+    from kenlm_score import split_score_with_stats
+    (Path(file).parent.parent / 'scored_csv').mkdir(parents=True, exist_ok=True)
+    return split_score_with_stats(file, splitter)
+
+
+class WorkerService(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A local service that keeps warmed extraction and scoring pools and runs the jobs sent over a Unix socket.
+
+    A request is one JSON line, e.g. {"command": "extract", "files": [...], "output": "txt"} or
+    {"command": "score", "files": [...]}. The service answers with a JSON line per file as it finishes and
+    a final line with "done". {"command": "status"} and {"command": "shutdown"} are answered with one line.
+
+    The time limit of a file counts from the moment a worker starts it. A worker that runs over it, e.g. on a
+    stuck Tika call, is killed and replaced by its pool, so that hung files do not use up the pools.
+
+    Args:
+        socket_path (str): The path of the Unix socket.
+        num_workers (int): The number of extraction processes.
+        score_workers (int): The number of scoring processes, 0 disables scoring.
+        tool (str): The PDF text extraction backend.
+        time_limit (int): The time limit of each file in seconds.
+        splitter (str): The sentence splitter of the scoring workers.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, num_workers=4, score_workers=2, tool='tika', time_limit=120, splitter='vnlp', cache_size=100000, cache_path=None):
+        self.tool = tool
+        self.time_limit = time_limit
+        self.splitter = splitter
+        self.started = time.time()
+        self.counts = {'extract': 0, 'score': 0, 'failed': 0, 'killed': 0}
+        self.starts = Queue()
+        self.job_ids = itertools.count()
+        self.jobs = {}
+        self.timed_out = set()
+        self.jobs_lock = threading.Lock()
+        self.extract_pool = Pool(num_workers, initializer=warm_extractor, initargs=(tool, self.starts))
+        self.score_pool = Pool(score_workers, initializer=warm_scorer, initargs=(splitter, cache_size, cache_path, self.starts)) if score_workers else None
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, JobHandler)
+        threading.Thread(target=self.watch, daemon=True).start()
+
+    def submit(self, request):
+        """Queues the files of a job and returns the (file, job key, async result) triples."""
+        if request['command'] == 'extract':
+            pool, function = self.extract_pool, extract_file
+            jobs = [(file, request.get('thesis', False), request['output'], request.get('tool', self.tool), request.get('features')) for file in request['files']]
+        elif self.score_pool is None:
+            raise ValueError('The service was started without scoring workers')
+        else:
+            pool, function = self.score_pool, score_file
+            jobs = [(file, request.get('splitter', self.splitter)) for file in request['files']]
+        submitted = []
+        with self.jobs_lock:
+            for job in jobs:
+                key = next(self.job_ids)
+                self.jobs[key] = pool.apply_async(run_job, (key, function, *job))
+                submitted.append((job[0], key, self.jobs[key]))
+        return submitted
+
+    def watch(self):
+        """Kills the workers whose job runs over the time limit; the pools replace them."""
+        running = {}
+        current = {}
+        while True:
+            while True:
+                try:
+                    key, pid, started = self.starts.get_nowait()
+                except queue.Empty:
+                    break
+                running[key] = (pid, started)
+                current[pid] = key
+            now = time.monotonic()
+            with self.jobs_lock:
+                for key, (pid, started) in list(running.items()):
+                    result = self.jobs.get(key)
+                    if result is None or result.ready():
+                        del running[key]
+                    elif now - started > self.time_limit:
+                        del running[key]
+                        self.timed_out.add(key)
+                        # The worker may have moved on if the result arrived in the meantime
+                        if current.get(pid) == key and not result.ready():
+                            logger.info(f'Job {key} ran over its time limit of {self.time_limit}s, killing worker {pid}')
+                            self.counts['killed'] += 1
+                            try:
+                                os.kill(pid, signal.SIGKILL)
+                            except ProcessLookupError:
+                                pass
+            time.sleep(0.1)
+
+    def wait(self, key, result):
+        """Returns the result of a job, or raises TimeoutError if its worker was killed."""
+        try:
+            while not result.ready():
+                if key in self.timed_out:
+                    raise TimeoutError
+                result.wait(0.1)
+            return result.get()
+        finally:
+            with self.jobs_lock:
+                self.jobs.pop(key, None)
+                self.timed_out.discard(key)
+
+    def status(self):
+        return {'uptime': round(time.time() - self.started), 'tool': self.tool, 'scoring': self.score_pool is not None, **self.counts}
+
+    def close(self):
+        self.server_close()
+        self.extract_pool.terminate()
+        if self.score_pool:
+            self.score_pool.terminate()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        self.wfile.write((json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        command = request.get('command')
+        if command == 'status':
+            return self.send(self.server.status())
+        if command == 'shutdown':
+            self.send({'done': True})
+            # shutdown() waits for serve_forever to return, so it is called from another thread
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        if command not in ('extract', 'score'):
+            return self.send({'done': True, 'error': f'Unknown command {command}'})
+
+        start = time.perf_counter()
+        try:
+            results = self.server.submit(request)
+        except (KeyError, ValueError) as e:
+            return self.send({'done': True, 'error': str(e)})
+        failed = 0
+        for file, key, result in results:
+            try:
+                self.send({'file': file, 'ok': True, 'result': self.server.wait(key, result)})
+                self.server.counts[command] += 1
+            except TimeoutError:
+                failed += 1
+                self.send({'file': file, 'ok': False, 'error': 'timeout'})
+            except Exception as e:
+                failed += 1
+                self.send({'file': file, 'ok': False, 'error': repr(e)})
+        self.server.counts['failed'] += failed
+        self.send({'done': True, 'files': len(results), 'failed': failed, 'seconds': round(time.perf_counter() - start, 3)})
+
+
+def submit(request, socket_path=DEFAULT_SOCKET):
+    """Sends a request to the service and yields its answers as they arrive."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request, ensure_ascii=False) + '\n').encode('utf-8'))
+        with client.makefile('r', encoding='utf-8') as answers:
+            for line in answers:
+                yield json.loads(line)
+
+
+def input_files(path, suffixes):
+    path = Path(path)
+    if path.is_file():
+        return [str(path.resolve())]
+    return sorted(str(f.resolve()) for f in path.iterdir() if f.suffix in suffixes)
+
+
+def main():
+    arg_parser = ArgumentParser(description='Runs a service with warmed extraction and scoring workers, or sends it jobs.')
+    arg_parser.add_argument('--socket', type=str, help='The path of the Unix socket.', default=DEFAULT_SOCKET)
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='Start the service.')
+    serve.add_argument('-n', '--num_threads', type=int, help='The number of extraction processes.', default=4)
+    serve.add_argument('--score_threads', type=int, help='The number of scoring processes, 0 if the language model is not available.', default=2)
+    serve.add_argument('-l', '--time_limit', type=int, help='The time limit of each file in seconds.', default=120)
+    serve.add_argument('--tool', type=str, help='The default PDF text extraction backend.', default='tika')
+    serve.add_argument('--splitter', choices=['vnlp', 'rule'], help='The default sentence splitter.', default='vnlp')
+    serve.add_argument('--cache_size', type=int, help='The number of sentence scores each scoring worker keeps in memory.', default=100000)
+    serve.add_argument('--cache_path', type=str, help='Also keep the sentence scores in this SQLite file.')
+
+    extract = commands.add_parser('extract', help='Extract and filter PDF or text files, like extractor.py.')
+    extract.add_argument('-p', '--path', type=str, help='The path to the PDF folder or file.', required=True)
+    extract.add_argument('-o', '--output', type=str, help='The path to the output directory.', required=True)
+    extract.add_argument('-t', '--thesis_preprocessing', action='store_true', help='Enable thesis preprocessing during conversion.')
+    extract.add_argument('--tool', type=str, help='The PDF text extraction backend, the service default if omitted.')
+    extract.add_argument('--features', type=str, help='Also save the line features of every document to this directory.')
+
+    score = commands.add_parser('score', help='Split and score text files, like kenlm_score.py.')
+    score.add_argument('-p', '--path', type=str, help='The path to the TXT folder or file.', required=True)
+    score.add_argument('--splitter', choices=['vnlp', 'rule'], help='The sentence splitter, the service default if omitted.')
+
+    commands.add_parser('status', help='Print the state of the service.')
+    commands.add_parser('shutdown', help='Stop the service.')
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    if args.command == 'serve':
+        server = WorkerService(args.socket, args.num_threads, args.score_threads, args.tool, args.time_limit, args.splitter, args.cache_size, args.cache_path)
+        logger.info(f'Listening on {args.socket}')
+        try:
+            server.serve_forever()
+        finally:
+            server.close()
+        return
+
+    request = {'command': args.command}
+    if args.command == 'extract':
+        request.update(files=input_files(args.path, ('.pdf', '.txt')), output=str(Path(args.output).resolve()), thesis=args.thesis_preprocessing,
+                       features=str(Path(args.features).resolve()) if args.features else None)
+        if args.tool:
+            request['tool'] = args.tool
+    elif args.command == 'score':
+        request['files'] = input_files(args.path, ('.txt',))
+        if args.splitter:
+            request['splitter'] = args.splitter
+
+    for answer in submit(request, args.socket):
+        if 'file' in answer:
+            logger.info(f'{answer["file"]}: {answer["result"] if answer["ok"] else answer["error"]}')
+        else:
+            print(json.dumps(answer, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import gzip
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+INDEX_NAME = 'index.tsv'
+
+
+class ResponseArchive:
+    """
+    Appends fetched responses to size-rolled `.warc.gz` files.
+
+    Every record is a WARC/1.0 `response` record compressed as its own gzip member, so a record can be
+    read back from its offset without decompressing the rest of the file. Each write also appends a line
+    to `index.tsv`: uri, file, offset, length, status and date.
+
+    Args:
+    - directory (str or Path): The directory holding the archive files and the index.
+    - max_size (int): The size in bytes after which a new archive file is started.
+    - prefix (str): The file name prefix, e.g. the name of the scraper.
+    """
+
+    def __init__(self, directory, max_size=1 << 30, prefix='responses'):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        existing = sorted(self.directory.glob(f'{prefix}-*.warc.gz'))
+        # Never append to a file left by an earlier run, it may end in a partial record
+        self.sequence = int(existing[-1].name.split('-')[-1].split('.')[0]) + 1 if existing else 0
+        self.file = None
+        self.path = None
+
+    def _roll(self):
+        if self.file:
+            self.file.close()
+        self.path = self.directory / f'{self.prefix}-{self.sequence:05d}.warc.gz'
+        self.sequence += 1
+        self.file = open(self.path, 'ab')
+
+    def write(self, url, status, headers, body, reason=''):
+        """
+        Appends a response to the archive.
+
+        Args:
+        - url (str): The requested URL.
+        - status (int): The HTTP status code.
+        - headers (Mapping): The response headers.
+        - body (bytes): The response body.
+        - reason (str): The HTTP reason phrase.
+        """
+
+        date = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        http_headers = ''.join(f'{name}: {value}\r\n' for name, value in headers.items()
+                               if name.lower() not in ('content-encoding', 'transfer-encoding', 'content-length'))
+        block = f'HTTP/1.1 {status} {reason}\r\n{http_headers}Content-Length: {len(body)}\r\n\r\n'.encode('utf-8') + body
+        warc_headers = (f'WARC/1.0\r\n'
+                        f'WARC-Type: response\r\n'
+                        f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n'
+                        f'WARC-Date: {date}\r\n'
+                        f'WARC-Target-URI: {url}\r\n'
+                        f'Content-Type: application/http; msgtype=response\r\n'
+                        f'Content-Length: {len(block)}\r\n\r\n')
+        record = gzip.compress(warc_headers.encode('utf-8') + block + b'\r\n\r\n')
+
+        with self.lock:
+            if self.file is None or self.file.tell() >= self.max_size:
+                self._roll()
+            offset = self.file.tell()
+            self.file.write(record)
+            self.file.flush()
+            with open(self.directory / INDEX_NAME, 'a', encoding='utf-8') as index:
+                index.write(f'{url}\t{self.path.name}\t{offset}\t{len(record)}\t{status}\t{date}\n')
+
+    def write_response(self, response):
+        """Appends a `requests.Response` to the archive."""
+        self.write(response.url, response.status_code, response.headers, response.content, response.reason or '')
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_index(directory):
+    """
+    Reads the index of an archive directory.
+
+    Returns:
+    - entries (list): A list of (uri, file, offset, length, status, date) tuples in write order.
+    """
+
+    entries = []
+    with open(Path(directory) / INDEX_NAME, encoding='utf-8') as f:
+        for line in f:
+            uri, file, offset, length, status, date = line.rstrip('\n').split('\t')
+            entries.append((uri, file, int(offset), int(length), int(status), date))
+    return entries
+
+
+def parse_record(data):
+    """
+    Splits a decompressed WARC response record.
+
+    Returns:
+    - (status, headers, body): The HTTP status code, a dict of HTTP headers and the body bytes.
+    """
+
+    _, block = data.split(b'\r\n\r\n', 1)
+    http_head, body = block.split(b'\r\n\r\n', 1)
+    status_line, *header_lines = http_head.decode('utf-8', errors='replace').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in header_lines if ': ' in line)
+    body = body[:int(headers.get('Content-Length', len(body) - 4))]
+    return int(status_line.split(' ')[1]), headers, body
+
+
+def read_record(path, offset, length):
+    """Reads the record stored at `offset` in an archive file and returns (status, headers, body)."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return parse_record(zlib.decompress(f.read(length), wbits=31))
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import random
+import shutil
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+
+from archive import ResponseArchive
+from download import prepare, save_response_async, is_valid_pdf
+from frontier import CrawlFrontier
+from parsers import parse_journal_list, parse_issue_list, parse_article_list, parse_article
+from replay_server import page_filename
+from throttle import AsyncTokenBucket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+SEARCH_PAGES = [''] + [f'/{i}' for i in range(2, 83)]
+JOURNAL_REFRESH_DAYS = 7
+
+
+class DergiparkCrawler:
+    """
+    Crawls Dergipark journals, issues, articles and PDFs concurrently over a single pooled HTTP client.
+
+    Page fetches and PDF downloads run in separate worker pools connected by a bounded queue, so PDFs
+    are downloaded while the next pages are being fetched. Every request passes through a per-host token
+    bucket. The output layout is the same as `dergipark.py`: `pdf/`, `metadata/` and `journals.csv`.
+
+    Args:
+    - base_url (str): The site root. Point it at a replay server to crawl recorded pages.
+    - output_dir (str or Path): The directory holding `pdf/`, `metadata/` and `journals.csv`.
+    - concurrency (int): The number of page workers.
+    - pdf_concurrency (int): The number of PDF download workers.
+    - rate (float): The maximum number of requests per second per host.
+    - burst (int): The number of requests that may be sent back to back per host.
+    - retries (int): The number of retries for failed requests and retryable status codes.
+    - backoff_factor (float): The base delay in seconds of the exponential backoff between retries.
+    - record_dir (str or Path): If given, every successful response is saved here for `replay_server.py`.
+    - archive_dir (str or Path): If given, every fetched HTML page is appended to a response archive here.
+    - frontier_path (str or Path): If given, a crawl frontier database. Listing pages are then requested
+      conditionally and only new, changed or unfinished issues and articles are visited.
+    """
+
+    def __init__(self, base_url='https://dergipark.org.tr', output_dir='.', concurrency=4, pdf_concurrency=2,
+                 rate=1.0, burst=2, retries=5, backoff_factor=1.0, record_dir=None, archive_dir=None, frontier_path=None):
+        self.base_url = base_url.rstrip('/')
+        self.output_dir = Path(output_dir)
+        self.concurrency = concurrency
+        self.pdf_concurrency = pdf_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.record_dir = Path(record_dir) if record_dir else None
+        self.archive = ResponseArchive(archive_dir, prefix='dergipark') if archive_dir else None
+        self.frontier = CrawlFrontier(frontier_path) if frontier_path else None
+        self.visited_issues = set()
+        self.buckets = {}
+        self.session = None
+
+    def local_url(self, href):
+        """Maps an absolute or relative Dergipark link onto `base_url`."""
+        parts = urlsplit(href)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        return urljoin(self.base_url + '/', path.lstrip('/'))
+
+    def record_path(self, url):
+        parts = urlsplit(url)
+        return self.record_dir / page_filename(parts.path + (f'?{parts.query}' if parts.query else ''))
+
+    async def request(self, url, handle, headers=None):
+        """
+        Sends a rate-limited GET request, retrying connection errors and retryable status codes with exponential backoff.
+
+        Args:
+        - url (str): The URL to request.
+        - handle (coroutine function): Called with the response on success; its return value is returned.
+        - headers (dict): Extra request headers.
+
+        Returns:
+        - (status, result): The final status code (None if the connection failed) and the result of `handle`.
+        """
+
+        host = urlsplit(url).netloc
+        bucket = self.buckets.setdefault(host, AsyncTokenBucket(self.rate, self.burst))
+        status = None
+
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            retry_after = None
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    status = response.status
+                    if status not in RETRY_STATUSES:
+                        return status, await handle(response) if status in (200, 206) else None
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = None
+                logger.warning(f'Request to {url} failed: {e!r}')
+
+            if attempt < self.retries:
+                delay = self.backoff_factor * 2 ** attempt * (1 + random.random())
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                logger.warning(f'Retrying {url} in {delay:.1f}s (status {status})')
+                await asyncio.sleep(delay)
+
+        return status, None
+
+    async def fetch(self, url, headers=None):
+        """Fetches a page and returns its status code, body and response headers."""
+
+        async def read(response):
+            body = await response.read()
+            if self.archive:
+                self.archive.write(url, response.status, response.headers, body, response.reason or '')
+            if self.record_dir:
+                self.record_path(url).write_bytes(body)
+            return body, response.headers
+
+        status, result = await self.request(url, read, headers)
+        return (status, *result) if result else (status, None, None)
+
+    async def fetch_listing(self, url, parse):
+        """
+        Fetches a listing page, conditionally if the frontier has seen it before.
+
+        Returns:
+        - (ok, links): Whether the page was retrieved or is unchanged, and its links if it was parsed.
+        """
+
+        status, body, headers = await self.fetch(url, self.frontier.conditional_headers(url) if self.frontier else None)
+        if status == 304 and self.frontier:
+            self.frontier.record_page(url, {}, None)
+            return True, []
+        if status != 200:
+            return False, []
+        links = parse(body)
+        if self.frontier:
+            self.frontier.record_page(url, headers, links)
+        return True, links
+
+    async def download(self, url, destination_path):
+        """Streams a PDF to `destination_path`, resuming a partial download, and returns True on success."""
+
+        part_path, offset = prepare(destination_path)
+
+        async def save(response):
+            saved = await save_response_async(response, destination_path, offset)
+            if saved and self.record_dir:
+                shutil.copyfile(destination_path, self.record_path(url))
+            return saved
+
+        status, saved = await self.request(url, save, {'Range': f'bytes={offset}-'} if offset else None)
+        if status == 416:
+            part_path.unlink()
+            return await self.download(url, destination_path)
+        if status == 206 and saved is None and offset:
+            # The server answered with another range and the partial file was removed, start over without one
+            return await self.download(url, destination_path)
+        return bool(saved)
+
+    async def get_journal_list(self):
+        """Fetches all journal search pages concurrently and writes `journals.csv`."""
+
+        async def get_page(page_no):
+            url = f'{self.base_url}/en/search{page_no}?aggs%5BmandatoryLang%5D%5B11%5D=tr&section=journal&q='
+            status, body, _ = await self.fetch(url)
+            if status != 200:
+                logger.error(f'Failed to retrieve page {page_no}')
+                return []
+            return parse_journal_list(body)
+
+        pages = await asyncio.gather(*[get_page(page_no) for page_no in SEARCH_PAGES])
+        all_journals = list(set(link for page in pages for link in page))
+
+        with open(self.output_dir / 'journals.csv', 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['0'])
+            writer.writerows([link] for link in all_journals)
+
+        if self.frontier:
+            self.frontier.add_journals(all_journals)
+            self.frontier.record_page(self.search_url, {}, all_journals)
+        return all_journals
+
+    @property
+    def search_url(self):
+        return f'{self.base_url}/en/search?aggs%5BmandatoryLang%5D%5B11%5D=tr&section=journal&q='
+
+    async def crawl_journal(self, journal_code, pages):
+        ok, issue_links = await self.fetch_listing(f'{self.base_url}/en/pub/{journal_code}/archive',
+                                                   lambda body: parse_issue_list(body, journal_code))
+        if not ok:
+            logger.error(f'Failed to retrieve journal issues {journal_code}')
+            return
+
+        issue_numbers = [issue_link.split('/')[-1].strip() for issue_link in issue_links]
+        if self.frontier:
+            self.frontier.add_issues(journal_code, issue_numbers)
+            self.frontier.visit_journal(journal_code)
+            # New issues, unfinished issues and the newest issue of the journal
+            issue_numbers = self.frontier.pending_issues(journal_code)
+
+        for issue_number in issue_numbers:
+            pages.put_nowait(('issue', journal_code, issue_number))
+
+    async def crawl_issue(self, journal_code, issue_number, pages):
+        ok, article_links = await self.fetch_listing(f'{self.base_url}/en/pub/{journal_code}/issue/{issue_number}',
+                                                     lambda body: parse_article_list(body, journal_code, issue_number))
+        if not ok:
+            logger.error(f'Failed to retrieve articles from journal {journal_code} {issue_number}')
+            return
+
+        article_nos = [article_link.split('/')[-1].strip() for article_link in article_links]
+        if self.frontier:
+            self.frontier.add_articles(journal_code, issue_number, article_nos)
+            self.visited_issues.add((journal_code, issue_number))
+            article_nos = self.frontier.pending_articles(journal_code, issue_number)
+
+        for article_no in article_nos:
+            name = f'{journal_code}_{issue_number}_{article_no}'
+            if (self.output_dir / 'metadata' / f'{name}.json').is_file() and is_valid_pdf(self.output_dir / 'pdf' / f'{name}.pdf'):
+                self.complete_article(journal_code, issue_number, article_no)
+                continue
+            pages.put_nowait(('article', journal_code, issue_number, article_no))
+
+    def complete_article(self, journal_code, issue_number, article_no):
+        if self.frontier:
+            self.frontier.complete_article(journal_code, issue_number, article_no)
+
+    async def crawl_article(self, journal_code, issue_number, article_no, pdfs):
+        status, body, _ = await self.fetch(f'{self.base_url}/en/pub/{journal_code}/issue/{issue_number}/{article_no}')
+        if status != 200:
+            logger.error(f'Failed to retrieve article {journal_code} {issue_number} {article_no}')
+            return
+
+        article_data, download_link = parse_article(body)
+        if article_data is None:
+            logger.error(f'Failed to retrieve article {journal_code} {issue_number} {article_no}: tr element not found')
+            return
+
+        if download_link:
+            # Blocks when the PDF workers fall behind, which throttles page fetching
+            await pdfs.put((self.local_url(download_link), (journal_code, issue_number, article_no), article_data))
+        else:
+            self.complete_article(journal_code, issue_number, article_no)
+
+    async def page_worker(self, pages, pdfs):
+        while True:
+            kind, *item = await pages.get()
+            try:
+                if kind == 'journal':
+                    await self.crawl_journal(*item, pages)
+                elif kind == 'issue':
+                    await self.crawl_issue(*item, pages)
+                else:
+                    await self.crawl_article(*item, pdfs)
+            except Exception as e:
+                logger.error(f'Unexpected error while crawling {kind} {item}: {e!r}')
+            finally:
+                pages.task_done()
+
+    async def pdf_worker(self, pdfs):
+        while True:
+            url, article, article_data = await pdfs.get()
+            name = '_'.join(article)
+            try:
+                if await self.download(url, self.output_dir / 'pdf' / f'{name}.pdf'):
+                    with open(self.output_dir / 'metadata' / f'{name}.json', 'w', encoding='utf-8') as f:
+                        json.dump(article_data, f)
+                    self.complete_article(*article)
+                    logger.info(f'{name}.pdf downloaded successfully.')
+                else:
+                    logger.error(f'Failed to download the PDF from {url}')
+            except Exception as e:
+                logger.error(f'Unexpected error while downloading {url}: {e!r}')
+            finally:
+                pdfs.task_done()
+
+    async def run(self, journal_links=None):
+        """
+        Crawls the given journals, or every journal listed by the search pages if none are given.
+
+        Args:
+        - journal_links (list): Journal links as stored in `journals.csv`.
+        """
+
+        (self.output_dir / 'pdf').mkdir(parents=True, exist_ok=True)
+        (self.output_dir / 'metadata').mkdir(parents=True, exist_ok=True)
+        if self.record_dir:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency + self.pdf_concurrency)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self.session = session
+
+            if journal_links is None and self.frontier and self.frontier.visited_within(self.search_url, JOURNAL_REFRESH_DAYS):
+                journal_links = self.frontier.journal_links()
+            if not journal_links:
+                journal_links = await self.get_journal_list()
+
+            pages = asyncio.Queue()
+            pdfs = asyncio.Queue(maxsize=self.pdf_concurrency * 4)
+            for journal_link in journal_links:
+                pages.put_nowait(('journal', journal_link.split('/')[-1].strip()))
+
+            workers = [asyncio.create_task(self.page_worker(pages, pdfs)) for _ in range(self.concurrency)]
+            workers += [asyncio.create_task(self.pdf_worker(pdfs)) for _ in range(self.pdf_concurrency)]
+
+            await pages.join()
+            await pdfs.join()
+
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        if self.frontier:
+            for journal_code, issue_number in self.visited_issues:
+                self.frontier.visit_issue(journal_code, issue_number)
+            self.frontier.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Crawls Dergipark concurrently with a per-host rate limit.')
+    arg_parser.add_argument('-o', '--output', type=str, help='The output directory.', default='.')
+    arg_parser.add_argument('-b', '--base_url', type=str, help='The site root, e.g. a local replay server.', default='https://dergipark.org.tr')
+    arg_parser.add_argument('-n', '--concurrency', type=int, help='The number of concurrent page fetches.', default=4)
+    arg_parser.add_argument('-d', '--pdf_concurrency', type=int, help='The number of concurrent PDF downloads.', default=2)
+    arg_parser.add_argument('-r', '--rate', type=float, help='The maximum number of requests per second per host.', default=1.0)
+    arg_parser.add_argument('--burst', type=int, help='The number of requests that may be sent back to back per host.', default=2)
+    arg_parser.add_argument('-j', '--journals', type=str, help='Reuse an existing journals.csv instead of fetching the search pages.')
+    arg_parser.add_argument('--record', type=str, help='Save every fetched page to this directory for replay_server.py.')
+    arg_parser.add_argument('-a', '--archive', type=str, help='Append every fetched page to a response archive in this directory.', default='archive')
+    arg_parser.add_argument('-f', '--frontier', type=str, help='The crawl frontier database, pass an empty string to crawl everything.', default='frontier.sqlite')
+    args = arg_parser.parse_args()
+
+    journal_links = None
+    if args.journals:
+        with open(args.journals, newline='') as f:
+            journal_links = [row[0] for row in csv.reader(f)][1:]
+
+    crawler = DergiparkCrawler(args.base_url, args.output, args.concurrency, args.pdf_concurrency,
+                               args.rate, args.burst, record_dir=args.record, archive_dir=args.archive,
+                               frontier_path=args.frontier)
+    asyncio.run(crawler.run(journal_links))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import logging
+import re
+import sys
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import unquote
+
+from bs4 import BeautifulSoup
+
+import parsers
+from archive import read_index, parse_record
+from download import PDF_MAGIC
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+page_patterns = [
+    ('article', re.compile(r'/pub/([^/]+)/issue/([^/]+)/([^/?#]+)$')),
+    ('issue', re.compile(r'/pub/([^/]+)/issue/([^/?#]+)$')),
+    ('archive', re.compile(r'/pub/([^/]+)/archive$')),
+    ('search', re.compile(r'/search')),
+    ('thesis', re.compile(r'tezDetay\.jsp\?id=')),
+]
+
+
+# The whole-page html.parser versions the parsers in parsers.py must agree with
+
+def reference_journal_list(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    return [element['href'] for element in soup.find_all('a', href=lambda href: href and 'https://dergipark.org.tr/en/pub/' in href)]
+
+
+def reference_issue_list(content, journal_code):
+    soup = BeautifulSoup(content, 'html.parser')
+    issue_elements = soup.find_all('a', href=lambda href: href and f'dergipark.org.tr/en/pub/{journal_code}/issue/' in href)
+    return list(dict.fromkeys(element['href'] for element in issue_elements))
+
+
+def reference_article_list(content, journal_code, issue_number):
+    soup = BeautifulSoup(content, 'html.parser')
+    article_pattern = re.compile(f'{re.escape(journal_code)}/issue/{re.escape(issue_number)}/[^/?#]+$')
+    article_elements = soup.find_all('a', href=lambda href: href and article_pattern.search(href))
+    return list(dict.fromkeys(element['href'] for element in article_elements))
+
+
+def reference_article(content):
+    soup = BeautifulSoup(content, 'html.parser')
+    article_tr = soup.find(id='article_tr')
+    if article_tr is None:
+        return None, ''
+    article_data = {}
+    for class_name in parsers.classes:
+        element_value = article_tr.find(class_=class_name)
+        article_data[class_name] = element_value.text.strip() if element_value else ''
+    link = soup.find('a', href=lambda href: href and 'download/article-file/' in href)
+    return article_data, link.get('href') if link else ''
+
+
+def reference_thesis_detail(text):
+    saved = parsers.make_soup
+    parsers.make_soup = lambda content, parse_only: BeautifulSoup(content, 'html.parser')
+    try:
+        return parsers.parse_thesis_detail(text)
+    finally:
+        parsers.make_soup = saved
+
+
+def extractors(kind, match):
+    """Returns the reference and the selective extraction function for a page."""
+    if kind == 'article':
+        return reference_article, parsers.parse_article
+    if kind == 'issue':
+        return (lambda c: reference_article_list(c, *match.groups()),
+                lambda c: parsers.parse_article_list(c, *match.groups()))
+    if kind == 'archive':
+        return (lambda c: reference_issue_list(c, match.group(1)),
+                lambda c: parsers.parse_issue_list(c, match.group(1)))
+    if kind == 'search':
+        return reference_journal_list, parsers.parse_journal_list
+    return (lambda c: reference_thesis_detail(c.decode('utf-8', errors='replace')),
+            lambda c: parsers.parse_thesis_detail(c.decode('utf-8', errors='replace')))
+
+
+def classify(uri):
+    for kind, pattern in page_patterns:
+        match = pattern.search(uri)
+        if match:
+            return kind, match
+    return None, None
+
+
+def load_pages(pages_dir=None, archive_dir=None, sources_dir=None):
+    """Yields (uri, body) for recorded pages, archived 200 responses and saved YÖK Tez detail pages."""
+    if pages_dir:
+        for path in sorted(Path(pages_dir).iterdir()):
+            yield '/' + unquote(path.name), path.read_bytes()
+    if archive_dir:
+        for uri, file, offset, length, status, date in read_index(Path(archive_dir)):
+            with open(Path(archive_dir) / file, 'rb') as f:
+                f.seek(offset)
+                status, _, body = parse_record(zlib.decompress(f.read(length), wbits=31))
+            if status == 200:
+                yield uri, body
+    if sources_dir:
+        for path in sorted(Path(sources_dir).glob('*.html')):
+            yield f'/UlusalTezMerkezi/tezDetay.jsp?id={path.stem}', path.read_bytes()
+
+
+def timed(function, body, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(body)
+    return result, time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compares the selective parsers with whole-page html.parser parsing on saved pages.')
+    arg_parser.add_argument('-p', '--pages', type=str, help='A directory of pages recorded with async_dergipark.py --record.')
+    arg_parser.add_argument('-a', '--archive', type=str, help='A response archive directory.')
+    arg_parser.add_argument('-s', '--sources', type=str, help='A directory of detail pages saved with yok-tez.py --sources.')
+    arg_parser.add_argument('-r', '--repeat', type=int, help='The number of times each page is parsed.', default=5)
+    args = arg_parser.parse_args()
+
+    totals = defaultdict(lambda: [0, 0.0, 0.0])
+    mismatches = 0
+    for uri, body in load_pages(args.pages, args.archive, args.sources):
+        kind, match = classify(uri)
+        if kind is None or body.startswith(PDF_MAGIC):
+            continue
+        reference, selective = extractors(kind, match)
+        expected, reference_time = timed(reference, body, args.repeat)
+        result, selective_time = timed(selective, body, args.repeat)
+        if result != expected:
+            mismatches += 1
+            logger.error(f'Mismatch for {uri}:\n  reference: {expected}\n  selective: {result}')
+        totals[kind][0] += 1
+        totals[kind][1] += reference_time
+        totals[kind][2] += selective_time
+
+    print(f'Parser backend: {parsers.PARSER}')
+    print(f'{"page":<10}{"count":>8}{"html.parser ms":>16}{"selective ms":>14}{"speedup":>9}')
+    for kind, (count, reference_time, selective_time) in sorted(totals.items()):
+        per_page = 1000 / (count * args.repeat)
+        print(f'{kind:<10}{count:>8}{reference_time * per_page:>16.2f}{selective_time * per_page:>14.2f}'
+              f'{reference_time / max(selective_time, 1e-9):>8.1f}x')
+    print(f'{mismatches} mismatching pages')
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import csv
+import importlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import unquote
+
+from async_dergipark import DergiparkCrawler
+from bench_parsers import classify
+from parsers import download_link_pattern
+from replay_server import ERROR_STATUSES, ReplayHandler, Simulation, YokTezMockHandler, page_filename, serve
+from resmigazete import GazetteFetcher
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCRAPERS = ('dergipark', 'yoktez', 'gazette')
+FIRST_DAY = date(2020, 1, 1)
+
+
+def synthetic_pdf(key, size):
+    """Returns a PDF-looking file of about `size` bytes that passes the checks of `download.py`."""
+    key = key.encode('ascii')
+    return b'%PDF-1.4\n' + key * max(1, size // len(key)) + b'\n%%EOF\n'
+
+
+def write_page(root, path, body):
+    (root / page_filename(path)).write_bytes(body)
+
+
+def build_dergipark(root, journals, issues, articles, pdf_size):
+    """
+    Writes the archive, issue and article pages and the PDFs of a small synthetic Dergipark.
+
+    Returns:
+    - (journal_links, expected): The journal links to crawl and the number of PDFs they lead to.
+    """
+
+    journal_links = []
+    for j in range(journals):
+        code = f'dergi{j}'
+        journal_links.append(f'https://dergipark.org.tr/en/pub/{code}')
+        issue_links = ''.join(f'<a href="https://dergipark.org.tr/en/pub/{code}/issue/{n}">Sayı {n}</a>' for n in range(1, issues + 1))
+        write_page(root, f'/en/pub/{code}/archive', f'<html><body>{issue_links}</body></html>'.encode('utf-8'))
+        for n in range(1, issues + 1):
+            article_links = ''.join(f'<a href="https://dergipark.org.tr/en/pub/{code}/issue/{n}/{n * 1000 + a}">Makale</a>' for a in range(articles))
+            write_page(root, f'/en/pub/{code}/issue/{n}', f'<html><body>{article_links}</body></html>'.encode('utf-8'))
+            for a in range(articles):
+                article_no = n * 1000 + a
+                file_id = f'{j}{article_no}'
+                write_page(root, f'/en/pub/{code}/issue/{n}/{article_no}', (
+                    f'<html><body><div id="article_tr"><h3 class="article-title">Makale {article_no}</h3>'
+                    f'<p class="article-authors">Yazar {a}</p><div class="article-abstract">{"Özet metni. " * 50}</div>'
+                    f'<div class="article-keywords">anahtar, kelime</div></div>'
+                    f'<a href="/tr/download/article-file/{file_id}">Tam Metin</a></body></html>').encode('utf-8'))
+                write_page(root, f'/tr/download/article-file/{file_id}', synthetic_pdf(file_id, pdf_size))
+    return journal_links, journals * issues * articles
+
+
+def import_dergipark(root, pages_dir, pdf_size):
+    """
+    Copies pages recorded with `async_dergipark.py --record`, and adds a synthetic PDF for every recorded
+    article whose PDF was not recorded.
+
+    Returns:
+    - (journal_links, expected): The journals with a recorded archive page and the number of recorded articles with a PDF link.
+    """
+
+    journal_links = []
+    expected = 0
+    for path in sorted(Path(pages_dir).iterdir()):
+        shutil.copyfile(path, root / path.name)
+        kind, match = classify('/' + unquote(path.name))
+        if kind == 'archive':
+            journal_links.append(f'https://dergipark.org.tr/en/pub/{match.group(1)}')
+        elif kind == 'article':
+            link = download_link_pattern.search(path.read_bytes().decode('utf-8', 'replace'))
+            if link:
+                expected += 1
+                pdf = root / page_filename(link.group(1).split('dergipark.org.tr', 1)[-1])
+                if not pdf.exists():
+                    pdf.write_bytes(synthetic_pdf(path.name, pdf_size))
+    return journal_links, expected
+
+
+def build_gazette(root, days, annexes, pdf_size):
+    """
+    Writes the PDF, the HTML page and `annexes` linked annex pages of `days` synthetic Resmi Gazete dates.
+
+    Returns:
+    - (start_date, end_date, expected): The dates to fetch and the number of files they have.
+    """
+
+    for offset in range(days):
+        day = FIRST_DAY + timedelta(days=offset)
+        date_str = day.strftime('%Y%m%d')
+        folder = f'/eskiler/{day.year}/{day.month:02d}'
+        links = ''.join(f'<a href="{date_str}-{k}.htm">Ek {k}</a><br>' for k in range(1, annexes + 1))
+        write_page(root, f'{folder}/{date_str}.htm', f'<html><body><p>Resmî Gazete {date_str}</p>{links}</body></html>'.encode('utf-8'))
+        write_page(root, f'{folder}/{date_str}.pdf', synthetic_pdf(date_str, pdf_size))
+        for k in range(1, annexes + 1):
+            write_page(root, f'{folder}/{date_str}-{k}.htm', f'<html><body>{"<p>Madde metni.</p>" * 200}</body></html>'.encode('utf-8'))
+    return FIRST_DAY, FIRST_DAY + timedelta(days=days - 1), days * (annexes + 2)
+
+
+def import_gazette(root, directory):
+    """
+    Copies the `pdf/` and `htm/` folders written by `resmigazete.py` to the paths they were downloaded from.
+
+    Returns:
+    - (start_date, end_date, expected): The first and last recorded dates and the number of recorded files.
+    """
+
+    directory = Path(directory)
+    files = [(path.stem, path.name, path) for path in directory.glob('pdf/*.pdf')]
+    files += [(path.parent.name, path.name, path) for path in directory.glob('htm/*/*.htm*')]
+    files = [(date_str, name, path) for date_str, name, path in files if len(date_str) == 8 and date_str.isdigit()]
+    for date_str, name, path in files:
+        shutil.copyfile(path, root / page_filename(f'/eskiler/{date_str[:4]}/{date_str[4:6]}/{name}'))
+    days = sorted({date_str for date_str, _, _ in files})
+    if not days:
+        raise ValueError(f'No Resmi Gazete files found in {directory}')
+    start_date, end_date = (date(int(d[:4]), int(d[4:6]), int(d[6:])) for d in (days[0], days[-1]))
+    return start_date, end_date, len(files)
+
+
+def run_dergipark(base_url, work_dir, concurrency, args, journal_links):
+    crawler = DergiparkCrawler(base_url, work_dir, concurrency, max(1, concurrency // 2), args.client_rate, concurrency,
+                               args.retries, args.backoff_factor, archive_dir=work_dir / 'archive')
+    asyncio.run(crawler.run(journal_links))
+    return len(list((work_dir / 'pdf').glob('*.pdf')))
+
+
+def run_yoktez(base_url, work_dir, concurrency, args, start_id, end_id):
+    yoktez = importlib.import_module('yok-tez')
+    # The fetcher and its work queue write next to the module, so they are pointed at the run directory
+    yoktez.THIS_DIR = str(work_dir)
+    yoktez.fetch_pdf_files_parallel(start_id, end_id, get_pdfs=True, get_mds=True, base_url=base_url, num_workers=concurrency,
+                                    chunk_size=max(1, (end_id - start_id + 1) // (concurrency * 4)), rate=args.client_rate)
+    return len(list((work_dir / 'pdfs').glob('*.pdf')))
+
+
+def run_gazette(base_url, work_dir, concurrency, args, start_date, end_date):
+    # resmigazete.py writes pdf/ and htm/ in the working directory
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        GazetteFetcher(base_url, concurrency, args.client_rate).run(start_date, end_date)
+    finally:
+        os.chdir(cwd)
+    return len(list((work_dir / 'pdf').glob('*.pdf'))) + len(list((work_dir / 'htm').glob('*/*.htm*')))
+
+
+def make_simulation(args, seed):
+    return Simulation(args.latency, args.jitter, args.error_rate, args.error_statuses, args.rate_limit, args.burst, seed)
+
+
+def prepare_sites(args, corpus_dir):
+    """Builds or imports the corpus of every selected scraper and starts its stand-in server."""
+    sites = {}
+    if 'dergipark' in args.scrapers:
+        root = corpus_dir / 'dergipark'
+        root.mkdir()
+        if args.dergipark:
+            journal_links, expected = import_dergipark(root, args.dergipark, args.pdf_kb * 1024)
+        else:
+            journal_links, expected = build_dergipark(root, args.journals, args.issues, args.articles, args.pdf_kb * 1024)
+        sites['dergipark'] = (serve(root, simulation=make_simulation(args, args.seed)), run_dergipark, (journal_links,), expected)
+    if 'yoktez' in args.scrapers:
+        ids = sorted(int(path.stem) for path in Path(args.yoktez).glob('*.html') if path.stem.isdigit()) if args.yoktez else []
+        start_id, end_id = (ids[0], ids[-1]) if ids else (1, args.theses)
+        expected = sum(1 for thesis_id in range(start_id, end_id + 1) if thesis_id % args.empty_every)
+        server = serve(args.yoktez, handler=YokTezMockHandler, empty_every=args.empty_every, simulation=make_simulation(args, args.seed),
+                       pdf_repeat=max(1, args.pdf_kb * 1024 // 7))
+        sites['yoktez'] = (server, run_yoktez, (start_id, end_id), expected)
+    if 'gazette' in args.scrapers:
+        root = corpus_dir / 'gazette'
+        root.mkdir()
+        if args.gazette:
+            start_date, end_date, expected = import_gazette(root, args.gazette)
+        else:
+            start_date, end_date, expected = build_gazette(root, args.days, args.annexes, args.pdf_kb * 1024)
+        sites['gazette'] = (serve(root, handler=ReplayHandler, simulation=make_simulation(args, args.seed)), run_gazette, (start_date, end_date), expected)
+    return sites
+
+
+def bench(name, site, concurrency, args):
+    """Runs a scraper once against its stand-in in an empty directory and returns its measurements."""
+    server, runner, runner_args, expected = site
+    simulation = server.simulation
+    simulation.reset()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        stored = runner(base_url, Path(work_dir), concurrency, args, *runner_args)
+        seconds = time.perf_counter() - start
+    counts = simulation.snapshot()
+    # Every request that neither succeeded nor hit a missing page was a failure the scraper retried or gave up on
+    failed = counts['requests'] - counts['ok'] - counts['not_found']
+    return {'scraper': name, 'concurrency': concurrency, 'seconds': round(seconds, 3), 'requests': counts['requests'],
+            'ok': counts['ok'], 'errors': counts['errors'], 'limited': counts['limited'],
+            'pages_per_second': round(counts['ok'] / seconds, 2), 'mb_per_second': round(counts['bytes'] / seconds / 2 ** 20, 3),
+            'retry_overhead': round(failed / max(counts['ok'], 1), 4), 'expected': expected, 'stored': stored, 'lost': expected - stored}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Measures the throughput and retry overhead of the scrapers against local stand-ins of the sites.')
+    arg_parser.add_argument('-s', '--scrapers', nargs='+', choices=SCRAPERS, help='The scrapers to run.', default=list(SCRAPERS))
+    arg_parser.add_argument('-n', '--concurrency', type=int, nargs='+', help='The numbers of workers to run each scraper with.', default=[1, 4])
+    arg_parser.add_argument('-o', '--output', type=str, help='Write the measurements to this CSV file.')
+    arg_parser.add_argument('-v', '--verbose', action='store_true', help='Show the log of the scrapers.')
+
+    corpus = arg_parser.add_argument_group('corpus', 'Recorded pages are used when given, a synthetic corpus otherwise.')
+    corpus.add_argument('--dergipark', type=str, help='A directory of pages recorded with async_dergipark.py --record.')
+    corpus.add_argument('--gazette', type=str, help='A directory with the pdf/ and htm/ folders of resmigazete.py.')
+    corpus.add_argument('--yoktez', type=str, help='A directory of detail pages saved with yok-tez.py --sources.')
+    corpus.add_argument('--journals', type=int, help='The number of synthetic journals.', default=3)
+    corpus.add_argument('--issues', type=int, help='The number of issues per synthetic journal.', default=3)
+    corpus.add_argument('--articles', type=int, help='The number of articles per synthetic issue.', default=6)
+    corpus.add_argument('--days', type=int, help='The number of synthetic Resmi Gazete dates.', default=20)
+    corpus.add_argument('--annexes', type=int, help='The number of annex pages per synthetic date.', default=3)
+    corpus.add_argument('--theses', type=int, help='The number of TezNo values to fetch from the thesis mock.', default=200)
+    corpus.add_argument('--empty_every', type=int, help='Every TezNo divisible by this has no search result.', default=10)
+    corpus.add_argument('--pdf_kb', type=int, help='The size of the synthetic PDFs in kilobytes.', default=100)
+
+    server = arg_parser.add_argument_group('stand-in')
+    server.add_argument('--latency', type=float, help='The delay of every answer in milliseconds.', default=20)
+    server.add_argument('--jitter', type=float, help='A random extra delay of up to this many milliseconds.', default=10)
+    server.add_argument('--error_rate', type=float, help='The share of requests answered with a server error.', default=0.02)
+    server.add_argument('--error_statuses', type=int, nargs='+', help='The statuses of the server errors.', default=list(ERROR_STATUSES))
+    server.add_argument('--rate_limit', type=float, help='Answer 429 above this many requests per second, 0 disables it.', default=0)
+    server.add_argument('--burst', type=int, help='The number of requests that may arrive back to back under the rate limit.', default=4)
+    server.add_argument('--seed', type=int, help='The seed of the injected errors and jitter.', default=0)
+
+    client = arg_parser.add_argument_group('scrapers')
+    client.add_argument('--client_rate', type=float, help='The request rate budget of the scrapers.', default=1000)
+    client.add_argument('--retries', type=int, help='The retries of async_dergipark.py.', default=5)
+    client.add_argument('--backoff_factor', type=float, help='The base backoff delay of async_dergipark.py in seconds.', default=1.0)
+    args = arg_parser.parse_args()
+
+    # The scrapers log every page; their failures are counted in the table instead
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    logger.setLevel(logging.INFO)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        sites = prepare_sites(args, Path(corpus_dir))
+        for name, site in sites.items():
+            for concurrency in args.concurrency:
+                logger.info(f'Running {name} with {concurrency} workers')
+                rows.append(bench(name, site, concurrency, args))
+        for server, *_ in sites.values():
+            server.shutdown()
+            server.server_close()
+
+    if args.output and rows:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+    print(f'{"scraper":<10}{"workers":>8}{"seconds":>9}{"requests":>9}{"errors":>7}{"429":>5}'
+          f'{"pages/s":>9}{"MB/s":>8}{"retry %":>8}{"stored":>8}{"lost":>6}')
+    for row in rows:
+        print(f'{row["scraper"]:<10}{row["concurrency"]:>8}{row["seconds"]:>9.2f}{row["requests"]:>9}{row["errors"]:>7}{row["limited"]:>5}'
+              f'{row["pages_per_second"]:>9.1f}{row["mb_per_second"]:>8.2f}{row["retry_overhead"] * 100:>7.1f}%'
+              f'{row["stored"]:>8}{row["lost"]:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,53 @@
 import requests
 import pandas as pd
-from bs4 import BeautifulSoup
 from pathlib import Path 
 import logging
 import json
 import time
+from archive import ResponseArchive
+from download import download_file, is_valid_pdf
+from frontier import CrawlFrontier
+from parsers import parse_journal_list, parse_issue_list, parse_article_list, parse_article
 
 logging.basicConfig(level=logging.INFO)
 
-def get_url(url): 
+session = requests.Session()
+retry_strategy = requests.adapters.Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
+adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+# Every fetched page is kept so that metadata can be re-extracted offline with reparse.py
+archive = ResponseArchive('archive', prefix='dergipark')
+
+# Journals, issues and articles seen by earlier runs, so that recrawls only visit what is new or changed
+frontier = CrawlFrontier('frontier.sqlite')
+JOURNAL_REFRESH_DAYS = 7
+
+def get_url(url, headers=None): 
     """
     Sends a GET request to the specified URL and handles retries for certain HTTP status codes.
+    The module-level session is reused so that connections are pooled across requests.
+    HTML responses are appended to the response archive.
 
     Args:
     - url (str): The URL to send the request to.
+    - headers (dict): Extra request headers, e.g. conditional request headers.
 
     Returns:
     - response (requests.Response): The response object obtained from the request.
     """
 
-    session = requests.Session()
-    retry_strategy = requests.adapters.Retry(total=5, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504])
-    adapter = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    
-    return session.get(url, timeout=10)
+    response = session.get(url, headers=headers, timeout=10)
+    if 'text/html' in response.headers.get('Content-Type', ''):
+        archive.write_response(response)
+    return response
     
     
 def download_pdf(url, destination_path):
     """
     Downloads a PDF file from the specified URL and saves it to the destination path.
+    The file is streamed to a temporary file, verified and then moved into place.
 
     Args:
     - url (str): The URL of the PDF file to download.
@@ -40,15 +57,13 @@ def download_pdf(url, destination_path):
     None
     """
     
-    response = get_url(url)
-    
-    if response.status_code == 200:
-        with open(destination_path, 'wb') as file:
-            file.write(response.content)
-        
-        logging.info('PDF downloaded successfully.')
-    else:
-        logging.error(f'Failed to download the PDF from {url}. Response: {response}')
+    try:
+        if download_file(session, url, destination_path):
+            logging.info('PDF downloaded successfully.')
+        else:
+            logging.error(f'Failed to download the PDF from {url}.')
+    except requests.RequestException as e:
+        logging.error(f'Failed to download the PDF from {url}: {e}')
 
 
 def download_article(journal_code, issue_number, article_no):
@@ -62,30 +77,18 @@ def download_article(journal_code, issue_number, article_no):
 
     Returns:
     - article_data (dict): A dictionary containing the extracted article metadata.
+    - has_pdf (bool): Whether the article page links to a PDF.
     """
 
     url = f'https://dergipark.org.tr/en/pub/{journal_code}/issue/{issue_number}/{article_no}'
     response = get_url(url)
     
     if response.status_code == 200:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        article_tr = soup.find(id='article_tr')
+        article_data, download_link = parse_article(response.content)
 
-        if article_tr is None: 
+        if article_data is None: 
             logging.error(f'Failed to retrieve article {journal_code} {issue_number} {article_no}: tr element not found')
-            return {}
-
-        article_data = {}
-
-        for class_name in classes:
-            element_value = article_tr.find(class_=class_name)
-            article_data[class_name] = element_value.text.strip() if element_value else ''
-
-        download_link = ''
-
-        for link in soup.find_all('a', href=lambda href: href and 'download/article-file/' in href):
-            download_link = link.get('href')
-            break
+            return {}, False
 
         if download_link:
             download_pdf(f'https://dergipark.org.tr{download_link}', f'pdf/{journal_code}_{issue_number}_{article_no}.pdf')
@@ -93,49 +96,52 @@ def download_article(journal_code, issue_number, article_no):
             with open(f'metadata/{journal_code}_{issue_number}_{article_no}.json', 'w', encoding='utf-8') as f:
                 json.dump(article_data, f)
 
-        return article_data
+        return article_data, bool(download_link)
 
     else:
         logging.error(f'Failed to retrieve article {journal_code} {issue_number} {article_no}')
-        return {}
+        return {}, False
 
 
 def retrieve_articles(journal_code, issue_number):
     """
     Retrieves the list of articles for a given journal and issue.
+    The request is conditional on the previous visit, and nothing is returned if the page did not change.
 
     Args:
     - journal_code (str): The code of the journal.
     - issue_number (str): The issue number.
 
     Returns:
-    - article_list (list): A list of article links for the specified journal and issue.
+    - article_list (list): A list of article links for the specified journal and issue, or None if the page could not be retrieved.
     """
 
     url = f'https://dergipark.org.tr/en/pub/{journal_code}/issue/{issue_number}'
     retries = 5
     
     while retries > 0:
-        response = get_url(url)
+        response = get_url(url, frontier.conditional_headers(url))
         
+        if response.status_code == 304:
+            frontier.record_page(url, response.headers, None)
+            return []
+
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            article_elements = soup.find_all('a', href=lambda href: href and f'{journal_code}/issue/{issue_number}' in href)
-    
-            article_list = [element['href'] for element in article_elements]
-            return article_list
+            article_list = parse_article_list(response.content, journal_code, issue_number)
+            return article_list if frontier.record_page(url, response.headers, article_list) else []
     
         else:
             logging.error(f'Failed to retrieve articles from journal {journal_code} {issue_number}. Retries left: {retries}')
             retries -= 1
             time.sleep(30)
     
-    return []
+    return None
 
 
 def get_issues(journal_code):
     """
     Retrieves the list of issues for a given journal.
+    The request is conditional on the previous visit, and nothing is returned if the page did not change.
 
     Args:
     - journal_code (str): The code of the journal.
@@ -148,14 +154,15 @@ def get_issues(journal_code):
     retries = 5
     
     while retries > 0:
-        response = get_url(url)
+        response = get_url(url, frontier.conditional_headers(url))
         
+        if response.status_code == 304:
+            frontier.record_page(url, response.headers, None)
+            return []
+
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            issue_elements = soup.find_all('a', href=lambda href: href and f'dergipark.org.tr/en/pub/{journal_code}/issue/' in href)
-    
-            issue_list = [element['href'] for element in issue_elements]
-            return issue_list
+            issue_list = parse_issue_list(response.content, journal_code)
+            return issue_list if frontier.record_page(url, response.headers, issue_list) else []
     
         else:
             logging.error(f'Failed to retrieve journal issues {journal_code}. Retries left: {retries}')
@@ -180,22 +187,22 @@ def get_journal_list(page_no):
     response = get_url(url)
     
     if response.status_code == 200:
-        soup = BeautifulSoup(response.content, 'html.parser')
-        journal_elements = soup.find_all('a', href=lambda href: href and 'https://dergipark.org.tr/en/pub/' in href)
-
-        journal_list = [element['href'] for element in journal_elements]
-        return journal_list
+        return parse_journal_list(response.content)
 
     else:
         logging.error(f'Failed to retrieve page {page_no}')
         return []
 
 
-# Retrieve the list of journals and save it to a CSV file
-all_journals = []
-for page in [''] + [f'/{i}' for i in range(2, 83)]:
-    all_journals.extend(get_journal_list(page))
-pd.DataFrame(list(set(all_journals))).to_csv('journals.csv', index=False)
+# Retrieve the list of journals and save it to a CSV file, at most once every JOURNAL_REFRESH_DAYS
+search_url = 'https://dergipark.org.tr/en/search?aggs%5BmandatoryLang%5D%5B11%5D=tr&section=journal&q='
+if not frontier.visited_within(search_url, JOURNAL_REFRESH_DAYS) or not Path('journals.csv').is_file():
+    all_journals = []
+    for page in [''] + [f'/{i}' for i in range(2, 83)]:
+        all_journals.extend(get_journal_list(page))
+    pd.DataFrame(list(set(all_journals))).to_csv('journals.csv', index=False)
+    frontier.add_journals(set(all_journals))
+    frontier.record_page(search_url, {}, all_journals)
 
 # Load the journal list from the CSV file
 df = pd.read_csv('journals.csv', header=None, names=['journals'])
@@ -207,21 +214,30 @@ path_pdf = Path('pdf')
 for journal_link in all_journals:
     journal_code = journal_link.split('/')[-1].strip()
     issue_list = get_issues(journal_code)
+    frontier.add_issues(journal_code, [issue_link.split('/')[-1].strip() for issue_link in issue_list])
+    frontier.visit_journal(journal_code)
 
-    for issue_link in issue_list:
-        issue_number = issue_link.split('/')[-1].strip()
+    # New issues, unfinished issues and the newest issue of the journal
+    for issue_number in frontier.pending_issues(journal_code):
         article_list = retrieve_articles(journal_code, issue_number)
+        # The issue is left unvisited, so that it is retried on the next run
+        if article_list is None:
+            continue
+        frontier.add_articles(journal_code, issue_number, [article_link.split('/')[-1].strip() for article_link in article_list])
 
-        for article_link in article_list:
-            article_no = article_link.split('/')[-1].strip()
+        for article_no in frontier.pending_articles(journal_code, issue_number):
             meta_file = path_meta / f'{journal_code}_{issue_number}_{article_no}.json' 
             pdf_file = path_pdf / f'{journal_code}_{issue_number}_{article_no}.pdf'
             
-            if meta_file.is_file() and pdf_file.is_file():
+            if meta_file.is_file() and is_valid_pdf(pdf_file):
+                frontier.complete_article(journal_code, issue_number, article_no)
                 continue
             
             try: 
-                download_article(journal_code, issue_number, article_no)
+                article_data, has_pdf = download_article(journal_code, issue_number, article_no)
+                if article_data and (not has_pdf or is_valid_pdf(pdf_file)):
+                    frontier.complete_article(journal_code, issue_number, article_no)
             except requests.ConnectionError:
                 time.sleep(30)
 
+        frontier.visit_issue(journal_code, issue_number)
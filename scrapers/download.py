@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PDF_MAGIC = b'%PDF-'
+CHUNK_SIZE = 1 << 16
+CHECKSUMS_NAME = 'checksums.tsv'
+
+checksum_lock = threading.Lock()
+content_range_pattern = re.compile(r'bytes (\d+)-\d+/(\d+)')
+
+
+def is_valid_pdf(path, check_eof=True):
+    """
+    Checks that a file starts with the PDF magic bytes and, if `check_eof` is set, has an end-of-file
+    marker near its end, which catches PDFs truncated by interrupted downloads of earlier runs.
+    """
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(PDF_MAGIC)) != PDF_MAGIC:
+                return False
+            if not check_eof:
+                return True
+            f.seek(max(0, os.path.getsize(path) - 2048))
+            return b'%%EOF' in f.read()
+    except OSError:
+        return False
+
+
+def prepare(destination_path):
+    """Returns the temporary `.part` path of a download and the number of bytes already in it."""
+    part_path = Path(f'{destination_path}.part')
+    return part_path, part_path.stat().st_size if part_path.is_file() else 0
+
+
+def resume_offset(status, headers, offset):
+    """
+    Decides where the body of a (possibly ranged) response starts in the `.part` file.
+
+    Returns:
+    - (start, expected): The offset to write from and the expected total size (None if unknown), or None if
+      the response holds another range than the one requested.
+    """
+    length = headers.get('Content-Length')
+    if status == 206:
+        match = content_range_pattern.match(headers.get('Content-Range', ''))
+        if match and int(match.group(1)) == offset:
+            return offset, int(match.group(2))
+        return None
+    # The server ignored the Range header, start over
+    return 0, int(length) if length and 'Content-Encoding' not in headers else None
+
+
+def restart(part_path, headers):
+    """Removes a `.part` file whose download has to start over, because the server sent another range."""
+    logger.error(f'Unexpected Content-Range {headers.get("Content-Range")!r} for {part_path}, starting over')
+    part_path.unlink(missing_ok=True)
+    return None
+
+
+def finish(part_path, destination_path, expected, expect_pdf):
+    """
+    Verifies a completed `.part` file, moves it into place atomically and records its SHA-256 checksum.
+
+    Returns:
+    - ok (bool): True if the file was verified and moved into place.
+    """
+    size = part_path.stat().st_size
+    if expected is not None and size != expected:
+        logger.error(f'Incomplete download of {destination_path}: {size} of {expected} bytes')
+        return False
+    # The end-of-file marker is only needed to detect truncation when the length is unknown
+    if expect_pdf and not is_valid_pdf(part_path, check_eof=expected is None):
+        logger.error(f'Downloaded file for {destination_path} is not a PDF')
+        part_path.unlink()
+        return False
+
+    sha256 = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    os.replace(part_path, destination_path)
+
+    with checksum_lock, open(Path(destination_path).parent / CHECKSUMS_NAME, 'a', encoding='utf-8') as f:
+        f.write(f'{sha256.hexdigest()}\t{size}\t{Path(destination_path).name}\n')
+    return True
+
+
+def save_response(response, destination_path, offset, expect_pdf=True):
+    """
+    Streams the body of a `requests` response (sent with `stream=True`) into the `.part` file and finishes the download.
+
+    Args:
+    - response (requests.Response): A 200 or 206 response.
+    - destination_path (str or Path): The final path of the file.
+    - offset (int): The number of bytes already in the `.part` file when the request was sent.
+    - expect_pdf (bool): Reject files that are not PDFs.
+
+    Returns:
+    - ok (bool): True if the file was downloaded and verified, None if the response holds another range than the
+      one requested; the `.part` file is removed then, so that the download starts over.
+    """
+
+    part_path, _ = prepare(destination_path)
+    resumed = resume_offset(response.status_code, response.headers, offset)
+    if resumed is None:
+        return restart(part_path, response.headers)
+    start, expected = resumed
+    with open(part_path, 'r+b' if start else 'wb') as f:
+        f.seek(start)
+        for chunk in response.iter_content(CHUNK_SIZE):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    return finish(part_path, destination_path, expected, expect_pdf)
+
+
+async def save_response_async(response, destination_path, offset, expect_pdf=True):
+    """The aiohttp counterpart of `save_response`."""
+
+    part_path, _ = prepare(destination_path)
+    resumed = resume_offset(response.status, response.headers, offset)
+    if resumed is None:
+        return restart(part_path, response.headers)
+    start, expected = resumed
+    with open(part_path, 'r+b' if start else 'wb') as f:
+        f.seek(start)
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    return finish(part_path, destination_path, expected, expect_pdf)
+
+
+def download_file(session, url, destination_path, expect_pdf=True, timeout=60):
+    """
+    Streams a file to `destination_path` through a temporary `.part` file.
+
+    An interrupted download is resumed with a Range request when the server supports it. The result is
+    checked against the announced length and, for PDFs, the magic bytes and end-of-file marker, then
+    renamed into place atomically, so `destination_path` only ever holds complete files. The SHA-256 of
+    every stored file is appended to `checksums.tsv` in the destination directory.
+
+    Args:
+    - session (requests.Session): The session to send the request with.
+    - url (str): The URL of the file.
+    - destination_path (str or Path): The final path of the file.
+    - expect_pdf (bool): Reject files that are not PDFs.
+    - timeout (int): The connect and read timeout in seconds.
+
+    Returns:
+    - ok (bool): True if the file was downloaded and verified.
+    """
+
+    part_path, offset = prepare(destination_path)
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416:
+            # The partial file is not a prefix of the current file, start over
+            part_path.unlink()
+            return download_file(session, url, destination_path, expect_pdf, timeout)
+        if response.status_code not in (200, 206):
+            logger.error(f'Failed to download {url}. Response: {response}')
+            return False
+        saved = save_response(response, destination_path, offset, expect_pdf)
+    if saved is None and offset:
+        # The server answered with another range, start over without one
+        return download_file(session, url, destination_path, expect_pdf, timeout)
+    return bool(saved)
@@ -0,0 +1,126 @@
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class CrawlFrontier:
+    """
+    A persistent record of the Dergipark journals, issues and articles seen by earlier crawls.
+
+    Listing pages (search, archive and issue pages) are stored with their validators (ETag and
+    Last-Modified) and a hash of the links they contain, so a recrawl can send conditional requests and
+    tell whether a page changed. Issues and articles are marked complete once everything under them was
+    downloaded, so later crawls only visit what is new, changed or unfinished.
+
+    Args:
+    - path (str): The path to the SQLite database.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, links_hash TEXT, last_visited TEXT, last_changed TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS journals (journal_code TEXT PRIMARY KEY, link TEXT, first_seen TEXT, last_visited TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS issues (journal_code TEXT, issue_number TEXT, first_seen TEXT, last_visited TEXT, complete INTEGER DEFAULT 0, '
+                                    'PRIMARY KEY (journal_code, issue_number))')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS articles (journal_code TEXT, issue_number TEXT, article_no TEXT, first_seen TEXT, last_visited TEXT, complete INTEGER DEFAULT 0, '
+                                    'PRIMARY KEY (journal_code, issue_number, article_no))')
+
+    def conditional_headers(self, url):
+        """Returns the If-None-Match / If-Modified-Since headers for a page visited before."""
+        row = self.connection.execute('SELECT etag, last_modified FROM pages WHERE url = ?', (url,)).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers['If-None-Match'] = row[0]
+        if row and row[1]:
+            headers['If-Modified-Since'] = row[1]
+        return headers
+
+    def record_page(self, url, headers, links):
+        """
+        Records a visit to a listing page.
+
+        Args:
+        - url (str): The page URL.
+        - headers (Mapping): The response headers.
+        - links (list): The links parsed from the page, or None if the server answered 304 Not Modified.
+
+        Returns:
+        - changed (bool): True if the page is new or its links differ from the previous visit.
+        """
+
+        row = self.connection.execute('SELECT links_hash FROM pages WHERE url = ?', (url,)).fetchone()
+        visited = now()
+        with self.connection:
+            if links is None:
+                self.connection.execute('UPDATE pages SET last_visited = ? WHERE url = ?', (visited, url))
+                return row is None
+            links_hash = hashlib.sha1('\n'.join(sorted(links)).encode('utf-8')).hexdigest()
+            changed = row is None or row[0] != links_hash
+            self.connection.execute('INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET '
+                                    'etag = excluded.etag, last_modified = excluded.last_modified, links_hash = excluded.links_hash, '
+                                    'last_visited = excluded.last_visited, last_changed = CASE WHEN ? THEN excluded.last_changed ELSE last_changed END',
+                                    (url, headers.get('ETag'), headers.get('Last-Modified'), links_hash, visited, visited, changed))
+            return changed
+
+    def visited_within(self, url, days):
+        """Returns True if `url` was visited in the last `days` days."""
+        row = self.connection.execute('SELECT last_visited FROM pages WHERE url = ?', (url,)).fetchone()
+        return bool(row and row[0] and datetime.fromisoformat(row[0]) > datetime.now(timezone.utc) - timedelta(days=days))
+
+    def add_journals(self, links):
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO journals VALUES (?, ?, ?, NULL)',
+                                        [(link.split('/')[-1].strip(), link, now()) for link in links])
+
+    def journal_links(self):
+        return [row[0] for row in self.connection.execute('SELECT link FROM journals ORDER BY journal_code')]
+
+    def visit_journal(self, journal_code):
+        with self.connection:
+            self.connection.execute('UPDATE journals SET last_visited = ? WHERE journal_code = ?', (now(), journal_code))
+
+    def add_issues(self, journal_code, issue_numbers):
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO issues (journal_code, issue_number, first_seen) VALUES (?, ?, ?)',
+                                        [(journal_code, issue_number, now()) for issue_number in issue_numbers])
+
+    def pending_issues(self, journal_code):
+        """
+        Returns the issues of a journal that still need a visit: incomplete ones and the newest issue,
+        which may still be receiving articles.
+        """
+        rows = self.connection.execute('SELECT issue_number, complete FROM issues WHERE journal_code = ?', (journal_code,)).fetchall()
+        if not rows:
+            return []
+        newest = max(rows, key=lambda row: (len(row[0]), row[0]))[0]
+        return [issue_number for issue_number, complete in rows if not complete or issue_number == newest]
+
+    def add_articles(self, journal_code, issue_number, article_nos):
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO articles (journal_code, issue_number, article_no, first_seen) VALUES (?, ?, ?, ?)',
+                                        [(journal_code, issue_number, article_no, now()) for article_no in article_nos])
+
+    def pending_articles(self, journal_code, issue_number):
+        return [row[0] for row in self.connection.execute('SELECT article_no FROM articles WHERE journal_code = ? AND issue_number = ? AND NOT complete',
+                                                          (journal_code, issue_number))]
+
+    def complete_article(self, journal_code, issue_number, article_no):
+        with self.connection:
+            self.connection.execute('UPDATE articles SET complete = 1, last_visited = ? WHERE journal_code = ? AND issue_number = ? AND article_no = ?',
+                                    (now(), journal_code, issue_number, article_no))
+
+    def visit_issue(self, journal_code, issue_number):
+        """Updates the visit time of an issue and marks it complete if all of its articles are."""
+        with self.connection:
+            self.connection.execute('UPDATE issues SET last_visited = ?, complete = NOT EXISTS (SELECT 1 FROM articles a WHERE a.journal_code = issues.journal_code '
+                                    'AND a.issue_number = issues.issue_number AND NOT a.complete) WHERE journal_code = ? AND issue_number = ?',
+                                    (now(), journal_code, issue_number))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def probe_time():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class MetadataStore:
+    """
+    An append-only SQLite store for thesis metadata, committed once per thesis.
+
+    Besides the metadata itself, every probed TezNo is recorded with its outcome so that reruns can skip
+    IDs that were already found to be empty. The store runs in WAL mode with full synchronization, so a
+    crash, even a power loss, loses at most the thesis that was being written.
+
+    Args:
+    - path (str): The path to the SQLite database.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            # NORMAL would not sync the WAL on every commit, and a power loss could take the last theses with it
+            self.connection.execute('PRAGMA synchronous=FULL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS theses (thesis_id INTEGER PRIMARY KEY, metadata TEXT NOT NULL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS probes (thesis_id INTEGER PRIMARY KEY, status TEXT NOT NULL, probed_at TEXT NOT NULL)')
+
+    def _probe(self, thesis_id, status):
+        self.connection.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?)', (thesis_id, status, probe_time()))
+
+    def put(self, thesis_id, metadata):
+        """Stores the metadata of a thesis."""
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO theses VALUES (?, ?)', (thesis_id, json.dumps(metadata, ensure_ascii=False)))
+            self._probe(thesis_id, 'found')
+
+    def mark(self, thesis_id, status):
+        """Records a probed ID without metadata, e.g. 'empty' when the search returned no thesis."""
+        with self.lock, self.connection:
+            self._probe(thesis_id, status)
+
+    def probed_ids(self, start_id, end_id):
+        """Returns a dict mapping every probed ID in [start_id, end_id] to its status."""
+        with self.lock:
+            rows = self.connection.execute('SELECT thesis_id, status FROM probes WHERE thesis_id BETWEEN ? AND ?', (start_id, end_id))
+            return dict(rows.fetchall())
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM theses').fetchone()[0]
+
+    def import_json(self, path):
+        """Loads an existing `md.json` into the store in a single transaction."""
+        with open(path, 'r') as f:
+            md_d = json.load(f)
+        probed_at = probe_time()
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO theses VALUES (?, ?)',
+                                        ((int(thesis_id), json.dumps(metadata, ensure_ascii=False)) for thesis_id, metadata in md_d.items()))
+            self.connection.executemany("INSERT OR REPLACE INTO probes VALUES (?, 'found', ?)", ((int(thesis_id), probed_at) for thesis_id in md_d))
+        logger.info(f'Imported {len(md_d)} records from {path}')
+
+    def export_json(self, path):
+        """Writes the store in the `md.json` format: a dict from TezNo strings to metadata dicts."""
+        with self.lock:
+            rows = self.connection.execute('SELECT thesis_id, metadata FROM theses ORDER BY thesis_id').fetchall()
+        with open(path, 'w') as f:
+            json.dump({str(thesis_id): json.loads(metadata) for thesis_id, metadata in rows}, f, ensure_ascii=False, indent=4)
+        logger.info(f'Exported {len(rows)} records to {path}')
+
+    def close(self):
+        self.connection.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Imports or exports the thesis metadata store.')
+    arg_parser.add_argument('-d', '--database', type=str, help='The path to the metadata store.', default='md.sqlite')
+    arg_parser.add_argument('-e', '--export', type=str, help='Write the store to this md.json file.')
+    arg_parser.add_argument('-i', '--import_json', type=str, help='Load this md.json file into the store.')
+    args = arg_parser.parse_args()
+
+    store = MetadataStore(args.database)
+    if args.import_json:
+        store.import_json(args.import_json)
+    if args.export:
+        store.export_json(args.export)
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import html
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    import lxml  # noqa: F401
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# Elements inside `#article_tr` whose text is stored as article metadata
+classes = ['article-title', 'article-authors', 'article-abstract', 'article-keywords']
+
+# Only the parts of a page that the parsers below look at are turned into a tree
+link_strainer = SoupStrainer('a', href=True)
+article_strainer = SoupStrainer(id='article_tr')
+thesis_strainer = SoupStrainer('td', valign='top')
+
+download_link_pattern = re.compile(r'''<a\s[^>]*?href\s*=\s*["']?([^"'\s>]*download/article-file/[^"'\s>]*)''', re.IGNORECASE)
+
+
+def make_soup(content, parse_only):
+    """Parses only the elements matched by `parse_only`, with lxml if it is installed."""
+    return BeautifulSoup(content, PARSER, parse_only=parse_only)
+
+
+def parse_journal_list(content):
+    """
+    Extracts journal links from a Dergipark search results page.
+
+    Args:
+    - content (bytes or str): The HTML of the search results page.
+
+    Returns:
+    - journal_list (list): A list of journal links.
+    """
+
+    soup = make_soup(content, link_strainer)
+    journal_elements = soup.find_all('a', href=lambda href: href and 'https://dergipark.org.tr/en/pub/' in href)
+    return [element['href'] for element in journal_elements]
+
+
+def parse_issue_list(content, journal_code):
+    """
+    Extracts the unique issue links from a journal's archive page.
+
+    Args:
+    - content (bytes or str): The HTML of the archive page.
+    - journal_code (str): The code of the journal.
+
+    Returns:
+    - issue_list (list): A list of issue links for the journal.
+    """
+
+    soup = make_soup(content, link_strainer)
+    issue_elements = soup.find_all('a', href=lambda href: href and f'dergipark.org.tr/en/pub/{journal_code}/issue/' in href)
+    return list(dict.fromkeys(element['href'] for element in issue_elements))
+
+
+def parse_article_list(content, journal_code, issue_number):
+    """
+    Extracts the unique article links from an issue page, ignoring links to the issue itself.
+
+    Args:
+    - content (bytes or str): The HTML of the issue page.
+    - journal_code (str): The code of the journal.
+    - issue_number (str): The issue number.
+
+    Returns:
+    - article_list (list): A list of article links for the issue.
+    """
+
+    soup = make_soup(content, link_strainer)
+    article_pattern = re.compile(f'{re.escape(journal_code)}/issue/{re.escape(issue_number)}/[^/?#]+$')
+    article_elements = soup.find_all('a', href=lambda href: href and article_pattern.search(href))
+    return list(dict.fromkeys(element['href'] for element in article_elements))
+
+
+def parse_article(content):
+    """
+    Extracts the metadata and the PDF download link from an article page.
+
+    Args:
+    - content (bytes or str): The HTML of the article page.
+
+    Returns:
+    - article_data (dict or None): The article metadata, or None if the `#article_tr` element is missing.
+    - download_link (str): The relative PDF download link, or an empty string if there is none.
+    """
+
+    soup = make_soup(content, article_strainer)
+    article_tr = soup.find(id='article_tr')
+
+    if article_tr is None:
+        return None, ''
+
+    article_data = {}
+
+    for class_name in classes:
+        element_value = article_tr.find(class_=class_name)
+        article_data[class_name] = element_value.text.strip() if element_value else ''
+
+    # The download button is outside `#article_tr`, so it is looked up in the raw markup
+    text = content.decode('utf-8', 'replace') if isinstance(content, bytes) else content
+    match = download_link_pattern.search(text)
+    download_link = html.unescape(match.group(1)) if match else ''
+
+    return article_data, download_link
+
+
+def parse_thesis_detail(text):
+    """
+    Extracts thesis metadata from a YÖK Tez `tezDetay.jsp` page.
+
+    Args:
+    - text (str): The HTML of the detail page.
+
+    Returns:
+    - d_t (dict or None): The thesis metadata, or None if the page does not have the expected four `td[valign=top]` cells.
+    """
+
+    soup = make_soup(text, thesis_strainer)
+    md_l = soup.find_all('td', {'valign': 'top'})
+    if len(md_l) != 4:
+        return None
+
+    d_t = {}
+    kunye = md_l[2]
+    for i, child in enumerate(kunye.children):
+        child_str = str(child).strip()
+        if i == 0:
+            d_t['title'] = child_str
+        elif i == 2:
+            d_t['author'] = child_str.split(':')[1].strip()
+        elif i == 4:
+            d_t['advisor'] = child_str.split(':')[1].strip()
+        elif i == 6:
+            d_t['university'] = child_str.split(':')[1].strip()
+        elif i == 8:
+            d_t['topic'] = child_str.split(':')[1].strip()
+        elif i == 10:
+            d_t['index'] = child_str.split(':')[1].strip()
+    status = md_l[3]
+    for i, child in enumerate(status.children):
+        child_str = str(child).strip()
+        if i == 2:
+            d_t['type'] = child_str
+        elif i == 6:
+            d_t['year'] = child_str
+        elif i == 8:
+            d_t['page_count'] = child_str
+    return d_t
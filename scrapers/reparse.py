@@ -0,0 +1,101 @@
+import argparse
+import json
+import logging
+import os
+import re
+import zlib
+from collections import defaultdict
+from multiprocessing import Pool
+from pathlib import Path
+
+from archive import read_index, parse_record
+from parsers import parse_article, parse_thesis_detail
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+dergipark_article_pattern = re.compile(r'/pub/([^/]+)/issue/([^/]+)/([^/?#]+)$')
+tez_detay_pattern = re.compile(r'tezDetay\.jsp\?id=(.+)$')
+
+
+def extract_metadata(uri, body):
+    """
+    Runs the metadata extraction that matches the page type of `uri`.
+
+    Returns:
+    - (key, metadata): The document key and its metadata, or None if the page is not a metadata page.
+    """
+
+    match = dergipark_article_pattern.search(uri)
+    if match:
+        article_data, _ = parse_article(body)
+        return ('_'.join(match.groups()), article_data) if article_data is not None else None
+
+    match = tez_detay_pattern.search(uri)
+    if match:
+        d_t = parse_thesis_detail(body.decode('utf-8', errors='replace'))
+        return (match.group(1), d_t) if d_t is not None else None
+
+    return None
+
+
+def reparse_file(archive_path, entries):
+    """
+    Re-extracts metadata from the given records of one archive file.
+
+    Args:
+    - archive_path (Path): The archive file.
+    - entries (list): (uri, offset, length, date) tuples of the records to parse.
+
+    Returns:
+    - results (list): A list of dicts with the uri, date, key and metadata of each parsed page.
+    """
+
+    results = []
+    with open(archive_path, 'rb') as f:
+        for uri, offset, length, date in entries:
+            try:
+                f.seek(offset)
+                status, _, body = parse_record(zlib.decompress(f.read(length), wbits=31))
+                extracted = extract_metadata(uri, body) if status == 200 else None
+                if extracted:
+                    key, metadata = extracted
+                    results.append({'uri': uri, 'date': date, 'key': key, 'metadata': metadata})
+            except Exception as e:
+                logger.error(f'Error while parsing {uri} in {archive_path}: {e}')
+    logger.info(f'Parsed {len(entries)} records from {archive_path}')
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Re-extracts scraper metadata from response archives in parallel.')
+    arg_parser.add_argument('-a', '--archive', type=str, help='The archive directory.', required=True)
+    arg_parser.add_argument('-o', '--output', type=str, help='The output JSONL file.', required=True)
+    arg_parser.add_argument('-n', '--num_threads', type=int, help='The number of processes to use.', default=os.cpu_count())
+    arg_parser.add_argument('-c', '--chunk_size', type=int, help='The number of records parsed per task.', default=1000)
+    args = arg_parser.parse_args()
+
+    archive_dir = Path(args.archive)
+    by_file = defaultdict(list)
+    for uri, file, offset, length, status, date in read_index(archive_dir):
+        by_file[file].append((uri, offset, length, date))
+
+    tasks = [(archive_dir / file, entries[i:i + args.chunk_size])
+             for file, entries in sorted(by_file.items())
+             for i in range(0, len(entries), args.chunk_size)]
+
+    # Later fetches of the same page overwrite earlier ones
+    latest = {}
+    with Pool(args.num_threads) as pool:
+        for results in pool.starmap(reparse_file, tasks):
+            for result in results:
+                latest[result['key']] = result
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for result in latest.values():
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+    logger.info(f'Wrote metadata of {len(latest)} documents to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
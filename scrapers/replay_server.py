@@ -0,0 +1,251 @@
+import argparse
+import logging
+import math
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import quote, urlsplit, parse_qs
+
+from throttle import TokenBucket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The statuses `dergipark.get_url` retries
+ERROR_STATUSES = (500, 502, 503, 504)
+
+
+def page_filename(path):
+    """
+    Maps a request path (including its query string) onto the flat file name used for recorded pages.
+
+    Args:
+    - path (str): The request path, e.g. '/en/pub/abc/issue/12'.
+
+    Returns:
+    - filename (str): The percent-encoded file name.
+    """
+
+    return quote(path.lstrip('/'), safe='') or 'index'
+
+
+class Simulation:
+    """
+    The latency, server errors and rate limit a replay server adds to its answers, and the counts of what it answered.
+
+    Args:
+    - latency (float): The delay of every answer in milliseconds.
+    - jitter (float): A random extra delay of up to this many milliseconds.
+    - error_rate (float): The share of requests answered with one of `error_statuses`.
+    - error_statuses (tuple): The statuses of the injected errors.
+    - rate_limit (float): Requests per second above which the server answers 429 with a Retry-After header, 0 disables it.
+    - burst (int): The number of requests that may arrive back to back under the rate limit.
+    - seed (int): The seed of the injected errors and jitter, for repeatable runs.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_statuses=ERROR_STATUSES, rate_limit=0.0, burst=1, seed=None):
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.bucket = TokenBucket(rate_limit, burst) if rate_limit > 0 else None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears the counts, e.g. between two benchmark runs."""
+        with self.lock:
+            self.counts = {'requests': 0, 'ok': 0, 'bytes': 0, 'errors': 0, 'limited': 0, 'not_found': 0}
+
+    def count(self, key, value=1):
+        with self.lock:
+            self.counts[key] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def draw(self):
+        """Returns the delay of an answer in seconds and the injected error status, or None."""
+        with self.lock:
+            delay = self.latency + self.random.random() * self.jitter
+            status = self.random.choice(self.error_statuses) if self.random.random() < self.error_rate else None
+        return delay, status
+
+
+class SimulatingHandler(BaseHTTPRequestHandler):
+    """The common part of the handlers: applies `server.simulation` before a request is answered and counts the answers."""
+
+    def simulate(self):
+        """Delays the answer and answers an injected error or 429; returns True if the request was answered."""
+        simulation = self.server.simulation
+        simulation.count('requests')
+        delay, status = simulation.draw()
+        if delay:
+            time.sleep(delay)
+
+        wait = simulation.bucket.try_acquire() if simulation.bucket else 0
+        if wait:
+            simulation.count('limited')
+            self.send_response(429)
+            self.send_header('Retry-After', str(math.ceil(wait)))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return True
+        if status:
+            simulation.count('errors')
+            self.send_error(status)
+            return True
+        return False
+
+    def send_body(self, body, content_type, head=False):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.server.simulation.count('ok')
+        if not head:
+            self.wfile.write(body)
+            self.server.simulation.count('bytes', len(body))
+
+    def send_not_found(self):
+        self.server.simulation.count('not_found')
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class ReplayHandler(SimulatingHandler):
+    """Serves recorded pages from `server.root`, answering 404 for anything that was not recorded."""
+
+    def do_GET(self, head=False):
+        if self.simulate():
+            return
+        page = self.server.root / page_filename(self.path)
+
+        if not page.is_file():
+            self.send_not_found()
+            return
+
+        body = page.read_bytes()
+        self.send_body(body, 'application/pdf' if body.startswith(b'%PDF') else 'text/html; charset=utf-8', head)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+
+class YokTezMockHandler(SimulatingHandler):
+    """
+    Mimics the SearchTez, tezDetay and TezGoster endpoints of the National Thesis Center.
+
+    Every TezNo exists except multiples of `server.empty_every`, which return an empty search result.
+    Detail pages are served from `server.root/{TezNo}.html` when recorded, and synthesized otherwise.
+    """
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+        if self.simulate():
+            return
+        thesis_id = int(form['TezNo'][0])
+        if urlsplit(self.path).path != '/UlusalTezMerkezi/SearchTez':
+            self.send_not_found()
+        elif thesis_id % self.server.empty_every == 0:
+            self.send_body(b'<html><body>No results</body></html>', 'text/html; charset=utf-8')
+        else:
+            self.send_body(f"<html><body><span onclick=tezDetay('T{thesis_id}','x')>{thesis_id}</span></body></html>".encode('utf-8'),
+                           'text/html; charset=utf-8')
+
+    def do_GET(self):
+        if self.simulate():
+            return
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+
+        if parts.path == '/UlusalTezMerkezi/tezDetay.jsp':
+            thesis_id = query['id'][0][1:]
+            recorded = self.server.root / f'{thesis_id}.html' if self.server.root else None
+            if recorded and recorded.is_file():
+                body = recorded.read_bytes()
+            else:
+                body = (f'<html><body><table><tr>'
+                        f'<td valign="top">{thesis_id}</td><td valign="top"></td>'
+                        f'<td valign="top">Tez {thesis_id}<br/>Yazar:Yazar {thesis_id}<br/>Danışman: Danışman<br/>'
+                        f'Yer Bilgisi: Üniversite<br/>Konu:Konu<br/>Dizin:Dizin</td>'
+                        f'<td valign="top">Onaylandı<br/>Doktora<br/>Türkçe<br/>2010<br/>120</td>'
+                        f'</tr></table><a href="TezGoster?key=K{thesis_id}">PDF</a></body></html>').encode('utf-8')
+            self.send_body(body, 'text/html; charset=utf-8')
+        elif parts.path == '/UlusalTezMerkezi/TezGoster':
+            self.send_body(b'%PDF-1.4\n' + query['key'][0].encode('ascii') * self.server.pdf_repeat + b'\n%%EOF\n', 'application/pdf')
+        else:
+            self.send_not_found()
+
+
+def make_server(root, host='127.0.0.1', port=0, handler=ReplayHandler, empty_every=10, simulation=None, pdf_repeat=1000):
+    """
+    Creates a replay server.
+
+    Args:
+    - root (str or Path): The directory containing the recorded pages.
+    - host (str): The interface to bind to.
+    - port (int): The port to bind to, 0 picks a free port.
+    - handler (class): `ReplayHandler` for recorded pages or `YokTezMockHandler` for the thesis endpoints.
+    - empty_every (int): For the thesis mock, every TezNo divisible by this returns an empty search result.
+    - simulation (Simulation): The latency, errors and rate limit to simulate, none by default.
+    - pdf_repeat (int): For the thesis mock, the size of the synthesized PDFs in repetitions of their key.
+
+    Returns:
+    - server (ThreadingHTTPServer): The server; its base URL is `f'http://{host}:{server.server_port}'`.
+    """
+
+    server = ThreadingHTTPServer((host, port), handler)
+    server.root = Path(root) if root else None
+    server.empty_every = empty_every
+    server.simulation = simulation or Simulation()
+    server.pdf_repeat = pdf_repeat
+    return server
+
+
+def serve(root, host='127.0.0.1', port=0, handler=ReplayHandler, empty_every=10, simulation=None, pdf_repeat=1000):
+    """Starts a replay server in a background thread; the arguments are those of `make_server`."""
+
+    server = make_server(root, host, port, handler, empty_every, simulation, pdf_repeat)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_simulation_arguments(arg_parser):
+    arg_parser.add_argument('--latency', type=float, help='The delay of every answer in milliseconds.', default=0)
+    arg_parser.add_argument('--jitter', type=float, help='A random extra delay of up to this many milliseconds.', default=0)
+    arg_parser.add_argument('--error_rate', type=float, help='The share of requests answered with a server error.', default=0)
+    arg_parser.add_argument('--error_statuses', type=int, nargs='+', help='The statuses of the server errors.', default=list(ERROR_STATUSES))
+    arg_parser.add_argument('--rate_limit', type=float, help='Answer 429 above this many requests per second, 0 disables it.', default=0)
+    arg_parser.add_argument('--burst', type=int, help='The number of requests that may arrive back to back under the rate limit.', default=1)
+    arg_parser.add_argument('--seed', type=int, help='The seed of the injected errors and jitter.')
+
+
+def simulation_from_args(args):
+    return Simulation(args.latency, args.jitter, args.error_rate, args.error_statuses, args.rate_limit, args.burst, args.seed)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Serves recorded pages locally so that the scrapers can be run without hitting the live sites.')
+    arg_parser.add_argument('-d', '--directory', type=str, help='The directory containing the recorded pages, optional with --yoktez.')
+    arg_parser.add_argument('-p', '--port', type=int, help='The port to listen on.', default=8000)
+    arg_parser.add_argument('-y', '--yoktez', action='store_true', help='Mock the National Thesis Center endpoints instead of replaying pages.')
+    add_simulation_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    if not args.directory and not args.yoktez:
+        arg_parser.error('-d/--directory is required unless --yoktez is given')
+
+    server = make_server(args.directory, port=args.port, handler=YokTezMockHandler if args.yoktez else ReplayHandler,
+                         simulation=simulation_from_args(args))
+    logger.info(f'Serving {server.root or "the thesis mock"} on http://127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
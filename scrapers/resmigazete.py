@@ -1,6 +1,26 @@
-import time 
+import time
 import requests
+import argparse
+import logging
+import sqlite3
+import threading
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
+from download import download_file, is_valid_pdf
+from parsers import make_soup, link_strainer
+from throttle import TokenBucket
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The date-pattern archive starts in June 2000
+FIRST_DATE = date(2000, 6, 1)
+# Only these statuses mark a date as missing; any other failure leaves it to be retried by the next run
+MISSING_STATUSES = {404, 410}
+
+
 def download_files_with_id_pattern(start_id, end_id):
     """
     Downloads files from the URL pattern "https://www.resmigazete.gov.tr/arsiv/{ID}.pdf" where ID is between start_id and end_id.
@@ -12,26 +32,241 @@ def download_files_with_id_pattern(start_id, end_id):
     Returns:
     None
     """
+    session = requests.Session()
     for ID in range(start_id, end_id + 1):
-        if Path(f"pdf/{ID}.pdf").is_file():
+        if is_valid_pdf(f"pdf/{ID}.pdf"):
             continue
         time.sleep(5)
         url = f"https://www.resmigazete.gov.tr/arsiv/{ID}.pdf"
         try:
-            response = requests.get(url)
-        
-            if response.status_code == 200:
-                with open(f"pdf/{ID}.pdf", "wb") as file:
-                    file.write(response.content)
+            if download_file(session, url, f"pdf/{ID}.pdf"):
                 print(f"File {ID}.pdf downloaded successfully.")
             else:
-                print(f"Failed to download file {ID}.pdf. Response: {response}")
+                print(f"Failed to download file {ID}.pdf.")
         except:
-            print('Failed to download file {ID}.pdf')
+            print(f'Failed to download file {ID}.pdf')
+
+
+class DateStore:
+    """
+    The outcome of every probed date of the archive, e.g. 'exists' or 'missing', in a SQLite table keyed by the ISO date.
+
+    Args:
+    - path (str): The path to the SQLite database.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS dates (day TEXT PRIMARY KEY, status TEXT NOT NULL, checked_at TEXT NOT NULL)')
+            # Earlier runs kept the dates as YYYYMMDD numbers in the tables of the thesis metadata store
+            if self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'probes'").fetchone():
+                rows = self.connection.execute('SELECT thesis_id, status, probed_at FROM probes').fetchall()
+                self.connection.executemany('INSERT OR IGNORE INTO dates VALUES (?, ?, ?)',
+                                            [(datetime.strptime(str(key), '%Y%m%d').date().isoformat(), status, checked_at) for key, status, checked_at in rows])
+                self.connection.execute('DROP TABLE probes')
+                self.connection.execute('DROP TABLE IF EXISTS theses')
+
+    def mark(self, day, status):
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO dates VALUES (?, ?, ?)',
+                                    (day.isoformat(), status, datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+    def statuses(self, start_date, end_date):
+        """Returns a dict mapping every probed date between start_date and end_date to its status."""
+        with self.lock:
+            rows = self.connection.execute('SELECT day, status FROM dates WHERE day BETWEEN ? AND ?', (start_date.isoformat(), end_date.isoformat()))
+            return {date.fromisoformat(day): status for day, status in rows.fetchall()}
+
+    def close(self):
+        self.connection.close()
+
+
+def calendar_dates(start_date, end_date):
+    """
+    Yields every real calendar date between start_date and end_date (inclusive) that the archive can contain.
+
+    Args:
+    - start_date (date): The first date.
+    - end_date (date): The last date.
+    """
+    day = max(start_date, FIRST_DATE)
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+class GazetteFetcher:
+    """
+    Fetches the daily Resmi Gazete PDFs and HTML pages concurrently under a global request-rate budget.
+
+    Only real calendar dates are requested. Each date is probed with a HEAD request before its body is
+    downloaded, and the outcome is recorded in `pdf/dates.sqlite` and `htm/dates.sqlite` so that dates
+    already downloaded or known to be missing are skipped on later runs. The annex pages linked from a
+    day's HTML page are fetched concurrently.
+
+    Args:
+    - base_url (str): The site root.
+    - num_workers (int): The number of dates processed at once; annex pages use twice as many threads.
+    - rate (float): The maximum number of requests per second across all threads.
+    """
+
+    def __init__(self, base_url='https://resmigazete.gov.tr', num_workers=4, rate=2.0):
+        self.base_url = base_url.rstrip('/')
+        self.num_workers = num_workers
+        self.bucket = TokenBucket(rate, burst=num_workers)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=num_workers * 3)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, url):
+        self.bucket.acquire()
+        return self.session.request(method, url, timeout=30)
+
+    def probe(self, url):
+        """Returns the status code of `url`, without downloading its body where the server supports HEAD."""
+        response = self.request('HEAD', url)
+        if response.status_code == 405:
+            response = self.request('GET', url)
+        return response.status_code
+
+    def probed(self, day, name, status, store):
+        """Returns True if the probed file exists; records the date as missing only if the server says so."""
+        if status == 200:
+            return True
+        if status in MISSING_STATUSES:
+            store.mark(day, 'missing')
+        else:
+            logger.error(f'Failed to probe file {name}: status {status}, it will be retried on the next run.')
+        return False
+
+    def fetch_pdf(self, day, store):
+        date_str = day.strftime('%Y%m%d')
+        url = f'{self.base_url}/eskiler/{day.year}/{day.month:02d}/{date_str}.pdf'
+        try:
+            if not self.probed(day, f'{date_str}.pdf', self.probe(url), store):
+                return
+            self.bucket.acquire()
+            if download_file(self.session, url, f'pdf/{date_str}.pdf'):
+                store.mark(day, 'exists')
+                logger.info(f'File {date_str}.pdf downloaded successfully.')
+            else:
+                logger.error(f'Failed to download file {date_str}.pdf.')
+        except requests.RequestException as e:
+            logger.error(f'Failed to download file {date_str}.pdf: {e}')
+
+    def fetch_annex(self, day, link):
+        url = f'{self.base_url}/eskiler/{day.year}/{day.month:02d}/{link}'
+        path = Path(f"htm/{day.strftime('%Y%m%d')}/{link.split('/')[-1]}")
+        if path.is_file():
+            return True
+        try:
+            response = self.request('GET', url)
+            if response.status_code == 200:
+                path.write_bytes(response.content)
+                logger.info(f'File {link} downloaded successfully.')
+                return True
+            logger.error(f'Failed to download file {url}. Response: {response}')
+        except requests.RequestException as e:
+            logger.error(f'Failed to download file {url}: {e}')
+        return False
+
+    def fetch_html(self, day, store, annex_pool):
+        date_str = day.strftime('%Y%m%d')
+        url = f'{self.base_url}/eskiler/{day.year}/{day.month:02d}/{date_str}.htm'
+        try:
+            if not self.probed(day, f'{date_str}.htm', self.probe(url), store):
+                return
+            response = self.request('GET', url)
+            if response.status_code != 200:
+                logger.error(f'Failed to download file {date_str}. Response: {response}')
+                return
+        except requests.RequestException as e:
+            logger.error(f'Failed to download file {date_str}: {e}')
+            return
+
+        Path(f'htm/{date_str}/').mkdir(exist_ok=True, parents=True)
+        with open(f'htm/{date_str}/{date_str}.htm', 'wb') as file:
+            file.write(response.content)
+        logger.info(f'File {date_str} downloaded successfully.')
+
+        soup = make_soup(response.content, link_strainer)
+        links = set(link.get('href') for link in soup.find_all('a'))
+        links = [link for link in links if link and not link.startswith('#')]
+        results = [future.result() for future in [annex_pool.submit(self.fetch_annex, day, link) for link in links]]
+        # Only mark the day as complete when every annex page was saved, so failed ones are retried
+        if all(results):
+            store.mark(day, 'exists')
+
+    def run(self, start_date, end_date, pdf=True, html=True, retry_missing=False):
+        """
+        Fetches the PDFs and/or HTML pages of every date between start_date and end_date.
+
+        Args:
+        - start_date (date): The first date.
+        - end_date (date): The last date.
+        - pdf (bool): Fetch the PDF of each date.
+        - html (bool): Fetch the HTML page of each date together with its annex pages.
+        - retry_missing (bool): Probe dates again that earlier runs found missing.
+        """
+
+        self.fetch_dates(list(calendar_dates(start_date, end_date)), pdf, html, retry_missing)
+
+    def fetch_dates(self, days, pdf=True, html=True, retry_missing=False):
+        """Fetches the PDFs and/or HTML pages of the given dates, see `run`."""
+        if not days:
+            return
+        Path('pdf').mkdir(exist_ok=True)
+        Path('htm').mkdir(exist_ok=True)
+        skip = {'exists', 'missing'} if not retry_missing else {'exists'}
+
+        pdf_store = DateStore('pdf/dates.sqlite') if pdf else None
+        htm_store = DateStore('htm/dates.sqlite') if html else None
+        try:
+            with ThreadPoolExecutor(self.num_workers) as day_pool, ThreadPoolExecutor(self.num_workers * 2) as annex_pool:
+                futures = []
+                if pdf_store:
+                    known = pdf_store.statuses(min(days), max(days))
+                    for day in days:
+                        if known.get(day) in skip or is_valid_pdf(f"pdf/{day.strftime('%Y%m%d')}.pdf"):
+                            continue
+                        futures.append(day_pool.submit(self.fetch_pdf, day, pdf_store))
+                if htm_store:
+                    known = htm_store.statuses(min(days), max(days))
+                    for day in days:
+                        if known.get(day) in skip:
+                            continue
+                        futures.append(day_pool.submit(self.fetch_html, day, htm_store, annex_pool))
+                logger.info(f'{len(futures)} dates will be fetched')
+                wait(futures)
+                for future in futures:
+                    if future.exception():
+                        logger.error(f'Unexpected error: {future.exception()!r}')
+        finally:
+            for store in (pdf_store, htm_store):
+                if store:
+                    store.close()
+
+
+def pattern_dates(start_year, end_year, start_month, end_month, start_day, end_day):
+    """
+    Returns the real calendar dates of every year, month and day in the given ranges, e.g. the 1st to the 5th of
+    January and February of every year for start_month=1, end_month=2, start_day=1, end_day=5.
+    """
+    return [date(year, month, day)
+            for year in range(start_year, end_year + 1)
+            for month in range(start_month, end_month + 1)
+            for day in range(start_day, min(end_day, monthrange(year, month)[1]) + 1)
+            if date(year, month, day) >= FIRST_DATE]
+
 
 def download_pdf_files_with_date_pattern(start_year, end_year, start_month, end_month, start_day, end_day):
     """
     Downloads files from the URL pattern "https://resmigazete.gov.tr/eskiler/YYYY/MM/YYYYMMDD.pdf".
+    The dates are every combination of the year, month and day ranges, see `pattern_dates`.
 
     Args:
     - start_year (int): The starting year.
@@ -44,32 +279,13 @@ def download_pdf_files_with_date_pattern(start_year, end_year, start_month, end_
     Returns:
     None
     """
-    for year in range(start_year, end_year + 1):
-        for month in range(start_month, end_month + 1):
-            for day in range(start_day, end_day + 1):
-                date = f"{year:04d}{month:02d}{day:02d}"
-                if Path(f"pdf/{date}.pdf").is_file():
-                    continue
-                if year == 2000 and month < 6: 
-                    continue
-                url = f"https://resmigazete.gov.tr/eskiler/{year}/{month:02d}/{date}.pdf"
-                time.sleep(3)
-                try:
-                    response = requests.get(url)
-                
-                    if response.status_code == 200:
-                        with open(f"pdf/{date}.pdf", "wb") as file:
-                            file.write(response.content)
-                        print(f"File {date}.pdf downloaded successfully.")
-                    else:
-                        print(f"Failed to download file {date}.pdf. Response: {response}")
-                except:
-                    print('Failed to download file {date}.pdf')
+    GazetteFetcher().fetch_dates(pattern_dates(start_year, end_year, start_month, end_month, start_day, end_day), html=False)
 
 
 def download_html_files_with_date_pattern(start_year, end_year, start_month, end_month, start_day, end_day):
     """
     Downloads files from the URL pattern "https://resmigazete.gov.tr/eskiler/YYYY/MM/YYYYMMDD.htm"
+    The dates are every combination of the year, month and day ranges, see `pattern_dates`.
 
     Args:
     - start_year (int): The starting year.
@@ -82,63 +298,26 @@ def download_html_files_with_date_pattern(start_year, end_year, start_month, end
     Returns:
     None
     """
-    for year in range(start_year, end_year + 1):
-        for month in range(start_month, end_month + 1):
-            for day in range(start_day, end_day + 1):
-                date = f"{year:04d}{month:02d}{day:02d}"
-                base_url = f"https://resmigazete.gov.tr/eskiler/{year}/{month:02d}/{date}.htm"
-                time.sleep(1)
-                try:
-                #if 1: 
-                    response = requests.get(base_url)
-                    if response.status_code == 200:
-                        Path(f"htm/{date}/").mkdir(exist_ok=True, parents=True)
-                        with open(f"htm/{date}/{date}.htm", "wb") as file:
-                            file.write(response.content)
-                            print(f"File {date} downloaded successfully.")
-
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        links = soup.find_all('a')
-                        for link in links: 
-                            url = link.get('href')
-                            print(url)
-                            if url is None or url.startswith('#'):
-                                continue
-                            #elif not url.split('/')[-1].startswith(date): 
-                            #    continue
-                            time.sleep(1)
-                            #if 1: 
-                            try:
-                                #if date not in url: 
-                                #    url = f'{base_url.replace(".htm", "")}{url}'
-                                print(f"https://resmigazete.gov.tr/eskiler/{year}/{month:02d}/{url}")
-                                response = requests.get(f"https://resmigazete.gov.tr/eskiler/{year}/{month:02d}/{url}")
-                                if response.status_code == 200:
-                                     with open(f"htm/{date}/{url.split('/')[-1]}", "wb") as file:
-                                        file.write(response.content)
-                                        print(f"File {url} downloaded successfully.")
-                                else: 
-                                    print(response.status_code)
-                            except: 
-                                print(f'Failed to dowload file {url}')
-                    else:
-                        print(f"Failed to download file {date}. Response: {response}")
-                except:
-                    print(f'Failed to download file {date}')
-
-# Download files with ID pattern
-start_id = 1054
-end_id = 24095
-download_files_with_id_pattern(start_id, end_id)
-
-# Download files with date pattern
-start_year = 2000
-end_year = 2023
-start_month = 1
-end_month = 12
-start_day = 1
-end_day = 31
-
-download_pdf_files_with_date_pattern(start_year, end_year, start_month, end_month, start_day, end_day)
-
-download_html_files_with_date_pattern(start_year, end_year, start_month, end_month, start_day, end_day)
\ No newline at end of file
+    GazetteFetcher().fetch_dates(pattern_dates(start_year, end_year, start_month, end_month, start_day, end_day), pdf=False)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Downloads Resmi Gazete issues.')
+    arg_parser.add_argument('--start_date', type=date.fromisoformat, help='The first date, e.g. 2000-01-01.', default=date(2000, 1, 1))
+    arg_parser.add_argument('--end_date', type=date.fromisoformat, help='The last date, e.g. 2023-12-31.', default=date(2023, 12, 31))
+    arg_parser.add_argument('-n', '--num_workers', type=int, help='The number of dates fetched at once.', default=4)
+    arg_parser.add_argument('-r', '--rate', type=float, help='The maximum number of requests per second.', default=2.0)
+    arg_parser.add_argument('--skip_ids', action='store_true', help='Skip the ID-pattern archive.')
+    arg_parser.add_argument('--retry_missing', action='store_true', help='Probe dates again that earlier runs found missing.')
+    args = arg_parser.parse_args()
+
+    # Download files with ID pattern
+    if not args.skip_ids:
+        download_files_with_id_pattern(1054, 24095)
+
+    # Download files with date pattern
+    GazetteFetcher(num_workers=args.num_workers, rate=args.rate).run(args.start_date, args.end_date, retry_missing=args.retry_missing)
+
+
+if __name__ == '__main__':
+    main()
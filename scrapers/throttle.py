@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket used to cap the request rate against a host.
+
+    Tokens are refilled continuously at `rate` tokens per second, up to `burst` tokens.
+    Each request consumes one token; `acquire` blocks until a token is available.
+
+    Args:
+    - rate (float): The sustained number of requests per second.
+    - burst (int): The maximum number of requests that may be sent back to back.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """Consumes a token if one is available and returns 0, else returns the seconds until the next token."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class AsyncTokenBucket(TokenBucket):
+    """
+    The asyncio counterpart of `TokenBucket`. Waiting coroutines sleep instead of blocking the event loop.
+    """
+
+    async def acquire(self):
+        """Waits until a token is available and consumes it."""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
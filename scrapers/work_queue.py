@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+
+
+class WorkQueue:
+    """
+    A persistent queue of ID-range chunks stored in SQLite.
+
+    Chunks move from 'pending' to 'running' when claimed and to 'done' when completed, or to 'retry' when
+    released with IDs that failed. Chunks that were left 'running' by a crashed run and released chunks are
+    put back to 'pending' on startup, so a restart resumes after the last completed chunk and retries the
+    failed ones. The chunk size is stored with the queue, and a later run over a larger range only
+    adds chunks for the IDs no chunk covers yet.
+
+    Args:
+    - path (str): The path to the SQLite database.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS chunks (start_id INTEGER PRIMARY KEY, end_id INTEGER NOT NULL, status TEXT NOT NULL)')
+            self.connection.execute("UPDATE chunks SET status = 'pending' WHERE status IN ('running', 'retry')")
+            self.connection.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def split(self, at):
+        """Splits the pending chunk that contains both `at - 1` and `at`, so that a chunk starts at `at`."""
+        row = self.connection.execute("SELECT start_id, end_id FROM chunks WHERE status = 'pending' AND start_id < ? AND end_id >= ?", (at, at)).fetchone()
+        if row:
+            self.connection.execute('UPDATE chunks SET end_id = ? WHERE start_id = ?', (at - 1, row[0]))
+            self.connection.execute("INSERT INTO chunks VALUES (?, ?, 'pending')", (at, row[1]))
+
+    def fill(self, start_id, end_id, chunk_size):
+        """
+        Adds chunks for the IDs in [start_id, end_id] that no chunk covers yet; existing chunks keep their status.
+
+        Pending chunks that cross the ends of the range are split there, so that the range is made of whole chunks.
+
+        Raises:
+        - ValueError: If the queue was filled with another chunk size.
+        """
+
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT value FROM settings WHERE key = 'chunk_size'").fetchone()
+            if row and row[0] != chunk_size:
+                raise ValueError(f'The work queue was filled with a chunk size of {row[0]}, not {chunk_size}; '
+                                 f'pass --chunk_size {row[0]} or remove the queue database')
+            self.connection.execute("INSERT OR IGNORE INTO settings VALUES ('chunk_size', ?)", (chunk_size,))
+
+            self.split(start_id)
+            self.split(end_id + 1)
+            chunks = []
+            next_id = start_id
+            covered = self.connection.execute('SELECT start_id, end_id FROM chunks WHERE end_id >= ? AND start_id <= ? ORDER BY start_id',
+                                              (start_id, end_id)).fetchall()
+            # The gaps between the existing chunks, e.g. the IDs after the old last chunk when the range grows
+            for chunk_start, chunk_end in covered + [(end_id + 1, end_id + 1)]:
+                for i in range(next_id, min(chunk_start, end_id + 1), chunk_size):
+                    chunks.append((i, min(i + chunk_size - 1, chunk_start - 1, end_id)))
+                next_id = max(next_id, chunk_end + 1)
+            self.connection.executemany("INSERT INTO chunks VALUES (?, ?, 'pending')", chunks)
+
+    def claim(self, start_id, end_id):
+        """Marks the lowest pending chunk inside [start_id, end_id] as running and returns its (start_id, end_id), or None if nothing is left."""
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT start_id, end_id FROM chunks WHERE status = 'pending' AND start_id >= ? AND end_id <= ? "
+                                          'ORDER BY start_id LIMIT 1', (start_id, end_id)).fetchone()
+            if row:
+                self.connection.execute("UPDATE chunks SET status = 'running' WHERE start_id = ?", (row[0],))
+            return row
+
+    def complete(self, start_id):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE chunks SET status = 'done' WHERE start_id = ?", (start_id,))
+
+    def release(self, start_id):
+        """Leaves a chunk that is not complete to the next run; this run does not claim it again."""
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE chunks SET status = 'retry' WHERE start_id = ?", (start_id,))
+
+    def progress(self, start_id, end_id):
+        """Returns the number of completed chunks and the total number of chunks inside [start_id, end_id]."""
+        with self.lock:
+            return self.connection.execute("SELECT SUM(status = 'done'), COUNT(*) FROM chunks WHERE start_id >= ? AND end_id <= ?",
+                                           (start_id, end_id)).fetchone()
+
+    def close(self):
+        self.connection.close()
@@ -2,14 +2,35 @@ import requests
 import re
 import logging
 import os
-import json
-from bs4 import BeautifulSoup
+import argparse
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from archive import ResponseArchive
+from download import download_file, is_valid_pdf
+from metadata_store import MetadataStore
+from parsers import parse_thesis_detail
+from throttle import TokenBucket
+from work_queue import WorkQueue
 
 THIS_DIR = os.path.dirname(os.path.abspath(__file__))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BASE_URL = 'https://tez.yok.gov.tr'
+# Connection errors, rate limits and server errors are retried with a backoff of 1, 2 and 4 seconds
+RETRY = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None)
+# The passes over the IDs of a chunk that failed, before the chunk is left to the next run
+CHUNK_PASSES = 2
+
+payload_str = 'uniad=&Universite=0&Tur=0&yil1=0&yil2=0&ensad=&Enstitu=0&izin=0&abdad=&ABD=0&Durum=3&TezAd=&bilim=&BilimDali=0&Dil=1&AdSoyad=&Konu=&EnstituGrubu=&DanismanAdSoyad=&Dizin=&Metin=&islem=2&Bolum=0&-find=++Bul++'
+payload_d = {i: j for i, j in [
+    i.split('=') for i in payload_str.split('&')]}
+
+id_pattern = re.compile('onclick=tezDetay\(\'(.*?)\',')
+pdf_pattern = re.compile('<a href="TezGoster\?key=(.*?)"')
+
 
 def get_l_from_br(text):
     while '  ' in text:
@@ -18,129 +39,120 @@ def get_l_from_br(text):
     return l
 
 
-def fetch_pdf_files(start_id=1, end_id=798285, get_pdfs=True, get_mds=True, get_sources=False):
-    """
-    Fetches PDF files from a website using a search and download process.
-
-    This function sends requests to a website, searches for PDF files, and downloads them
-    based on a given range of TezNo values.
-
-    Args:
-    - till (int): The upper limit (inclusive) of the TezNo range. Defaults to 798285.
-
-    Returns:
-    None
-    """
-
-    if get_pdfs:
-        pdf_dir = os.path.join(THIS_DIR, 'pdfs')
-        if not os.path.exists(pdf_dir):
-            os.makedirs(pdf_dir)
-    if get_mds:
-        md_path = os.path.join(THIS_DIR, 'md.json')
-        if not os.path.exists(md_path):
-            with open(md_path, 'w') as f:
-                json.dump({}, f, ensure_ascii=False, indent=4)
-        with open(md_path, 'r') as f:
-            md_d = json.load(f)
-    if get_sources:
-        source_dir = os.path.join(THIS_DIR, 'sources')
-        if not os.path.exists(source_dir):
-            os.makedirs(source_dir)
-
+def make_session():
     session = requests.Session()
     session.headers.update(
         {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'})
+    adapter = HTTPAdapter(max_retries=RETRY)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-    search_tez_url = 'https://tez.yok.gov.tr/UlusalTezMerkezi/SearchTez'
-    tez_detay_url = 'https://tez.yok.gov.tr/UlusalTezMerkezi/tezDetay.jsp?id={id_t}'
-    download_url = 'https://tez.yok.gov.tr/UlusalTezMerkezi/TezGoster?key={key_t}'
 
-    payload_str = 'uniad=&Universite=0&Tur=0&yil1=0&yil2=0&ensad=&Enstitu=0&izin=0&abdad=&ABD=0&Durum=3&TezAd=&bilim=&BilimDali=0&Dil=1&AdSoyad=&Konu=&EnstituGrubu=&DanismanAdSoyad=&Dizin=&Metin=&islem=2&Bolum=0&-find=++Bul++'
-    payload_d = {i: j for i, j in [
-        i.split('=') for i in payload_str.split('&')]}
+class ThesisFetcher:
+    """
+    Fetches the search result, detail page and PDF of single theses and stores the results.
 
-    id_pattern = re.compile('onclick=tezDetay\(\'(.*?)\',')
-    pdf_pattern = re.compile('<a href="TezGoster\?key=(.*?)"')
+    Args:
+    - get_pdfs (bool): Download the PDFs into `pdfs/`.
+    - get_mds (bool): Store the metadata in `md.sqlite`.
+    - get_sources (bool): Save the detail pages into `sources/`.
+    - archive_sources (bool): Append the search and detail pages to the response archive for reparse.py.
+    - base_url (str): The site root, e.g. a local mock server.
+    - bucket (TokenBucket): If given, every request waits for a token from this bucket.
+    """
 
-    for thesis_id in range(start_id, end_id + 1):
+    def __init__(self, get_pdfs=True, get_mds=True, get_sources=False, archive_sources=True, base_url=BASE_URL, bucket=None):
+        self.get_pdfs = get_pdfs
+        self.get_mds = get_mds
+        self.get_sources = get_sources
+        self.bucket = bucket
+
+        self.search_tez_url = f'{base_url}/UlusalTezMerkezi/SearchTez'
+        self.tez_detay_url = base_url + '/UlusalTezMerkezi/tezDetay.jsp?id={id_t}'
+        self.download_url = base_url + '/UlusalTezMerkezi/TezGoster?key={key_t}'
+
+        self.pdf_dir = os.path.join(THIS_DIR, 'pdfs')
+        if get_pdfs and not os.path.exists(self.pdf_dir):
+            os.makedirs(self.pdf_dir)
+        self.store = None
+        if get_mds:
+            md_path = os.path.join(THIS_DIR, 'md.json')
+            self.store = MetadataStore(os.path.join(THIS_DIR, 'md.sqlite'))
+            if len(self.store) == 0 and os.path.exists(md_path):
+                self.store.import_json(md_path)
+        self.source_dir = os.path.join(THIS_DIR, 'sources')
+        if get_sources and not os.path.exists(self.source_dir):
+            os.makedirs(self.source_dir)
+        self.archive = ResponseArchive(os.path.join(THIS_DIR, 'archive'), prefix='yoktez') if archive_sources else None
+
+    def request(self, method, session, url, **kwargs):
+        if self.bucket:
+            self.bucket.acquire()
+        response = session.request(method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def pending_ids(self, start_id, end_id):
+        """Returns the IDs in [start_id, end_id] that were not handled by an earlier run."""
+        probed = self.store.probed_ids(start_id, end_id) if self.get_mds else {}
+        return [thesis_id for thesis_id in range(start_id, end_id + 1)
+                if thesis_id not in probed
+                or (probed[thesis_id] not in ('empty', 'no_pdf') and self.get_pdfs and not is_valid_pdf(os.path.join(self.pdf_dir, f'{thesis_id}.pdf')))]
+
+    def fetch(self, session, thesis_id):
         form_data = payload_d.copy()
         form_data['TezNo'] = thesis_id
 
         try:
             # Send search request
-            search_tez_response = session.post(search_tez_url, data=form_data)
-            search_tez_response.raise_for_status()
+            search_tez_response = self.request('POST', session, self.search_tez_url, data=form_data)
+            if self.archive:
+                self.archive.write_response(search_tez_response)
 
             text = search_tez_response.text
 
             # Extract tezDetay id
             id_search = id_pattern.search(text)
+            if not id_search and self.get_mds:
+                self.store.mark(thesis_id, 'empty')
             if id_search:
                 id_t = id_search.group(1)
 
                 # Send tezDetay request
-                tez_detay_response = session.get(
-                    tez_detay_url.format(id_t=id_t))
-                tez_detay_response.raise_for_status()
+                tez_detay_response = self.request('GET', session, self.tez_detay_url.format(id_t=id_t))
+                if self.archive:
+                    self.archive.write_response(tez_detay_response)
 
                 text = tez_detay_response.text
 
-                if get_sources:
-                    with open(os.path.join(source_dir, f'{thesis_id}.html'), 'w', encoding='utf-8') as f:
+                if self.get_sources:
+                    with open(os.path.join(self.source_dir, f'{thesis_id}.html'), 'w', encoding='utf-8') as f:
                         f.write(text)
                         logger.info(f'{thesis_id}.html saved')
 
-                if get_mds:
-                    soup = BeautifulSoup(text, 'html.parser')
-                    md_l = soup.find_all('td', {'valign': 'top'})
-                    d_t = {}
-                    if len(md_l) == 4:
-                        kunye = md_l[2]
-                        for i, child in enumerate(kunye.children):
-                            child_str = str(child).strip()
-                            if i == 0:
-                                d_t['title'] = child_str
-                            elif i == 2:
-                                d_t['author'] = child_str.split(':')[1].strip()
-                            elif i == 4:
-                                d_t['advisor'] = child_str.split(':')[
-                                    1].strip()
-                            elif i == 6:
-                                d_t['university'] = child_str.split(':')[
-                                    1].strip()
-                            elif i == 8:
-                                d_t['topic'] = child_str.split(':')[1].strip()
-                            elif i == 10:
-                                d_t['index'] = child_str.split(':')[1].strip()
-                        status = md_l[3]
-                        for i, child in enumerate(status.children):
-                            child_str = str(child).strip()
-                            if i == 2:
-                                d_t['type'] = child_str
-                            elif i == 6:
-                                d_t['year'] = child_str
-                            elif i == 8:
-                                d_t['page_count'] = child_str
-                        md_d[str(thesis_id)] = d_t
-                        print(str(thesis_id), len(md_d))
-
-                if get_pdfs:
+                if self.get_mds:
+                    d_t = parse_thesis_detail(text)
+                    if d_t is not None:
+                        self.store.put(thesis_id, d_t)
+                        logger.info(f'{thesis_id} metadata saved')
+                    else:
+                        self.store.mark(thesis_id, 'no_metadata')
+
+                if self.get_pdfs:
                     # Extract PDF key
                     pdf_search = pdf_pattern.search(text)
                     if pdf_search:
                         key_t = pdf_search.group(1)
 
-                        # Send download request
-                        download_response = session.get(
-                            download_url.format(key_t=key_t))
-                        download_response.raise_for_status()
-
-                        # Save PDF file
-                        with open(os.path.join(pdf_dir, f'{thesis_id}.pdf'), 'wb') as f:
-                            f.write(download_response.content)
+                        # Stream the PDF file into place
+                        if self.bucket:
+                            self.bucket.acquire()
+                        if download_file(session, self.download_url.format(key_t=key_t), os.path.join(self.pdf_dir, f'{thesis_id}.pdf')):
                             logger.info(f'{thesis_id}.pdf saved')
-
+                    elif self.get_mds:
+                        # Theses without a TezGoster link are not requested again on later runs
+                        self.store.mark(thesis_id, 'no_pdf')
 
         except (requests.RequestException, IOError) as e:
             logger.error(
@@ -150,14 +162,114 @@ def fetch_pdf_files(start_id=1, end_id=798285, get_pdfs=True, get_mds=True, get_
             logger.error(
                 f'Unexpected error occurred while fetching PDF for TezNo {thesis_id}: {str(e)}')
 
-        if thesis_id % 10000 == 0:
-            with open(md_path, 'w') as f:
-                json.dump(md_d, f, ensure_ascii=False, indent=4)
+    def close(self):
+        if self.store:
+            self.store.close()
+        if self.archive:
+            self.archive.close()
+
 
+def fetch_pdf_files(start_id=1, end_id=798285, get_pdfs=True, get_mds=True, get_sources=False, archive_sources=True, base_url=BASE_URL):
+    """
+    Fetches PDF files from a website using a search and download process.
+
+    This function sends requests to a website, searches for PDF files, and downloads them
+    based on a given range of TezNo values.
+
+    Args:
+    - till (int): The upper limit (inclusive) of the TezNo range. Defaults to 798285.
+    - archive_sources (bool): Append the search and detail pages to the response archive for reparse.py.
+
+    Metadata is written to the `md.sqlite` store one thesis at a time, together with the outcome of every
+    probed TezNo, so reruns skip IDs that were already handled. Run `metadata_store.py --export md.json`
+    to produce the `md.json` file.
+
+    Returns:
+    None
+    """
+
+    fetcher = ThesisFetcher(get_pdfs, get_mds, get_sources, archive_sources, base_url)
+    session = make_session()
+
+    for thesis_id in fetcher.pending_ids(start_id, end_id):
+        fetcher.fetch(session, thesis_id)
+
+    fetcher.close()
+
+
+def fetch_pdf_files_parallel(start_id=1, end_id=798285, get_pdfs=True, get_mds=True, get_sources=False, archive_sources=True,
+                             base_url=BASE_URL, num_workers=4, chunk_size=1000, rate=2.0):
+    """
+    Fetches the same data as `fetch_pdf_files` with several workers that process ID-range chunks.
+
+    The chunks are kept in the persistent work queue `queue.sqlite`, so a restarted run continues after
+    the last completed chunk. Each worker thread has its own session, and all workers share one request
+    rate budget. A chunk is only completed when all of its IDs were handled; IDs that failed are tried
+    again, and a chunk that still has some after `CHUNK_PASSES` passes is left to the next run.
 
-    with open(md_path, 'w') as f:
-        json.dump(md_d, f, ensure_ascii=False, indent=4)
+    Args:
+    - num_workers (int): The number of worker threads.
+    - chunk_size (int): The number of TezNo values per chunk.
+    - rate (float): The maximum number of requests per second across all workers.
 
+    Returns:
+    None
+    """
 
-# Call the function to start fetching PDF files
-fetch_pdf_files(get_pdfs=False, get_mds=True, get_sources=False)
+    fetcher = ThesisFetcher(get_pdfs, get_mds, get_sources, archive_sources, base_url, TokenBucket(rate, burst=num_workers))
+    queue = WorkQueue(os.path.join(THIS_DIR, 'queue.sqlite'))
+    queue.fill(start_id, end_id, chunk_size)
+
+    def worker():
+        session = make_session()
+        while True:
+            chunk = queue.claim(start_id, end_id)
+            if chunk is None:
+                return
+            pending = fetcher.pending_ids(*chunk)
+            for _ in range(CHUNK_PASSES):
+                for thesis_id in pending:
+                    fetcher.fetch(session, thesis_id)
+                # Without the metadata store the outcome of an ID is not recorded
+                pending = fetcher.pending_ids(*chunk) if get_mds else []
+                if not pending:
+                    break
+            if pending:
+                queue.release(chunk[0])
+                logger.warning(f'Chunk {chunk[0]}-{chunk[1]} has {len(pending)} failed IDs, it will be retried on the next run')
+                continue
+            queue.complete(chunk[0])
+            done, total = queue.progress(start_id, end_id)
+            logger.info(f'Chunk {chunk[0]}-{chunk[1]} completed ({done}/{total})')
+
+    workers = [threading.Thread(target=worker) for _ in range(num_workers)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    queue.close()
+    fetcher.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Fetches thesis metadata and PDFs from the National Thesis Center.')
+    arg_parser.add_argument('--start_id', type=int, help='The first TezNo to fetch.', default=1)
+    arg_parser.add_argument('--end_id', type=int, help='The last TezNo to fetch.', default=798285)
+    arg_parser.add_argument('--pdfs', action='store_true', help='Download the PDFs.')
+    arg_parser.add_argument('--sources', action='store_true', help='Save the detail pages.')
+    arg_parser.add_argument('--base_url', type=str, help='The site root, e.g. a local mock server.', default=BASE_URL)
+    arg_parser.add_argument('-n', '--num_workers', type=int, help='The number of parallel workers, 0 runs sequentially.', default=0)
+    arg_parser.add_argument('-c', '--chunk_size', type=int, help='The number of TezNo values per work queue chunk.', default=1000)
+    arg_parser.add_argument('-r', '--rate', type=float, help='The maximum number of requests per second across all workers.', default=2.0)
+    args = arg_parser.parse_args()
+
+    if args.num_workers > 0:
+        fetch_pdf_files_parallel(args.start_id, args.end_id, get_pdfs=args.pdfs, get_mds=True, get_sources=args.sources,
+                                 base_url=args.base_url, num_workers=args.num_workers, chunk_size=args.chunk_size, rate=args.rate)
+    else:
+        fetch_pdf_files(args.start_id, args.end_id, get_pdfs=args.pdfs, get_mds=True, get_sources=args.sources, base_url=args.base_url)
+
+
+if __name__ == '__main__':
+    main()